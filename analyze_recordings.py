@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+import multiprocessing
+
+import cv2
+
+# Re-runs detection and zone rules over recorded video, e.g. after zones
+# or rules changed.
+#
+#   python analyze_recordings.py --video 'recordings/*.avi' --perimeters perimeters.json \
+#       --output events.jsonl --workers 8 --sample-fps 5
+#   python analyze_recordings.py --video gate.mp4 --camera 0 --start-time 2025-01-31T08:00:00 --db
+#
+# Videos are split into chunks that run in a process pool (one detector per
+# process). Frames are skipped with grab() (no decode) down to --sample-fps,
+# run through detect_batch() in batches, tracked with IoUTracker and
+# evaluated with the camera's compiled rules on video time. Each chunk
+# starts a little early (--overlap, default: longest dwell threshold) so
+# dwell timers are warm at its boundary.
+#
+# Finished chunks are checkpointed in --checkpoint-dir; rerunning the same
+# command skips them, so an interrupted job resumes where it stopped.
+# Events: one per (rule, track) when the rule first fires. With --db each
+# chunk is inserted once (marked with a .inserted file next to it).
+
+AI_SIZE = (640, 640)
+ZONE_SCALE = (3840 / 640, 2160 / 640) # AI input -> 4K zone coordinates
+RECORDING_NAME = re.compile(r"cam(?P<camera>[^_]+)_(?P<stamp>\d{8}_\d{6})")
+
+@dataclass
+class Chunk:
+    video: str
+    camera_id: str
+    start_frame: int
+    end_frame: int
+    warmup_frames: int
+    fps: float
+    start_time: str # ISO wall-clock time of frame 0
+
+    def key(self, fingerprint):
+        st = os.stat(self.video)
+        raw = f"{os.path.abspath(self.video)}|{st.st_size}|{st.st_mtime_ns}|{self.start_frame}|{self.end_frame}|{fingerprint}"
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def expand_videos(patterns):
+    videos = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        videos.extend(m for m in matches if os.path.isfile(m))
+    return videos
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    return fps, frames
+
+def recording_metadata(path, default_camera, start_time, fps, frames):
+    """Camera id and start time from recording_cam<ID>_<YYYYmmdd_HHMMSS> names, else the given/derived values."""
+    match = RECORDING_NAME.search(os.path.basename(path))
+    camera_id = default_camera or (match.group("camera") if match else "0")
+    if start_time is not None:
+        return camera_id, start_time
+    if match:
+        return camera_id, datetime.strptime(match.group("stamp"), "%Y%m%d_%H%M%S")
+    # Assume the file was closed when the recording ended
+    return camera_id, datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=frames / fps)
+
+def plan_chunks(videos, camera, start_time, chunk_seconds, overlap_seconds):
+    chunks = []
+    for video in videos:
+        fps, frames = video_info(video)
+        if frames <= 0:
+            print(f"Skipping {video}: no frames")
+            continue
+        camera_id, started = recording_metadata(video, camera, start_time, fps, frames)
+        step = max(1, int(chunk_seconds * fps))
+        warmup = int(overlap_seconds * fps)
+        for start in range(0, frames, step):
+            chunks.append(Chunk(video, camera_id, start, min(start + step, frames),
+                                min(warmup, start), fps, started.isoformat()))
+    return chunks
+
+# Worker process
+
+_detector = None
+_plans = {}
+
+def _init_worker(zone_config, threads):
+    global _detector, _plans
+    from app.rules import CameraPlan
+    from src.infrastructure.detectors import DetectorConfig, create_detector
+
+    cv2.setNumThreads(1)
+    config = DetectorConfig.from_env("DETECTOR_")
+    if not config.num_threads:
+        config.num_threads = threads
+    _detector = create_detector(config)
+    _plans = {camera_id: CameraPlan.compile(zones) for camera_id, zones in zone_config.items()}
+
+def analyze_chunk(chunk, sample_fps, batch_size, default_threshold):
+    from app.detections import centers, from_tracked
+    from app.dwell import DwellTracker
+    from app.rules import CameraPlan
+    from src.infrastructure.detectors import IoUTracker
+
+    plan = _plans.get(chunk.camera_id) or CameraPlan([])
+    tracker = IoUTracker()
+    dwell = DwellTracker(f"batch:{chunk.camera_id}")
+    started = datetime.fromisoformat(chunk.start_time)
+    stride = max(1, round(chunk.fps / sample_fps))
+    first = chunk.start_frame - chunk.warmup_frames
+
+    cap = cv2.VideoCapture(chunk.video)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    events = []
+    fired = set() # (rule, track_id) already reported
+    sampled = 0
+
+    def evaluate(batch):
+        results = _detector.detect_batch([frame for _, frame in batch])
+        for (index, _), detected in zip(batch, results):
+            video_time = index / chunk.fps
+            detections = from_tracked(tracker.update(detected), plan.classes)
+            dwell.expire(video_time)
+            if not len(detections):
+                continue
+            evaluation = plan.evaluate(detections, centers(detections, ZONE_SCALE), dwell,
+                                       now=video_time, moment=started + timedelta(seconds=video_time),
+                                       default_threshold=default_threshold)
+            for hit in evaluation.hits:
+                for track_id in hit.track_ids:
+                    if (hit.rule, track_id) in fired:
+                        continue
+                    fired.add((hit.rule, track_id))
+                    if index < chunk.start_frame:
+                        continue # Warmup: the previous chunk reports it
+                    row = detections[detections["id"] == track_id][0]
+                    events.append({
+                        "camera_id": chunk.camera_id,
+                        "video": chunk.video,
+                        "frame": index,
+                        "video_time": round(video_time, 3),
+                        "timestamp": (started + timedelta(seconds=video_time)).isoformat(),
+                        "rule": hit.rule,
+                        "action": hit.action,
+                        "track_id": track_id,
+                        "class": int(row["cls"]),
+                        "confidence": round(float(row["conf"]), 3),
+                        "duration": round(float(row["duration"]), 1),
+                    })
+
+    start = time.perf_counter()
+    batch = []
+    try:
+        for index in range(first, chunk.end_frame):
+            if (index - first) % stride:
+                # Skip without decoding
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            batch.append((index, cv2.resize(frame, AI_SIZE)))
+            sampled += 1
+            if len(batch) >= batch_size:
+                evaluate(batch)
+                batch = []
+        if batch:
+            evaluate(batch)
+    finally:
+        cap.release()
+
+    return {
+        "events": events,
+        "frames": chunk.end_frame - chunk.start_frame,
+        "sampled": sampled,
+        "seconds": time.perf_counter() - start,
+    }
+
+# Checkpoints and output
+
+def write_atomic(path, lines):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+    os.replace(tmp, path)
+
+def read_checkpoint(path):
+    with open(path) as f:
+        header = json.loads(f.readline())
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+def inserted_marker(path):
+    return path + ".inserted"
+
+async def insert_checkpoints(paths, batch_size=1000):
+    """
+    Bulk inserts the events of every finished chunk not inserted yet. Each
+    chunk is one transaction followed by a marker file, so reruns (resume,
+    retry of failed chunks) never insert a chunk twice.
+    """
+    from sqlalchemy import insert
+    from src.core.database import SessionLocal
+    from src.domain import models
+
+    total = 0
+    for path in paths:
+        if not os.path.exists(path) or os.path.exists(inserted_marker(path)):
+            continue
+        rows = [{
+            "camera_id": e["camera_id"],
+            "event_type": "perimeter",
+            "rule": e["rule"],
+            "track_id": e["track_id"],
+            "confidence": e["confidence"],
+            "timestamp": datetime.fromisoformat(e["timestamp"]).astimezone(),
+        } for e in read_checkpoint(path)[1]]
+        if rows:
+            async with SessionLocal() as db:
+                for i in range(0, len(rows), batch_size):
+                    await db.execute(insert(models.Event), rows[i:i + batch_size])
+                await db.commit()
+        write_atomic(inserted_marker(path), [json.dumps({"events": len(rows)})])
+        total += len(rows)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-run detection and zone rules over recorded video.')
+    parser.add_argument('--video', action='append', required=True, help='Video file, directory or glob (repeatable)')
+    parser.add_argument('--perimeters', default='perimeters.json', help='Zone/rule config to apply')
+    parser.add_argument('--camera', help='Camera id whose zones apply (default: from recording_cam<ID>_ names, else 0)')
+    parser.add_argument('--start-time', type=datetime.fromisoformat,
+                        help='Wall-clock time of the first frame, for schedules and timestamps')
+    parser.add_argument('--output', default='events.jsonl', help='Events as JSON lines')
+    parser.add_argument('--db', action='store_true', help='Also bulk insert events into the database')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--chunk-seconds', type=float, default=300, help='Video seconds per chunk')
+    parser.add_argument('--overlap', type=float, help='Seconds of warmup before each chunk (default: longest dwell threshold + 2)')
+    parser.add_argument('--sample-fps', type=float, default=5, help='Frames analyzed per video second')
+    parser.add_argument('--batch', type=int, default=8, help='Frames per detect_batch call')
+    parser.add_argument('--violation-threshold', type=float, default=0.0, help='Dwell threshold for rules without one')
+    parser.add_argument('--checkpoint-dir', default='.analysis', help='Per-chunk results for resuming')
+    args = parser.parse_args()
+
+    from app.rules import CameraPlan
+
+    with open(args.perimeters) as f:
+        zone_config = {str(k): v for k, v in json.load(f).items() if isinstance(v, dict)}
+
+    if args.overlap is None:
+        thresholds = [rule.threshold or args.violation_threshold
+                      for zones in zone_config.values()
+                      for rule in CameraPlan.compile(zones).rules if rule.type == "dwell"]
+        args.overlap = max(thresholds, default=0.0) + 2.0
+
+    videos = expand_videos(args.video)
+    if not videos:
+        parser.error("no video files found")
+    chunks = plan_chunks(videos, args.camera, args.start_time, args.chunk_seconds, args.overlap)
+
+    # Anything that changes results invalidates old checkpoints
+    fingerprint = hashlib.sha1(json.dumps([
+        zone_config, args.sample_fps, args.violation_threshold, args.overlap,
+        {k: v for k, v in os.environ.items() if k.startswith("DETECTOR_")},
+    ], sort_keys=True).encode()).hexdigest()
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    paths = [os.path.join(args.checkpoint_dir, f"{chunk.key(fingerprint)}.jsonl") for chunk in chunks]
+
+    todo = [(chunk, path) for chunk, path in zip(chunks, paths) if not os.path.exists(path)]
+    print(f"{len(videos)} video(s), {len(chunks)} chunk(s), {len(chunks) - len(todo)} already done, "
+          f"{args.workers} worker(s)")
+
+    start = time.perf_counter()
+    video_seconds = 0.0
+    if todo:
+        threads = max(1, (os.cpu_count() or 1) // args.workers)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(zone_config, threads)) as pool:
+            futures = {
+                pool.submit(analyze_chunk, chunk, args.sample_fps, args.batch, args.violation_threshold): (chunk, path)
+                for chunk, path in todo
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                chunk, path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"  chunk {chunk.video} [{chunk.start_frame}:{chunk.end_frame}] failed: {e!r}")
+                    continue
+                header = {"chunk": asdict(chunk), "frames": result["frames"], "sampled": result["sampled"]}
+                write_atomic(path, [json.dumps(header)] + [json.dumps(e) for e in result["events"]])
+                video_seconds += result["frames"] / chunk.fps
+                elapsed = time.perf_counter() - start
+                print(f"  [{done}/{len(todo)}] {os.path.basename(chunk.video)} "
+                      f"{chunk.start_frame / chunk.fps:.0f}-{chunk.end_frame / chunk.fps:.0f}s: "
+                      f"{len(result['events'])} event(s), {video_seconds / elapsed:.1f}x real time")
+
+    # Merge in video order
+    events = []
+    missing = 0
+    for path in paths:
+        if not os.path.exists(path):
+            missing += 1
+            continue
+        events.extend(read_checkpoint(path)[1])
+    write_atomic(args.output, [json.dumps(e) for e in events])
+    print(f"Wrote {len(events)} event(s) to {args.output}")
+
+    if args.db:
+        inserted = asyncio.run(insert_checkpoints(paths))
+        print(f"Inserted {inserted} new event(s) into the database")
+
+    if missing:
+        print(f"{missing} chunk(s) failed; rerun the same command to retry them")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
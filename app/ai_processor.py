@@ -2,144 +2,218 @@ import cv2
 import numpy as np
 import json
 import os
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
-from datetime import datetime
+import threading
+import time
 import logging
+from src.infrastructure.detectors import DetectorConfig, create_detector
+from .dwell import DwellTracker
+from .detections import from_tracked, centers
+from .perimeter_store import PerimeterStore
+from .rules import CameraPlan, Evaluation
+from .instrumentation import stage_timer
+
+EMPTY_PLAN = CameraPlan([])
 
 # Suppress Paddle logs
 logging.getLogger("ppocr").setLevel(logging.ERROR)
 
 class AIProcessor:
-    def __init__(self, perimeters_file='perimeters.json'):
-        print("Loading AI Models...")
-        self.model = YOLO('yolov8n.pt')
-        self.ocr = PaddleOCR(use_textline_orientation=True, lang='en')
-        self.perimeters = self.load_perimeters(perimeters_file)
-        self.violation_states = {} # {camera_id: {track_id: start_time}}
+    def __init__(self, perimeters_file='perimeters.json', startup=None, watch_perimeters=True):
+        # Models are loaded lazily (or warmed up in the background via
+        # load_detector) so the server and cameras can come up first.
+        # Heavy imports (torch, paddle) are deferred with them.
+        self.startup = startup
+        self._model = None
+        self._ocr = None
+        self._model_lock = threading.Lock()
+        self._ocr_lock = threading.Lock()
+        if startup is not None:
+            startup.register("detector")
+            startup.register("ocr", status="not_loaded")
+
+        # Compiled from the zone store; each dict is replaced, never mutated
+        self.plans = {} # {camera_id: CameraPlan}
+        self.perimeters = {} # {camera_id: {zone name: np.int32 points}} for drawing
+        self.zone_styles = {} # {camera_id: {zone name: (type, action)}}
+        self.last_hits = {} # {camera_id: [RuleHit]} from the last processed frame
+        self.store = PerimeterStore(perimeters_file, watch=watch_perimeters)
+        self.store.subscribe(self.apply_zones)
+        self.apply_zones(self.store.snapshot, set(self.store.snapshot))
+        self.dwell = {} # {camera_id: DwellTracker}
+        self._timers = {} # {camera_id: (inference, zones)} cached metric children
+
+    def _stage_timers(self, camera_key):
+        timers = self._timers.get(camera_key)
+        if timers is None:
+            timers = self._timers[camera_key] = (stage_timer(camera_key, "inference"), stage_timer(camera_key, "zones"))
+        return timers
+
+    def dwell_tracker(self, camera_key):
+        tracker = self.dwell.get(camera_key)
+        if tracker is None:
+            tracker = self.dwell[camera_key] = DwellTracker(camera_key)
+        return tracker
+
+    def tracking_state(self, camera_id):
+        """Track ids and dwell timers of a camera, for handing it to another node."""
+        camera_key = str(camera_id)
+        dwell = self.dwell.get(camera_key)
+        return {
+            "tracker": self._model.tracker_state(camera_key) if self._model is not None else None,
+            "dwell": dwell.state() if dwell is not None else [],
+        }
+
+    def restore_tracking(self, camera_id, state, gap=0.0):
+        """Continues tracking_state() output taken gap seconds ago. Loads the detector if needed."""
+        camera_key = str(camera_id)
+        if state.get("tracker") is not None:
+            self.model.restore_tracker(camera_key, state["tracker"])
+        self.dwell_tracker(camera_key).restore(state.get("dwell", []), gap)
+
+    def _load(self, name, loader):
+        if self.startup is None:
+            return loader()
+        with self.startup.stage(name):
+            return loader()
+
+    def load_detector(self):
+        """Loads YOLO if needed. Safe to call from several threads."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    def load():
+                        # Backend/weights/threads come from DETECTOR_* env vars
+                        config = DetectorConfig.from_env("DETECTOR_")
+                        print(f"Loading detector ({config.backend}: {config.weights})...")
+                        return create_detector(config)
+                    self._model = self._load("detector", load)
+        return self._model
+
+    def load_ocr(self):
+        """Loads PaddleOCR on first LPR use."""
+        if self._ocr is None:
+            with self._ocr_lock:
+                if self._ocr is None:
+                    def load():
+                        from paddleocr import PaddleOCR
+                        print("Loading PaddleOCR...")
+                        return PaddleOCR(use_textline_orientation=True, lang='en')
+                    self._ocr = self._load("ocr", load)
+        return self._ocr
+
+    @property
+    def detector_ready(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        return self.load_detector()
+
+    @property
+    def ocr(self):
+        return self.load_ocr()
         
-    def load_perimeters(self, filepath):
-        try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-            # Convert lists to numpy arrays for all cameras
-            processed_data = {}
-            for key, val in data.items():
-                if isinstance(val, dict): # Camera ID keys
-                    processed_data[key] = {}
-                    for zone_name, points in val.items():
-                        processed_data[key][zone_name] = np.array(points, dtype=np.int32)
-            return processed_data
-        except Exception as e:
-            print(f"Error loading perimeters: {e}")
-            return {}
+    @property
+    def zone_config(self):
+        """{camera_id: {zone name: points or rule dict}} as in perimeters.json (read-only snapshot)."""
+        return self.store.snapshot
+
+    def apply_zones(self, snapshot, changed):
+        """Recompiles the changed cameras and swaps in new lookup dicts (camera threads never see partial updates)."""
+        perimeters, styles, plans = dict(self.perimeters), dict(self.zone_styles), dict(self.plans)
+        for camera_key in changed:
+            zones = snapshot.get(camera_key)
+            if zones is None:
+                perimeters.pop(camera_key, None)
+                styles.pop(camera_key, None)
+                plans.pop(camera_key, None)
+                continue
+            plan = CameraPlan.compile(zones)
+            perimeters[camera_key] = {rule.name: rule.points.astype(np.int32) for rule in plan.rules}
+            styles[camera_key] = {rule.name: (rule.type, rule.action) for rule in plan.rules}
+            plans[camera_key] = plan
+        self.plans = plans
+        self.perimeters = perimeters
+        self.zone_styles = styles
+
+    def set_zones(self, camera_id, zones, persist=True):
+        """Replaces a camera's zone config; persist=False keeps it in memory only."""
+        self.store.set_camera(camera_id, zones, persist=persist)
             
     def update_perimeter(self, camera_id, zone_type, points_normalized):
         """
         Updates the perimeter for a specific camera and zone type.
         points_normalized: List of [x, y] where x, y are between 0 and 1.
+        Rule settings of an existing zone are kept. The file is written
+        in the background (see PerimeterStore).
         """
-        camera_key = str(camera_id)
-        if camera_key not in self.perimeters:
-            self.perimeters[camera_key] = {}
-            
         # Scale to 4K (3840x2160)
         width, height = 3840, 2160
         scaled_points = []
         for p in points_normalized:
             scaled_points.append([int(p[0] * width), int(p[1] * height)])
-            
-        np_points = np.array(scaled_points, dtype=np.int32)
-        self.perimeters[camera_key][zone_type] = np_points
-        
-        self.save_perimeters()
+
+        def update(spec):
+            if isinstance(spec, dict):
+                return dict(spec, points=scaled_points)
+            return scaled_points
+
+        self.store.update_zone(camera_id, zone_type, update)
         print(f"Updated {zone_type} for Camera {camera_id}. Points: {scaled_points}")
 
-    def save_perimeters(self, filepath='perimeters.json'):
-        # Convert numpy arrays back to lists for JSON serialization
-        data_to_save = {}
-        for cam_id, zones in self.perimeters.items():
-            data_to_save[cam_id] = {}
-            for zone_name, points in zones.items():
-                data_to_save[cam_id][zone_name] = points.tolist()
-        
-        try:
-            with open(filepath, 'w') as f:
-                json.dump(data_to_save, f, indent=4)
-        except Exception as e:
-            print(f"Error saving perimeters: {e}")
+    def save_perimeters(self):
+        """Writes pending zone edits now instead of after the debounce."""
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
 
     def is_inside(self, point, polygon):
         return cv2.pointPolygonTest(polygon, point, False) >= 0
 
-    def process_frame(self, frame, camera_id, check_recording=True, check_violation=True, violation_threshold=2.0):
+    def process_frame(self, frame, camera_id, check_recording=True, check_violation=True, violation_threshold=2.0,
+                      now=None, moment=None):
+        """
+        Tracks objects and applies the camera's zone rules. now is the
+        monotonic time for dwell/line state, moment the wall-clock datetime
+        for schedules; both default to the current time.
+        """
         camera_key = str(camera_id)
-        zones = self.perimeters.get(camera_key, {})
+        plan = self.plans.get(camera_key) or EMPTY_PLAN
         
-        recording_zone = zones.get("recording_zone") if check_recording else None
-        violation_zone = zones.get("violation_zone") if check_violation else None
+        enabled_actions = {"alert"}
+        if check_recording:
+            enabled_actions.add("record")
+        if check_violation:
+            enabled_actions.add("violation")
         
-        # YOLO Tracking
-        results = self.model.track(frame, persist=True, verbose=False)
+        t_inference, t_zones = self._stage_timers(camera_key)
+
+        # Object Tracking: rows of [x1, y1, x2, y2, track_id, conf, cls]
+        with t_inference.time():
+            tracked = self.model.track(frame, stream_id=camera_key)
+        zones_start = time.perf_counter()
+        if now is None:
+            now = time.monotonic()
+        dwell = self.dwell_tracker(camera_key)
         
-        detections = []
-        violation_alert = False
-        recording_trigger = False
+        # Filter to the classes any rule can use (vehicles/people by default)
+        detections = from_tracked(tracked, plan.classes)
+        evaluation = Evaluation()
         
-        if results[0].boxes.id is not None:
-            boxes = results[0].boxes.xywh.cpu()
-            track_ids = results[0].boxes.id.int().cpu().tolist()
-            classes = results[0].boxes.cls.int().cpu().tolist()
-            xyxy_boxes = results[0].boxes.xyxy.cpu()
-
-            for box, xyxy, track_id, cls in zip(boxes, xyxy_boxes, track_ids, classes):
-                # Filter vehicles/people
-                if cls not in [0, 1, 2, 3, 5, 7]:
-                    continue
-
-                x, y, w, h = box
-                # Scale center point from AI resolution (640x640) to Original resolution (3840x2160)
-                # This is necessary because zones are stored in 3840x2160 coordinates
-                scale_x = 3840 / 640
-                scale_y = 2160 / 640
-                center_point = (int(x * scale_x), int(y * scale_y))
-                
-                # Check Recording Zone
-                if recording_zone is not None and self.is_inside(center_point, recording_zone):
-                    recording_trigger = True
-                    # print(f"Object {track_id} inside Recording Zone")
-                
-                # Check Violation Zone
-                is_violation = False
-                duration = 0
-                if violation_zone is not None and self.is_inside(center_point, violation_zone):
-                    # print(f"Object {track_id} inside Violation Zone")
-                    # Track violation duration
-                    if camera_key not in self.violation_states:
-                        self.violation_states[camera_key] = {}
-                    
-                    if track_id not in self.violation_states[camera_key]:
-                        self.violation_states[camera_key][track_id] = datetime.now()
-                    
-                    duration = (datetime.now() - self.violation_states[camera_key][track_id]).total_seconds()
-                    
-                    if duration > violation_threshold:
-                        is_violation = True
-                        violation_alert = True
-                else:
-                    # Reset if leaves zone
-                    if camera_key in self.violation_states and track_id in self.violation_states[camera_key]:
-                        del self.violation_states[camera_key][track_id]
-
-                detections.append({
-                    "box": [int(c) for c in xyxy],
-                    "id": track_id,
-                    "class": cls,
-                    "violation": is_violation,
-                    "duration": duration
-                })
-
-        return detections, recording_trigger, violation_alert
+        if len(detections):
+            # Scale center points from AI resolution (640x640) to Original resolution (3840x2160)
+            # This is necessary because zones are stored in 3840x2160 coordinates
+            center_points = centers(detections, (3840 / 640, 2160 / 640))
+            evaluation = plan.evaluate(detections, center_points, dwell, now, moment,
+                                       enabled_actions, violation_threshold)
+        self.last_hits[camera_key] = evaluation.hits
+
+        # Forget tracks that vanished (inside a zone or not) so state stays bounded
+        dwell.expire(now)
+
+        t_zones.observe(time.perf_counter() - zones_start)
+        return detections, evaluation.recording_trigger, evaluation.violation_alert
 
     def perform_lpr(self, frame, box):
         x1, y1, x2, y2 = map(int, box)
@@ -4,36 +4,67 @@ import time
 import numpy as np
 from datetime import datetime
 from .ai_processor import AIProcessor
+from . import detections as dets
+from .streaming import RENDITIONS, FMP4Stream
+from .recorder import AudioCapture, ClipRecorder
+from src.infrastructure.video_sources import SourceConfig, VideoSource
+from .instrumentation import (FRAMES_CAPTURED, FRAMES_PROCESSED, FRAMES_DROPPED, CAPTURE_ERRORS,
+                              RECORDING, DETECTIONS, stage_timer)
+
+# BGR overlay colors per zone rule action
+ZONE_COLORS = {"record": (255, 0, 0), "violation": (0, 0, 255), "alert": (0, 255, 255)}
+
+# Cameras without an explicit source config are local devices asked for 4K MJPG
+DEFAULT_DEVICE_CONFIG = {"width": 3840, "height": 2160, "fps": 30, "fourcc": "MJPG"}
 
 class CameraStream:
-    def __init__(self, camera_id, ai_processor):
+    def __init__(self, camera_id, ai_processor, bus=None, startup=None, source=None):
         self.camera_id = camera_id
+        # Device index, RTSP/HTTP URL, file path or a dict/SourceConfig with
+        # resolution/fps requests (see src/infrastructure/video_sources.py)
+        if source is None:
+            source = dict(DEFAULT_DEVICE_CONFIG, source=camera_id)
+        audio = None
+        if isinstance(source, dict) and "audio" in source:
+            # "audio": true / device index or name / {"device": ..., "samplerate": ...}
+            source = dict(source)
+            audio = source.pop("audio")
+        self.source_config = SourceConfig.parse(source)
+        self.audio = AudioCapture.parse(audio)
+        self.source = None
         self.ai = ai_processor
+        self.bus = bus # Optional DetectionBus for live overlay updates
+        self.startup = startup
+        self.stage_name = f"camera:{camera_id}"
+        self.status = "opening" # opening, running, reconnecting, paused, failed, disconnected
         self.stopped = False
         self.frame = None
-        self.display_frame_base = None # Pre-resized frame for display
-        self.latest_detections = []
+        self.latest_detections = dets.EMPTY
         self.latest_zones = {}
+        self.latest_zone_styles = {} # {zone name: (type, action)}
         self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+        # Display renditions are made on demand, once per frame however many viewers
+        self._renditions = {} # {rendition: (frame_seq, image)}
+        self._jpegs = {} # {(rendition, quality, overlay): (frame_seq, detections_seq, bytes)}
+        self.detections_seq = 0
+        self.fmp4_streams = {} # {rendition: FMP4Stream}
+        self._streams_lock = threading.Lock()
         self.recording_lock = threading.Lock()
+        # Held around AI processing so tracking state can be exported consistently
+        self.state_lock = threading.Lock()
         
-        # Initialize Camera
-        self.cap = cv2.VideoCapture(camera_id, cv2.CAP_DSHOW)
-        # Request 4K
-        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 3840)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 2160)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
-        
-        if not self.cap.isOpened():
-            print(f"Error: Could not open camera {camera_id}")
-            self.stopped = True
+        # Source is opened by the capture thread: device negotiation blocks
+        # for seconds, and doing it here would serialize startup across cameras
+        if startup is not None:
+            startup.register(self.stage_name)
             
         # Recording State
         self.recording = False
         self.out = None
         self.last_recording_time = 0
         self.recording_cooldown = 3
+        self.resume_recording = False # Set when taking over a camera that was recording
         
         # Control Flags
         self.is_active = True
@@ -43,6 +74,20 @@ class CameraStream:
         self.check_recording_zone = True
         self.check_violation_zone = True
         self.violation_threshold = 0.0 # Immediate alert by default as requested
+
+        # Metrics (children cached so the loops never look up labels)
+        cam = str(camera_id)
+        self.frame_seq = 0
+        self.m_captured = FRAMES_CAPTURED.labels(cam)
+        self.m_processed = FRAMES_PROCESSED.labels(cam)
+        self.m_dropped = FRAMES_DROPPED.labels(cam)
+        self.m_errors = CAPTURE_ERRORS.labels(cam)
+        self.m_recording = RECORDING.labels(cam)
+        self.m_detections = DETECTIONS.labels(cam)
+        self.t_resize_display = stage_timer(cam, "resize_display")
+        self.t_resize_ai = stage_timer(cam, "resize_ai")
+        self.t_record = stage_timer(cam, "record")
+        self.t_encode = stage_timer(cam, "encode")
         
         # Start threads
         self.t_capture = threading.Thread(target=self.capture_loop, daemon=True)
@@ -50,71 +95,144 @@ class CameraStream:
         self.t_capture.start()
         self.t_process.start()
 
+    @property
+    def frames_captured(self):
+        return int(self.m_captured.value)
+
+    @property
+    def frames_processed(self):
+        return int(self.m_processed.value)
+
+    @property
+    def fps(self):
+        return (self.source.fps if self.source is not None else None) or 30.0
+
+    def open_camera(self):
+        self.source = VideoSource(self.source_config, name=self.camera_id).open()
+
     def capture_loop(self):
+        try:
+            if self.startup is not None:
+                with self.startup.stage(self.stage_name):
+                    self.open_camera()
+            else:
+                self.open_camera()
+        except Exception as e:
+            print(f"Error: {e}")
+            self.status = "failed"
+            self.stopped = True
+            return
+        self.status = "running"
+        if self.audio is not None:
+            self.audio.start()
+        seq = 0
+
         while not self.stopped:
             if not self.is_active:
+                # Power off: stop decoding entirely, reopen on power on
+                if self.source.alive:
+                    self.source.close()
+                    self.status = "paused"
                 time.sleep(0.1)
                 continue
+            if self.status == "paused":
+                try:
+                    self.open_camera()
+                    seq = 0
+                except Exception as e:
+                    print(f"Error: {e}")
+                    time.sleep(1)
+                    continue
 
-            ret, frame = self.cap.read()
-            if not ret:
-                print(f"Camera {self.camera_id} disconnected.")
-                self.stopped = True
-                break
+            # Newest decoded frame; older ones are skipped by the source thread
+            got = self.source.read(seq, timeout=1.0)
+            if got is None:
+                if not self.source.alive:
+                    self.m_errors.inc()
+                    print(f"Camera {self.camera_id} disconnected.")
+                    self.status = "disconnected"
+                    self.stopped = True
+                    break
+                self.status = self.source.status
+                continue
+            seq, frame, captured_at = got
+            self.status = "running"
             
-            # Resize immediately for display (HD) to avoid cost in streaming loop
-            # 4K -> 720p
-            display_small = cv2.resize(frame, (1280, 720))
-
+            # Display renditions are resized lazily by get_rendition
             with self.lock:
                 self.frame = frame
-                self.display_frame_base = display_small
+                self.frame_seq += 1
+                self.frame_ready.notify_all()
+            self.m_captured.inc()
             
-            # Handle Recording (Write raw 4K frame)
-            # Handle Recording (Write raw 4K frame)
+            # Handle Recording (raw 4K frame, queued to the clip's writer thread)
             with self.recording_lock:
                 if self.recording and self.out:
                     try:
-                        self.out.write(frame)
+                        with self.t_record.time():
+                            self.out.write(frame, captured_at)
                     except Exception as e:
+                        self.m_errors.inc()
                         print(f"Error writing frame: {e}")
-                
-            time.sleep(0.001)
 
     def process_loop(self):
+        last_seq = 0
         while not self.stopped:
             with self.lock:
-                if self.frame is None:
-                    continue
-                # Copy frame for processing to avoid locking capture
-                process_frame = self.frame.copy()
+                frame = self.frame
+                seq = self.frame_seq
+            if frame is None:
+                time.sleep(0.05)
+                continue
+            if seq == last_seq:
+                # Nothing new since the last pass
+                time.sleep(0.005)
+                continue
+            if seq - last_seq > 1 and last_seq:
+                self.m_dropped.inc(seq - last_seq - 1)
+            last_seq = seq
+            # Copy frame for processing to avoid locking capture
+            process_frame = frame.copy()
             
             # Resize for AI (Speed up)
-            ai_frame = cv2.resize(process_frame, (640, 640))
+            with self.t_resize_ai.time():
+                ai_frame = cv2.resize(process_frame, (640, 640))
             
             # Run AI only if monitoring is enabled
-            detections = []
+            detections = dets.EMPTY
             rec_trigger = False
             violation = False
             
-            if self.monitoring_enabled:
-                detections, rec_trigger, violation = self.ai.process_frame(
-                    ai_frame, 
-                    self.camera_id,
-                    check_recording=self.check_recording_zone,
-                    check_violation=self.check_violation_zone,
-                    violation_threshold=self.violation_threshold
-                )
+            # Detector may still be loading in the background; keep serving video
+            if self.monitoring_enabled and self.ai.detector_ready:
+                with self.state_lock:
+                    detections, rec_trigger, violation = self.ai.process_frame(
+                        ai_frame, 
+                        self.camera_id,
+                        check_recording=self.check_recording_zone,
+                        check_violation=self.check_violation_zone,
+                        violation_threshold=self.violation_threshold
+                    )
+                self.m_processed.inc()
+                self.m_detections.set(len(detections))
             
             # Store results for display thread
             with self.lock:
                 self.latest_detections = detections
+                self.detections_seq += 1
                 # Zones don't change often, but good to keep synced
-                self.latest_zones = self.ai.perimeters.get(str(self.camera_id), {})
+                self.sync_zones()
+
+            if self.bus is not None and self.bus.has_subscribers(self.camera_id):
+                self.bus.publish(self.detections_message(detections, rec_trigger, violation))
             
             # Update Recording State
             # Record if Recording Zone triggered OR Violation triggered
             should_record = (rec_trigger and self.recording_enabled) or (violation and self.recording_enabled)
+            # A clip interrupted by a node handover continues here until the cooldown
+            if self.resume_recording:
+                self.resume_recording = False
+                should_record = should_record or self.recording_enabled
 
             if should_record:
                 self.last_recording_time = time.time()
@@ -140,78 +258,214 @@ class CameraStream:
     def start_recording(self, shape):
         with self.recording_lock:
             self.recording = True
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"recording_cam{self.camera_id}_{timestamp}.avi"
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            # We record at 30 FPS (assuming capture is keeping up)
-            self.out = cv2.VideoWriter(filename, fourcc, 30.0, (shape[1], shape[0]))
-            print(f"Cam {self.camera_id}: Started recording {filename}")
+            # Clip timeline at the negotiated source rate, placed by capture time
+            self.out = ClipRecorder(self.camera_id, self.fps, (shape[1], shape[0]), audio=self.audio)
+            self.m_recording.set(1)
+            print(f"Cam {self.camera_id}: Started recording {self.out.filename}")
 
     def stop_recording(self):
         with self.recording_lock:
             self.recording = False
             if self.out:
-                self.out.release()
+                # Returns at once; the clip is finished and muxed in the background
+                self.out.close()
                 self.out = None
+            self.m_recording.set(0)
             print(f"Cam {self.camera_id}: Stopped recording")
             
-    def get_jpeg(self):
-        # Get latest pre-resized frame
+    def detections_message(self, detections, rec_trigger, violation):
+        """
+        Compact overlay update for browsers. Boxes are normalized to 0-1 so
+        clients can draw them over any rendition of the stream.
+        Track row: [x1, y1, x2, y2, id, class, violation, duration]
+        """
+        return {
+            "type": "detections",
+            "camera_id": str(self.camera_id),
+            "ts": round(time.time(), 3),
+            "tracks": dets.to_rows(detections),
+            "recording_trigger": rec_trigger,
+            "violation": violation,
+            "recording": self.recording,
+            "zones_enabled": {
+                name: self.action_enabled(action) for name, (_, action) in self.latest_zone_styles.items()
+            },
+            "hits": [
+                {"rule": hit.rule, "action": hit.action, "ids": hit.track_ids}
+                for hit in self.ai.last_hits.get(str(self.camera_id), ())
+            ],
+        }
+
+    def zones_message(self):
+        """Zone polygons normalized to 0-1 (zones are stored in 4K coordinates)."""
+        zones = self.ai.perimeters.get(str(self.camera_id), {})
+        styles = self.ai.zone_styles.get(str(self.camera_id), {})
+        return {
+            "type": "zones",
+            "camera_id": str(self.camera_id),
+            "zones": {
+                name: (points / [3840, 2160]).round(4).tolist()
+                for name, points in zones.items()
+            },
+            "styles": {
+                name: {"type": zone_type, "action": action}
+                for name, (zone_type, action) in styles.items()
+            },
+        }
+
+    def sync_zones(self):
+        camera_key = str(self.camera_id)
+        self.latest_zones = self.ai.perimeters.get(camera_key, {})
+        self.latest_zone_styles = self.ai.zone_styles.get(camera_key, {})
+
+    def action_enabled(self, action):
+        # Zone toggles map onto rule actions; alert rules are always on
+        if action == "record":
+            return self.check_recording_zone
+        if action == "violation":
+            return self.check_violation_zone
+        return True
+
+    def wait_frame(self, last_seq, timeout=1.0):
+        """Blocks until a frame newer than last_seq is captured; returns the current seq."""
+        with self.frame_ready:
+            self.frame_ready.wait_for(lambda: self.frame_seq != last_seq or self.stopped, timeout)
+            return self.frame_seq
+
+    def get_rendition(self, rendition="720p"):
+        """(frame_seq, image) at a display size from RENDITIONS; resized once per frame."""
+        size = RENDITIONS[rendition]
+        with self.lock:
+            frame, seq = self.frame, self.frame_seq
+        if frame is None:
+            return 0, None
+        cached = self._renditions.get(rendition)
+        if cached is not None and cached[0] == seq:
+            return cached
+        if size is None or (frame.shape[1], frame.shape[0]) == size:
+            image = frame
+        else:
+            with self.t_resize_display.time():
+                image = cv2.resize(frame, size)
+        self._renditions[rendition] = cached = (seq, image)
+        return cached
+
+    def get_jpeg(self, draw_overlays=True, quality=80, rendition="720p"):
+        # Get latest frame at the requested size
+        seq, base = self.get_rendition(rendition)
+        if base is None:
+            return None
         with self.lock:
-            if self.display_frame_base is None:
-                return None
-            # Copy the small frame (fast)
-            display_frame = self.display_frame_base.copy()
             detections = self.latest_detections
+            detections_seq = self.detections_seq
             zones = self.latest_zones
+            styles = self.latest_zone_styles
+
+        if not draw_overlays:
+            # Browser renders overlays from the detection WebSocket
+            zones, detections, detections_seq = {}, dets.EMPTY, 0
+
+        # Viewers of the same rendition share one encode per frame
+        key = (rendition, quality, draw_overlays)
+        cached = self._jpegs.get(key)
+        if cached is not None and cached[0] == seq and cached[1] == detections_seq:
+            return cached[2]
+
+        # Overlay drawing + JPEG encode
+        render_start = time.perf_counter()
+        height, width = base.shape[:2]
+        display_frame = base.copy() if (zones or len(detections)) else base
             
         # Draw Overlays
-        # Zones: 4K -> HD
-        # 1280 / 3840 = 0.333
-        # 720 / 2160 = 0.333
-        disp_scale_x = 1280 / 3840
-        disp_scale_y = 720 / 2160
+        # Zones are stored in 4K coordinates
+        disp_scale_x = width / 3840
+        disp_scale_y = height / 2160
         
         for name, points in zones.items():
+            zone_type, action = styles.get(name, ("presence", "alert"))
             # Skip drawing if zone is disabled
-            if "recording" in name and not self.check_recording_zone:
-                continue
-            if "violation" in name and not self.check_violation_zone:
+            if not self.action_enabled(action):
                 continue
 
             disp_points = (points * [disp_scale_x, disp_scale_y]).astype(np.int32)
-            color = (255, 0, 0) if "recording" in name else (0, 0, 255)
-            cv2.polylines(display_frame, [disp_points], True, color, 2)
-
-        # Detections: 640 -> HD
-        # 1280 / 640 = 2.0
-        # 720 / 640 = 1.125
-        det_scale_x = 1280 / 640
-        det_scale_y = 720 / 640
-
-        for det in detections:
-            x1, y1, x2, y2 = det['box']
-            dx1 = int(x1 * det_scale_x)
-            dy1 = int(y1 * det_scale_y)
-            dx2 = int(x2 * det_scale_x)
-            dy2 = int(y2 * det_scale_y)
-            
-            color = (0, 0, 255) if det['violation'] else (0, 255, 0)
-            cv2.rectangle(display_frame, (dx1, dy1), (dx2, dy2), color, 2)
-            
-            if det['violation']:
-                cv2.putText(display_frame, "VIOLATION", (dx1, dy1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,255), 2)
+            color = ZONE_COLORS.get(action, (0, 255, 255))
+            cv2.polylines(display_frame, [disp_points], zone_type != "line", color, 2)
+
+        # Detections are in AI input coordinates (640x640)
+        det_scale_x = width / 640
+        det_scale_y = height / 640
+
+        if len(detections):
+            boxes = dets.scaled_boxes(detections, det_scale_x, det_scale_y).tolist()
+            for (dx1, dy1, dx2, dy2), violation in zip(boxes, detections["violation"].tolist()):
+                color = (0, 0, 255) if violation else (0, 255, 0)
+                cv2.rectangle(display_frame, (dx1, dy1), (dx2, dy2), color, 2)
+                
+                if violation:
+                    cv2.putText(display_frame, "VIOLATION", (dx1, dy1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,255), 2)
 
         # Encode
         # Use slightly lower quality for speed if needed, 80 is good balance
-        ret, jpeg = cv2.imencode('.jpg', display_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        return jpeg.tobytes()
+        ret, jpeg = cv2.imencode('.jpg', display_frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        self.t_encode.observe(time.perf_counter() - render_start)
+        data = jpeg.tobytes()
+        self._jpegs[key] = (seq, detections_seq, data)
+        return data
+
+    def fmp4_stream(self, rendition="720p"):
+        """Shared H.264/fMP4 encoder for a rendition, created on first use."""
+        with self._streams_lock:
+            stream = self.fmp4_streams.get(rendition)
+            if stream is None:
+                stream = self.fmp4_streams[rendition] = FMP4Stream(self, rendition)
+            return stream
 
     def stop(self):
         self.stopped = True
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        for stream in list(self.fmp4_streams.values()):
+            stream.close()
         self.t_capture.join()
         self.t_process.join()
-        self.cap.release()
+        if self.recording:
+            self.stop_recording()
+        if self.source is not None:
+            self.source.close()
+        if self.audio is not None:
+            self.audio.close()
+
+    # Node handover (see app/cluster.py)
+
+    CONTROL_FLAGS = ("is_active", "monitoring_enabled", "recording_enabled", "snapshots_enabled",
+                     "check_recording_zone", "check_violation_zone", "violation_threshold")
+
+    def handover_state(self):
+        """JSON-serializable state another node needs to take this camera over seamlessly."""
+        with self.state_lock:
+            tracking = self.ai.tracking_state(self.camera_id)
+        out = self.out # The capture thread may close it meanwhile
+        return {
+            "saved_at": time.time(),
+            "controls": {name: getattr(self, name) for name in self.CONTROL_FLAGS},
+            "tracking": tracking,
+            "recording": self.recording,
+            "clip": out.filename if out is not None else None,
+        }
+
+    def resume(self, state):
+        """Applies handover_state() from the previous owner."""
+        for name, value in state.get("controls", {}).items():
+            if name in self.CONTROL_FLAGS:
+                setattr(self, name, value)
+        gap = max(0.0, time.time() - state.get("saved_at", time.time()))
+        if state.get("tracking"):
+            with self.state_lock:
+                self.ai.restore_tracking(self.camera_id, state["tracking"], gap)
+        if state.get("recording"):
+            print(f"Cam {self.camera_id}: Continuing recording {state.get('clip')} from previous node")
+            self.resume_recording = True
+        print(f"Cam {self.camera_id}: Resumed state saved {gap:.1f}s ago")
 
     def toggle_monitoring(self, state: bool):
         self.monitoring_enabled = state
@@ -0,0 +1,442 @@
+"""
+Multi-node camera assignment.
+
+Every node runs the same app with the same cameras.json/perimeters.json
+(shared volume or identical deploys) and a common Redis. Each camera is
+run by exactly one node, the holder of its lease:
+
+    <prefix>:node:<node_id>     {"url": ..., "cameras": [...]}, expires after lease_ttl
+    <prefix>:lease:<camera_id>  "<node_id>/<instance>", SET NX PX lease_ttl
+    <prefix>:state:<camera_id>  handover state of the camera (JSON)
+
+Every heartbeat a node refreshes its node key, renews its leases and
+picks the desired owner of each camera by rendezvous hashing over the
+live nodes. Adding or removing a node only moves the cameras that hash
+to it. A node lets go of cameras that now belong to someone else (saving
+their state first) and takes the free leases of cameras that belong to it.
+A crashed node's leases expire after lease_ttl and its cameras
+are picked up from the state it last saved: track ids, dwell timers,
+dashboard controls and whether a clip was being recorded.
+
+Renewing and releasing check the lease still holds this node's token
+(a Lua script on Redis, cas_* helpers on LocalRedis). A renew is counted
+from the moment it was sent, which is no later than Redis starts the new
+TTL, and a camera is stopped once lease_ttl - heartbeat has passed since
+its last confirmed renew. The check runs every half heartbeat, also
+while a tick is still waiting on Redis, so a partitioned node stops its
+cameras before the lease can expire and be taken by another node. Redis
+calls have socket timeouts and each tick is cancelled after
+lease_ttl - heartbeat.
+
+Dashboard requests for cameras running elsewhere are proxied to the
+owner (httpx), and detection overlays are relayed over its WebSocket.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, fields
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Marks proxied requests so a stale owner lookup cannot bounce them around
+HOP_HEADER = "x-cluster-hop"
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "content-length", "host", "upgrade"}
+
+@dataclass
+class ClusterConfig:
+    redis_url: str = "" # Empty = single node, no coordination
+    node_id: str = ""
+    node_url: str = "" # How other nodes reach this one, e.g. http://10.0.0.7:8000
+    prefix: str = "epai"
+    lease_ttl: float = 10.0
+    heartbeat: float = 2.0
+
+    @classmethod
+    def from_env(cls, prefix="CLUSTER_", **defaults):
+        """
+        Builds a config from <prefix>REDIS_URL, <prefix>NODE_ID,
+        <prefix>NODE_URL, <prefix>PREFIX, <prefix>LEASE_TTL and
+        <prefix>HEARTBEAT.
+        """
+        values = dict(defaults)
+        for f in fields(cls):
+            raw = os.getenv(prefix + f.name.upper())
+            if raw is not None:
+                values[f.name] = type(f.default)(raw)
+        config = cls(**values)
+        if not config.node_id:
+            config.node_id = f"{socket.gethostname()}-{os.getpid()}"
+        if not config.node_url:
+            config.node_url = f"http://{socket.gethostname()}:8000"
+        return config
+
+    @property
+    def enabled(self):
+        return bool(self.redis_url)
+
+def create_redis(url, timeout=2.0):
+    """
+    redis.asyncio client for url; "local" gives an in-process LocalRedis
+    (tests, single machine). Calls fail after timeout seconds instead of
+    hanging through a network partition, so the node can fence itself.
+    """
+    if url == "local":
+        from src.infrastructure.local_redis import LocalRedis
+        return LocalRedis()
+    import redis.asyncio as redis
+    return redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+def rendezvous_owner(camera_id, node_ids):
+    """Highest-random-weight choice: stable, and only ~1/N cameras move when a node joins or leaves."""
+    if not node_ids:
+        return None
+    return max(node_ids, key=lambda node_id: hashlib.sha1(f"{node_id}|{camera_id}".encode()).digest())
+
+async def renew_lease(redis, key, token, ttl_ms):
+    if hasattr(redis, "cas_pexpire"):
+        return bool(await redis.cas_pexpire(key, token, ttl_ms))
+    return bool(await redis.eval(RENEW_SCRIPT, 1, key, token, ttl_ms))
+
+async def release_lease(redis, key, token):
+    if hasattr(redis, "cas_delete"):
+        return bool(await redis.cas_delete(key, token))
+    return bool(await redis.eval(RELEASE_SCRIPT, 1, key, token))
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+class ClusterCoordinator:
+    """
+    Runs the lease loop for one node. on_acquire(camera_id, state) and
+    on_release(camera_id) -> state are coroutines that start and stop the
+    camera locally; snapshot(camera_id) -> state is a coroutine called
+    every heartbeat so a crash loses at most one interval of state.
+    """
+
+    def __init__(self, redis, config, camera_ids, on_acquire, on_release, snapshot):
+        self.redis = redis
+        self.config = config
+        self.node_id = config.node_id
+        self.token = f"{config.node_id}/{uuid.uuid4().hex[:8]}"
+        self.camera_ids = [str(c) for c in camera_ids]
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.snapshot = snapshot
+        self.owned = {} # camera_id -> monotonic time the last successful renew was sent
+        self._starting = {} # camera_id -> task running on_acquire
+        self.nodes = {} # node_id -> info, from the last heartbeat
+        self._task = None
+        self._http = None
+        self._warned = set()
+
+    @property
+    def lease_ms(self):
+        return int(self.config.lease_ttl * 1000)
+
+    def _key(self, kind, name):
+        return f"{self.config.prefix}:{kind}:{name}"
+
+    # Lease loop
+
+    async def start(self):
+        await self._tick_or_fence()
+        self._task = asyncio.create_task(self._run())
+        print(f"Cluster: node {self.node_id} running {sorted(self.owned)} of {len(self.camera_ids)} cameras")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config.heartbeat)
+            await self._tick_or_fence()
+
+    async def _tick_or_fence(self):
+        # A tick that hangs (partitioned Redis, slow camera stop) must not
+        # hold off fencing, so fencing runs alongside it
+        tick = asyncio.create_task(self.tick())
+        deadline = time.monotonic() + self.config.lease_ttl - self.config.heartbeat
+        try:
+            while True:
+                done, _ = await asyncio.wait({tick}, timeout=self.config.heartbeat / 2)
+                if done:
+                    tick.result()
+                    break
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("tick took longer than lease_ttl - heartbeat")
+                await self._fence()
+        except Exception as e:
+            print(f"Cluster: heartbeat failed: {e!r}")
+        finally:
+            if not tick.done():
+                tick.cancel()
+        await self._fence()
+
+    async def heartbeat(self):
+        info = {"url": self.config.node_url, "cameras": sorted(self.owned), "at": time.time()}
+        await self.redis.set(self._key("node", self.node_id), json.dumps(info), px=self.lease_ms)
+
+    async def live_nodes(self):
+        # SCAN rather than KEYS, which blocks a shared Redis while it walks every key
+        prefix = self._key("node", "")
+        nodes = {}
+        async for key in self.redis.scan_iter(match=prefix + "*", count=100):
+            raw = await self.redis.get(key)
+            if raw is not None:
+                nodes[_text(key)[len(prefix):]] = json.loads(raw)
+        return nodes
+
+    async def tick(self):
+        await self.heartbeat()
+        self.nodes = await self.live_nodes()
+
+        # Leases first: everything after this may be slow
+        lost = []
+        for camera_id in list(self.owned):
+            sent = time.monotonic()
+            renewed = await renew_lease(self.redis, self._key("lease", camera_id), self.token, self.lease_ms)
+            if camera_id not in self.owned:
+                continue # Fenced while the renew was in flight
+            if renewed:
+                self.owned[camera_id] = sent
+            else:
+                lost.append(camera_id)
+
+        for camera_id in lost:
+            # Expired (e.g. Redis unreachable for too long) and maybe taken over
+            print(f"Cluster: lost lease on camera {camera_id}")
+            if camera_id in self._starting:
+                self.owned.pop(camera_id, None) # The start task stops it when done
+            else:
+                await self._drop(camera_id, handover=False)
+
+        running = []
+        for camera_id in self.camera_ids:
+            if camera_id in self._starting:
+                continue
+            owner = rendezvous_owner(camera_id, list(self.nodes))
+            if camera_id in self.owned:
+                if owner != self.node_id:
+                    print(f"Cluster: handing camera {camera_id} over to {owner}")
+                    await self._drop(camera_id, handover=True)
+                else:
+                    running.append(camera_id)
+            elif owner == self.node_id:
+                await self._try_acquire(camera_id)
+
+        # Each snapshot waits on its camera's state lock: all at once, so
+        # the tick does not grow with the number of cameras
+        states = await asyncio.gather(*(self.snapshot(c) for c in running), return_exceptions=True)
+        for camera_id, state in zip(running, states):
+            if isinstance(state, Exception):
+                print(f"Cluster: snapshot of camera {camera_id} failed: {state!r}")
+            elif camera_id in self.owned:
+                await self._save_state(camera_id, state)
+
+    async def _try_acquire(self, camera_id):
+        # Fails while the previous owner still holds the lease: it lets go
+        # on its next heartbeat, or the lease expires if it died
+        if not await self.redis.set(self._key("lease", camera_id), self.token, px=self.lease_ms, nx=True):
+            return
+        raw = await self.redis.get(self._key("state", camera_id))
+        state = json.loads(raw) if raw is not None else None
+        # Starting a camera (detector load, device negotiation) can take
+        # longer than the lease, so it runs beside the heartbeat, which
+        # keeps renewing the lease meanwhile
+        self.owned[camera_id] = time.monotonic()
+        self._starting[camera_id] = asyncio.create_task(self._start_camera(camera_id, state))
+
+    async def _start_camera(self, camera_id, state):
+        try:
+            await self.on_acquire(camera_id, state)
+        except Exception as e:
+            print(f"Cluster: failed to start camera {camera_id}: {e!r}")
+            self.owned.pop(camera_id, None)
+            try:
+                await release_lease(self.redis, self._key("lease", camera_id), self.token)
+            except Exception:
+                pass # Expires on its own
+            return
+        finally:
+            self._starting.pop(camera_id, None)
+        if camera_id not in self.owned:
+            print(f"Cluster: lease on camera {camera_id} lost while starting, stopping it")
+            await self.on_release(camera_id)
+            return
+        print(f"Cluster: acquired camera {camera_id}" + (" (resuming)" if state else ""))
+
+    async def _drop(self, camera_id, handover):
+        if camera_id not in self.owned:
+            return # Already stopped by _fence
+        del self.owned[camera_id]
+        state = await self.on_release(camera_id)
+        if handover:
+            # State first, so the next owner reads the final version
+            if state is not None:
+                await self._save_state(camera_id, state)
+            await release_lease(self.redis, self._key("lease", camera_id), self.token)
+
+    async def _save_state(self, camera_id, state):
+        if state is not None:
+            # Outlives the lease so a crash is still resumable after failover
+            await self.redis.set(self._key("state", camera_id), json.dumps(state), px=self.lease_ms * 6)
+
+    async def _fence(self):
+        """
+        Stops cameras whose lease was not confirmed for lease_ttl - heartbeat,
+        before it can expire and another node take them over.
+        """
+        limit = self.config.lease_ttl - self.config.heartbeat
+        now = time.monotonic()
+        for camera_id, renewed in list(self.owned.items()):
+            if now - renewed > limit and self.owned.get(camera_id) == renewed:
+                print(f"Cluster: cannot confirm lease on camera {camera_id}, stopping it")
+                del self.owned[camera_id]
+                if camera_id in self._starting:
+                    continue # The start task stops it when done
+                try:
+                    await self.on_release(camera_id)
+                except Exception as e:
+                    print(f"Cluster: error stopping camera {camera_id}: {e!r}")
+
+    async def stop(self):
+        """Hands every camera over and leaves the cluster, so other nodes take over on their next heartbeat."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._starting:
+            await asyncio.gather(*self._starting.values(), return_exceptions=True)
+        try:
+            # Leave first, so rendezvous on the other nodes stops picking this one
+            await self.redis.delete(self._key("node", self.node_id))
+            for camera_id in list(self.owned):
+                await self._drop(camera_id, handover=True)
+        except Exception as e:
+            print(f"Cluster: error leaving: {e!r}")
+            for camera_id in list(self.owned):
+                self.owned.pop(camera_id, None)
+                await self.on_release(camera_id)
+        if self._http is not None:
+            await self._http.aclose()
+
+    # Routing
+
+    async def owner(self, camera_id):
+        """(node_id, url) of the camera's current owner, or None."""
+        raw = await self.redis.get(self._key("lease", camera_id))
+        if raw is None:
+            return None
+        node_id = _text(raw).rsplit("/", 1)[0]
+        info = self.nodes.get(node_id)
+        if info is None:
+            raw = await self.redis.get(self._key("node", node_id))
+            if raw is None:
+                return None
+            info = json.loads(raw)
+        return node_id, info["url"].rstrip("/")
+
+    def report(self):
+        return {
+            "node": self.node_id,
+            "cameras": sorted(self.owned),
+            "nodes": {node_id: info.get("cameras", []) for node_id, info in self.nodes.items()},
+        }
+
+    def _client(self):
+        if self._http is None:
+            import httpx
+            # No read timeout: video responses stream indefinitely
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None))
+        return self._http
+
+    async def proxy(self, request, camera_id):
+        """Forwards an HTTP request for a camera to the node running it and streams the response back."""
+        owner = None if request.headers.get(HOP_HEADER) else await self.owner(camera_id)
+        if owner is None or owner[0] == self.node_id:
+            return JSONResponse({"error": "Camera is not running on any node"}, status_code=503)
+        node_id, url = owner
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+        headers[HOP_HEADER] = self.node_id
+        client = self._client()
+        upstream = client.build_request(request.method, url + request.url.path, params=request.query_params,
+                                        headers=headers, content=await request.body())
+        try:
+            response = await client.send(upstream, stream=True)
+        except Exception as e:
+            return JSONResponse({"error": f"Node {node_id} unreachable: {e}"}, status_code=502)
+        response_headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP}
+        return StreamingResponse(response.aiter_raw(), status_code=response.status_code,
+                                 headers=response_headers, background=BackgroundTask(response.aclose))
+
+    def relay_detections(self, sub, camera_id=None):
+        """
+        Feeds overlay updates of cameras running on other nodes into a
+        local detection bus subscription. Returns the relay task; cancel it
+        when the client disconnects.
+        """
+        if camera_id is not None:
+            return asyncio.create_task(self._relay(sub, None, camera_id))
+        return asyncio.create_task(self._relay_all(sub))
+
+    async def _relay_all(self, sub):
+        # One upstream per other node, following nodes as they join and leave
+        relays = {}
+        try:
+            while True:
+                for node_id in self.nodes:
+                    task = relays.get(node_id)
+                    if node_id != self.node_id and (task is None or task.done()):
+                        relays[node_id] = asyncio.create_task(self._relay(sub, node_id, None))
+                await asyncio.sleep(self.config.heartbeat)
+        finally:
+            for task in relays.values():
+                task.cancel()
+
+    async def _relay(self, sub, node_id, camera_id):
+        try:
+            from websockets import connect
+        except ImportError:
+            if "websockets" not in self._warned:
+                self._warned.add("websockets")
+                print("Cluster: websockets is not installed; no overlays for cameras on other nodes")
+            return
+        while True:
+            if node_id is None:
+                owner = await self.owner(camera_id)
+                target = owner if owner is not None and owner[0] != self.node_id else None
+            else:
+                info = self.nodes.get(node_id)
+                target = (node_id, info["url"].rstrip("/")) if info is not None else None
+                if target is None:
+                    return # Node left; its cameras are relayed by the new owners' connections
+            if target is not None:
+                query = "local=1" + (f"&camera_id={camera_id}" if camera_id is not None else "")
+                ws_url = "ws" + target[1][len("http"):] + f"/ws/detections?{query}"
+                try:
+                    async with connect(ws_url) as upstream:
+                        async for message in upstream:
+                            sub.offer(message)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    pass
+            # Owner changed or unreachable: look again after a heartbeat
+            await asyncio.sleep(self.config.heartbeat)
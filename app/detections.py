@@ -0,0 +1,92 @@
+import numpy as np
+
+# Per-frame detections as one structured array instead of a dict per object.
+# Coordinates are in AI input space (640x640); zones are in 4K space.
+DETECTION_DTYPE = np.dtype([
+    ("box", np.float32, 4),   # x1, y1, x2, y2
+    ("id", np.int32),         # track id
+    ("cls", np.int16),        # COCO class
+    ("conf", np.float32),
+    ("violation", np.bool_),
+    ("duration", np.float32), # seconds inside the violation zone
+])
+
+EMPTY = np.zeros(0, dtype=DETECTION_DTYPE)
+EMPTY.flags.writeable = False
+
+def from_tracked(tracked, classes=None):
+    """
+    Builds the record array from detector track rows
+    [x1, y1, x2, y2, track_id, conf, cls], keeping only the given classes.
+    """
+    if not len(tracked):
+        return EMPTY
+    if classes is not None:
+        tracked = tracked[np.isin(tracked[:, 6], classes)]
+    detections = np.zeros(len(tracked), dtype=DETECTION_DTYPE)
+    detections["box"] = tracked[:, :4]
+    detections["id"] = tracked[:, 4]
+    detections["conf"] = tracked[:, 5]
+    detections["cls"] = tracked[:, 6]
+    return detections
+
+def centers(detections, scale=(1.0, 1.0)):
+    """(N, 2) box centers multiplied by (scale_x, scale_y)."""
+    boxes = detections["box"]
+    return np.stack([
+        (boxes[:, 0] + boxes[:, 2]) * (0.5 * scale[0]),
+        (boxes[:, 1] + boxes[:, 3]) * (0.5 * scale[1]),
+    ], axis=1)
+
+def polygon_edges(polygon):
+    """Precomputes a polygon's edges for repeated points_in_polygon tests."""
+    poly = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    x1, y1 = poly[:, 0], poly[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    dy = y2 - y1
+    # Horizontal edges never satisfy the crossing test, so their slope is unused
+    slope = np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=dy != 0)
+    return x1, y1, y2, slope
+
+def points_in_polygon(points, polygon, edges=None):
+    """
+    Vectorized even-odd test of (N, 2) points against an (M, 2) polygon;
+    same answers as cv2.pointPolygonTest(...) >= 0 away from the edges.
+    Pass edges from polygon_edges() to skip the per-call setup.
+    """
+    if edges is None:
+        if polygon is None or len(polygon) < 3:
+            return np.zeros(len(points), dtype=bool)
+        edges = polygon_edges(polygon)
+    if not len(points):
+        return np.zeros(0, dtype=bool)
+    x1, y1, y2, slope = edges
+    x = points[:, 0:1]
+    y = points[:, 1:2]
+    crosses = (y1 > y) != (y2 > y)
+    x_cross = x1 + (y - y1) * slope
+    return np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+
+def scaled_boxes(detections, scale_x, scale_y):
+    """Boxes as int32 pixels in another resolution (display, 4K)."""
+    return (detections["box"] * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)).astype(np.int32)
+
+def to_rows(detections, width=640, height=640):
+    """
+    Serializes to compact rows [x1, y1, x2, y2, id, class, violation, duration]
+    with boxes normalized to 0-1, in one conversion to Python lists.
+    """
+    if not len(detections):
+        return []
+    boxes = np.round(detections["box"] / np.array([width, height, width, height], dtype=np.float64), 4)
+    # One tolist() per column; ids, classes and flags stay JSON integers
+    return [
+        [*box, track_id, cls, int(violation), duration]
+        for box, track_id, cls, violation, duration in zip(
+            boxes.tolist(),
+            detections["id"].tolist(),
+            detections["cls"].tolist(),
+            detections["violation"].tolist(),
+            np.round(detections["duration"].astype(np.float64), 1).tolist(),
+        )
+    ]
@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict
+import numpy as np
+from .instrumentation import DWELL_TRACKS, DWELL_EVICTED
+
+class DwellTracker:
+    """
+    Time each track has spent inside each zone, for one camera.
+
+    Entries are keyed by (zone, track_id) and kept in least-recently-seen
+    order, so expiring tracks that vanished (left the frame, lost by the
+    tracker) only touches the stale head of the dict. max_tracks bounds
+    memory even if the tracker hands out ids faster than they expire.
+
+    Timestamps are monotonic seconds; pass now explicitly to drive the
+    tracker from another clock (e.g. video time when replaying files).
+    """
+
+    def __init__(self, camera_id="", track_ttl=2.0, max_tracks=10000, thresholds=None, default_threshold=0.0):
+        self.track_ttl = track_ttl
+        self.max_tracks = max_tracks
+        self.thresholds = dict(thresholds or {}) # zone -> seconds before a dwell counts as a violation
+        self.default_threshold = default_threshold
+        self._entries = OrderedDict() # (zone, track_id) -> [entered_at, last_seen]
+        self._zones = {} # track_id -> zones with an entry, for reset_stale
+        self.m_evicted = DWELL_EVICTED.labels(camera_id)
+        DWELL_TRACKS.labels(camera_id).set_function(self.__len__)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def threshold(self, zone):
+        return self.thresholds.get(zone, self.default_threshold)
+
+    def update(self, zone, track_ids, inside, now=None):
+        """
+        Records one frame for a zone. track_ids are every track seen in the
+        frame and inside the matching membership mask; tracks seen outside
+        the zone are reset. Returns (durations, over_threshold) arrays.
+        """
+        if now is None:
+            now = time.monotonic()
+        entries = self._entries
+        inside = np.asarray(inside, dtype=bool)
+        track_ids = np.asarray(track_ids)
+        durations = np.zeros(len(track_ids), dtype=np.float32)
+
+        for track_id in track_ids[~inside].tolist():
+            self._remove((zone, track_id))
+
+        elapsed = []
+        for track_id in track_ids[inside].tolist():
+            key = (zone, track_id)
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = entry = [now, now]
+                self._zones.setdefault(track_id, set()).add(zone)
+            else:
+                entry[1] = now
+                entries.move_to_end(key)
+            elapsed.append(now - entry[0])
+        if elapsed:
+            durations[inside] = elapsed
+
+        while len(entries) > self.max_tracks:
+            self._remove(next(iter(entries)))
+            self.m_evicted.inc()
+        return durations, inside & (durations > self.threshold(zone))
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        zones = self._zones.get(key[1])
+        if zones is not None:
+            zones.discard(key[0])
+            if not zones:
+                del self._zones[key[1]]
+
+    def reset_stale(self, track_ids, now):
+        """
+        Drops entries of tracks seen this frame (track_ids) that update()
+        did not refresh at now: the track is visible but no longer in that
+        zone, so its dwell restarts if it comes back.
+        """
+        entries = self._entries
+        for track_id in np.asarray(track_ids).tolist():
+            zones = self._zones.get(track_id)
+            if not zones:
+                continue
+            for zone in list(zones):
+                if entries[(zone, track_id)][1] < now:
+                    self._remove((zone, track_id))
+
+    def expire(self, now=None):
+        """Drops entries not seen for track_ttl seconds; returns how many."""
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.track_ttl
+        entries = self._entries
+        expired = 0
+        while entries:
+            key, (_, last_seen) = next(iter(entries.items()))
+            if last_seen >= cutoff:
+                break
+            self._remove(key)
+            expired += 1
+        return expired
+
+    def state(self, now=None):
+        """
+        Entries as [zone, track_id, seconds inside, seconds since seen].
+        Ages instead of timestamps, because monotonic clocks differ between
+        processes and machines.
+        """
+        if now is None:
+            now = time.monotonic()
+        return [[zone, track_id, now - entered_at, now - last_seen]
+                for (zone, track_id), (entered_at, last_seen) in list(self._entries.items())]
+
+    def restore(self, entries, gap=0.0, now=None):
+        """
+        Loads state() output taken gap seconds ago. Time in the zone keeps
+        counting across the gap, and every entry counts as just seen, so
+        tracks that are still there continue their dwell instead of
+        restarting it.
+        """
+        if now is None:
+            now = time.monotonic()
+        self._entries.clear()
+        self._zones.clear()
+        for zone, track_id, inside, _ in entries:
+            self._entries[(zone, track_id)] = [now - inside - gap, now]
+            self._zones.setdefault(track_id, set()).add(zone)
+
+    def clear(self, zone=None):
+        if zone is None:
+            self._entries.clear()
+            self._zones.clear()
+            return
+        for key in [key for key in self._entries if key[0] == zone]:
+            self._remove(key)
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+from .instrumentation import BUS_SUBSCRIBERS, BUS_QUEUED, BUS_DROPPED
+
+class Subscription:
+    def __init__(self, camera_id=None, queue_size=8):
+        self.camera_id = camera_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message):
+        # Slow clients only ever see the freshest updates
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            BUS_DROPPED.inc()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+class DetectionBus:
+    """
+    In-process fan-out of per-camera detection and zone updates.
+
+    Camera threads publish plain dicts; each message is serialized once on
+    the event loop and handed to every matching subscriber's bounded queue,
+    so the cost of a publish does not grow with payload size per client.
+    """
+
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.loop = None
+        self.subscriptions = set()
+        self._lock = threading.Lock()
+        self._watched = {}  # camera_id (None = all) -> subscriber count
+        BUS_SUBSCRIBERS.set_function(lambda: len(self.subscriptions))
+        BUS_QUEUED.set_function(lambda: sum(sub.queue.qsize() for sub in list(self.subscriptions)))
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def has_subscribers(self, camera_id):
+        # Read from camera threads: lets them skip building payloads nobody reads
+        watched = self._watched
+        return bool(watched.get(None) or watched.get(str(camera_id)))
+
+    def publish(self, message):
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._dispatch, message)
+        except RuntimeError:
+            pass  # Loop shutting down
+
+    def _dispatch(self, message):
+        camera_id = str(message.get("camera_id"))
+        payload = None
+        for sub in list(self.subscriptions):
+            if sub.camera_id is not None and sub.camera_id != camera_id:
+                continue
+            if payload is None:
+                payload = json.dumps(message, separators=(",", ":"))
+            sub.offer(payload)
+
+    def subscribe(self, camera_id=None):
+        sub = Subscription(None if camera_id is None else str(camera_id), self.queue_size)
+        with self._lock:
+            self.subscriptions.add(sub)
+            watched = dict(self._watched)
+            watched[sub.camera_id] = watched.get(sub.camera_id, 0) + 1
+            self._watched = watched
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub not in self.subscriptions:
+                return
+            self.subscriptions.discard(sub)
+            watched = dict(self._watched)
+            watched[sub.camera_id] -= 1
+            if not watched[sub.camera_id]:
+                del watched[sub.camera_id]
+            self._watched = watched
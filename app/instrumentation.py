@@ -0,0 +1,35 @@
+from src.core import metrics
+
+# Shared metric definitions for the monitoring app. Callers cache the
+# labelled children (see CameraStream.__init__) so hot loops never do label
+# lookups. Capture fps is rate(camera_frames_captured_total).
+
+FRAMES_CAPTURED = metrics.counter(
+    "camera_frames_captured_total", "Frames read from the camera", ["camera"])
+FRAMES_PROCESSED = metrics.counter(
+    "camera_frames_processed_total", "Frames run through the AI loop", ["camera"])
+FRAMES_DROPPED = metrics.counter(
+    "camera_frames_dropped_total", "Captured frames replaced before the AI loop picked them up", ["camera"])
+CAPTURE_ERRORS = metrics.counter(
+    "camera_capture_errors_total", "Failed reads or recording writes", ["camera"])
+STAGE_SECONDS = metrics.histogram(
+    "pipeline_stage_seconds", "Latency of each pipeline stage", ["camera", "stage"])
+RECORDING = metrics.gauge(
+    "camera_recording", "1 while the camera is writing a recording", ["camera"])
+DETECTIONS = metrics.gauge(
+    "camera_detections", "Tracked objects in the last processed frame", ["camera"])
+
+def stage_timer(camera_id, stage):
+    return STAGE_SECONDS.labels(str(camera_id), stage)
+
+BUS_SUBSCRIBERS = metrics.gauge(
+    "detection_bus_subscribers", "Connected detection WebSocket clients")
+BUS_QUEUED = metrics.gauge(
+    "detection_bus_queued_messages", "Updates waiting in client queues")
+BUS_DROPPED = metrics.counter(
+    "detection_bus_dropped_total", "Updates dropped because a client fell behind")
+
+DWELL_TRACKS = metrics.gauge(
+    "dwell_tracked_objects", "Tracks currently timed inside a zone", ["camera"])
+DWELL_EVICTED = metrics.counter(
+    "dwell_evicted_total", "Dwell entries dropped because the tracker hit max_tracks", ["camera"])
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, HTMLResponse
+import asyncio
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
@@ -9,63 +10,235 @@ import signal
 import threading
 import time
 from contextlib import asynccontextmanager
-from .camera_manager import CameraStream
+from .camera_manager import CameraStream, DEFAULT_DEVICE_CONFIG
+from .streaming import RENDITIONS, ffmpeg_available
+from .recorder import MUXER
+from .cluster import ClusterConfig, ClusterCoordinator, create_redis
 from .ai_processor import AIProcessor
+from .event_bus import DetectionBus
+from .startup import StartupTracker
+from src.core import metrics
 from pydantic import BaseModel
 from typing import List
 
 # Global State
-cameras = {}
+cameras = {} # Cameras running on this node
+camera_ids = [] # Every configured camera (some may run on other nodes)
+camera_sources = {}
+cluster = None # ClusterCoordinator when CLUSTER_REDIS_URL is set
 ai_processor = None
+detection_bus = DetectionBus()
+startup = StartupTracker()
+
+def load_camera_sources(path='cameras.json', perimeters_path='perimeters.json'):
+    """Returns {camera_id: source spec}; None means the default local device for that id."""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        sources = {}
+        for key, spec in data.items():
+            if isinstance(spec, dict) and "source" not in spec:
+                # Device settings only, e.g. {"width": 1920, "height": 1080}
+                spec = dict(DEFAULT_DEVICE_CONFIG, source=key, **spec) if spec else None
+            sources[str(key)] = spec
+        return sources
+    with open(perimeters_path, 'r') as f:
+        data = json.load(f)
+    return {key: None for key in data.keys() if key.isdigit()}
+
+def open_camera(cam_id, state=None):
+    print(f"Initializing Camera {cam_id}...")
+    cam = CameraStream(cam_id, ai_processor, bus=detection_bus, startup=startup, source=camera_sources.get(cam_id))
+    if state:
+        cam.resume(state) # Taking over from another node
+    return cam
+
+# Cluster callbacks: run on the event loop, so `cameras` is only changed there
+
+async def acquire_camera(cam_id, state):
+    cameras[cam_id] = await asyncio.to_thread(open_camera, cam_id, state)
+
+async def release_camera(cam_id):
+    cam = cameras.pop(cam_id, None)
+    if cam is None:
+        return None
+    state = await asyncio.to_thread(cam.handover_state)
+    await asyncio.to_thread(cam.stop)
+    return state
+
+async def camera_state(cam_id):
+    cam = cameras.get(cam_id)
+    return await asyncio.to_thread(cam.handover_state) if cam is not None else None
+
+def is_remote(camera_id):
+    """True when the camera runs on another node; its routes are proxied there."""
+    return cluster is not None and camera_id in camera_ids and camera_id not in cameras
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global ai_processor
-    ai_processor = AIProcessor()
+    global ai_processor, cluster
+    detection_bus.bind(asyncio.get_running_loop())
+    ai_processor = AIProcessor(startup=startup)
+
+    # Warm up the detector in the background; OCR stays unloaded until LPR is used
+    threading.Thread(target=ai_processor.load_detector, daemon=True).start()
     
-    # Load configured cameras from perimeters.json
+    # Load configured cameras: cameras.json maps camera ids to sources
+    # ({"gate": {"source": "rtsp://...", "width": 1920, "height": 1080}, "0": {}}).
+    # Without it, numeric keys in perimeters.json are opened as local devices.
+    # Each camera opens its source on its own thread, so they come up in parallel
     try:
-        with open('perimeters.json', 'r') as f:
-            data = json.load(f)
-            for key in data.keys():
-                if key.isdigit():
-                    cam_id = int(key)
-                    print(f"Initializing Camera {cam_id}...")
-                    cameras[cam_id] = CameraStream(cam_id, ai_processor)
+        camera_sources.update(load_camera_sources())
+        camera_ids[:] = list(camera_sources)
     except Exception as e:
         print(f"Error loading config: {e}")
+
+    cluster_config = ClusterConfig.from_env("CLUSTER_")
+    if cluster_config.enabled:
+        # Several nodes share the cameras through leases in Redis (see app/cluster.py)
+        cluster = ClusterCoordinator(create_redis(cluster_config.redis_url, timeout=cluster_config.heartbeat), cluster_config, camera_ids,
+                                     on_acquire=acquire_camera, on_release=release_camera, snapshot=camera_state)
+        await cluster.start()
+    else:
+        try:
+            for cam_id in camera_ids:
+                cameras[cam_id] = open_camera(cam_id)
+        except Exception as e:
+            print(f"Error loading config: {e}")
+
+    # Zone edits (dashboard or perimeters.json changed on disk) reach
+    # cameras and browser overlays without a restart
+    def on_zones_changed(snapshot, changed):
+        for cam_id in changed:
+            cam = cameras.get(cam_id)
+            if cam is not None:
+                cam.sync_zones()
+                detection_bus.publish(cam.zones_message())
+    ai_processor.store.subscribe(on_zones_changed)
     
     yield
     
     # Shutdown
     print("Shutting down cameras...")
+    if cluster is not None:
+        await cluster.stop() # Hands this node's cameras to the others
     for cam in cameras.values():
         cam.stop()
+    ai_processor.close() # Writes pending zone edits
+    if not MUXER.wait(timeout=30):
+        print("Some clips are still muxing; their parts are kept next to the recordings")
 
 app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request, "cameras": cameras.keys()})
+async def index(request: Request, rendition: str = "720p", stream: str = "mjpeg"):
+    # ?rendition=thumb for large grids, ?stream=fmp4 for H.264 instead of MJPEG
+    if rendition not in RENDITIONS:
+        rendition = "720p"
+    if stream == "fmp4" and not ffmpeg_available():
+        stream = "mjpeg"
+    return templates.TemplateResponse("index.html", {"request": request, "cameras": camera_ids,
+                                                     "rendition": rendition, "stream": stream})
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness per startup stage (detector, ocr, each camera) with timings.
+    Returns 503 until the detector is loaded and every camera finished opening.
+    """
+    report = startup.report()
+    pending = [name for name, stage in report["stages"].items() if stage["status"] in ("pending", "running")]
+    report["cameras"] = {cam_id: cam.status for cam_id, cam in cameras.items()}
+    report["ready"] = ai_processor is not None and ai_processor.detector_ready and not pending
+    if cluster is not None:
+        report["cluster"] = cluster.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
 
-def generate_frames(camera_id):
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint: per-camera fps, stage latencies, drops, queue depths."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+def generate_frames(camera_id, overlay=True, quality=80, rendition="720p", fps=None):
     cam = cameras.get(camera_id)
     if not cam:
         return
-    while True:
-        frame = cam.get_jpeg()
+    seq = 0
+    interval = 1.0 / fps if fps else 0
+    while not cam.stopped:
+        # One part per captured frame (optionally capped at fps), instead of re-encoding in a busy loop
+        seq = cam.wait_frame(seq)
+        frame = cam.get_jpeg(draw_overlays=overlay, quality=quality, rendition=rendition)
         if frame:
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        else:
-            pass # Wait for frame
+        if interval:
+            time.sleep(interval)
 
 @app.get("/video_feed/{camera_id}")
-async def video_feed(camera_id: int):
-    return StreamingResponse(generate_frames(camera_id), media_type="multipart/x-mixed-replace; boundary=frame")
+async def video_feed(request: Request, camera_id: str, overlay: bool = True, quality: int = Query(80, ge=10, le=95),
+                     rendition: str = "720p", fps: float | None = Query(None, gt=0, le=60)):
+    # overlay=false serves clean frames for clients drawing from /ws/detections.
+    # rendition=thumb with a low fps keeps grid views cheap on remote links
+    if is_remote(camera_id):
+        return await cluster.proxy(request, camera_id)
+    if rendition not in RENDITIONS:
+        return JSONResponse({"error": f"Unknown rendition, use one of {list(RENDITIONS)}"}, status_code=400)
+    return StreamingResponse(generate_frames(camera_id, overlay, quality, rendition, fps), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@app.get("/video_fmp4/{camera_id}")
+async def video_fmp4(request: Request, camera_id: str, rendition: str = "720p"):
+    """
+    H.264 in fragmented MP4, playable by a <video> element or MediaSource.
+    One encoder per camera and rendition is shared by all viewers; overlays
+    come from /ws/detections.
+    """
+    if is_remote(camera_id):
+        return await cluster.proxy(request, camera_id)
+    cam = cameras.get(camera_id)
+    if cam is None:
+        return JSONResponse({"error": "Camera not found"}, status_code=404)
+    if rendition not in RENDITIONS:
+        return JSONResponse({"error": f"Unknown rendition, use one of {list(RENDITIONS)}"}, status_code=400)
+    if not ffmpeg_available():
+        return JSONResponse({"error": "ffmpeg is not installed; use /video_feed"}, status_code=503)
+    stream = cam.fmp4_stream(rendition)
+    # Before the response starts, so a failed encoder start is a 503 and not a cut stream
+    try:
+        sub = await asyncio.to_thread(stream.subscribe)
+    except Exception as e:
+        return JSONResponse({"error": f"Encoder failed to start: {e}"}, status_code=503)
+    return StreamingResponse(stream.stream(sub), media_type="video/mp4",
+                             headers={"Cache-Control": "no-store"})
+
+@app.websocket("/ws/detections")
+async def detections_ws(websocket: WebSocket, camera_id: str | None = None, local: bool = False):
+    """
+    Pushes compact detection updates (and zone polygons) for one camera,
+    or for all cameras when camera_id is omitted. In a cluster, updates
+    of cameras on other nodes are relayed too (local=true: this node only).
+    """
+    await websocket.accept()
+    sub = detection_bus.subscribe(camera_id)
+    relay = None
+    if cluster is not None and not local and (camera_id is None or is_remote(camera_id)):
+        relay = cluster.relay_detections(sub, camera_id)
+    try:
+        # Initial zone state so overlays can be drawn before the first update
+        for cam_id, cam in cameras.items():
+            if camera_id is None or cam_id == camera_id:
+                await websocket.send_json(cam.zones_message())
+        while True:
+            await websocket.send_text(await sub.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if relay is not None:
+            relay.cancel()
+        detection_bus.unsubscribe(sub)
 
 @app.post("/shutdown")
 async def shutdown():
@@ -79,7 +252,9 @@ async def shutdown():
     return {"status": "Shutting down..."}
 
 @app.post("/camera/{camera_id}/{action}/{state}")
-async def control_camera(camera_id: int, action: str, state: str):
+async def control_camera(request: Request, camera_id: str, action: str, state: str):
+    if is_remote(camera_id):
+        return await cluster.proxy(request, camera_id)
     cam = cameras.get(camera_id)
     if not cam:
         return {"error": "Camera not found"}
@@ -106,16 +281,17 @@ async def control_camera(camera_id: int, action: str, state: str):
     return {"status": "ok", "action": action, "state": is_enabled}
 
 class ZoneUpdate(BaseModel):
-    type: str # "recording_zone" or "violation_zone"
+    type: str # Zone name, e.g. "recording_zone" or "violation_zone"
     points: List[List[float]] # Normalized coordinates [[0.1, 0.1], ...]
 
 @app.post("/camera/{camera_id}/update_zone")
-async def update_zone(camera_id: int, zone_data: ZoneUpdate):
+async def update_zone(request: Request, camera_id: str, zone_data: ZoneUpdate):
+    if is_remote(camera_id):
+        # The owner applies it at once; other nodes reload the shared perimeters.json
+        return await cluster.proxy(request, camera_id)
     try:
+        # Cameras and overlays are updated by the store listener; the file is written in the background
         ai_processor.update_perimeter(camera_id, zone_data.type, zone_data.points)
-        # Update the camera's local cache of zones immediately
-        if camera_id in cameras:
-            cameras[camera_id].latest_zones = ai_processor.perimeters.get(str(camera_id), {})
         return {"status": "ok"}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,185 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+class PerimeterStore:
+    """
+    Zone configuration (perimeters.json) shared by the API and camera threads.
+
+    Readers take store.snapshot, a dict that is never mutated after it is
+    published: edits build a new dict and swap the reference, so camera
+    threads never see a half-applied change and never take a lock.
+
+    Edits are persisted by a background writer after a short debounce
+    (bursts of edits become one write), through a temp file and os.replace
+    so the file on disk is always complete. A watcher polls the file's
+    mtime and reloads edits made by other processes or by hand.
+    """
+
+    def __init__(self, path='perimeters.json', debounce=0.5, poll_interval=1.0, watch=True):
+        self.path = path
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.snapshot = {}
+        self.listeners = []
+        self._lock = threading.Lock() # Serializes writers of the snapshot
+        self._pending = False # Edits not yet written
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._file_state = None # (mtime_ns, size) of the last file we read or wrote
+        self._io_lock = threading.Lock()
+        self._notify_lock = threading.Lock()
+
+        self.load()
+        self._writer = threading.Thread(target=self._write_loop, name="perimeters-writer", daemon=True)
+        self._writer.start()
+        self._watcher = None
+        if watch:
+            self._watcher = threading.Thread(target=self._watch_loop, name="perimeters-watcher", daemon=True)
+            self._watcher.start()
+
+    # Reading
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def load(self):
+        """(Re)reads the file; keeps the current snapshot if it is missing or invalid."""
+        with self._io_lock:
+            state = self._stat()
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                self._file_state = state
+                return False
+            except (OSError, ValueError) as e:
+                # Remember the broken version so it is reported once, not every poll
+                self._file_state = state
+                print(f"Error loading perimeters: {e}")
+                return False
+            self._file_state = state
+        # Camera ID keys -> {zone name: point list or rule dict}
+        snapshot = {str(key): val for key, val in data.items() if isinstance(val, dict)}
+        with self._lock:
+            changed = {key for key in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(key) != self.snapshot.get(key)}
+            self.snapshot = snapshot
+        if changed:
+            self._notify(changed)
+        return True
+
+    def get(self, camera_id):
+        return self.snapshot.get(str(camera_id), {})
+
+    # Editing
+
+    def subscribe(self, listener):
+        """listener(snapshot, changed_camera_ids) runs after every swap, on the editing/watcher thread."""
+        self.listeners.append(listener)
+
+    def _notify(self, changed):
+        # Serialized, and reading the snapshot inside the lock, so listeners
+        # always finish on the newest config even when edits race
+        with self._notify_lock:
+            snapshot = self.snapshot
+            for listener in list(self.listeners):
+                try:
+                    listener(snapshot, changed)
+                except Exception as e:
+                    print(f"Error applying perimeters: {e}")
+
+    def set_camera(self, camera_id, zones, persist=True):
+        camera_key = str(camera_id)
+        with self._lock:
+            snapshot = dict(self.snapshot)
+            snapshot[camera_key] = zones
+            self.snapshot = snapshot
+        if persist:
+            self._mark_pending()
+        self._notify({camera_key})
+
+    def update_zone(self, camera_id, zone_name, update):
+        """
+        Replaces one zone with update(current_spec_or_None) and returns the
+        new spec. Concurrent edits to the same camera are applied in order.
+        """
+        camera_key = str(camera_id)
+        with self._lock:
+            zones = dict(self.snapshot.get(camera_key, {}))
+            zones[zone_name] = spec = update(zones.get(zone_name))
+            snapshot = dict(self.snapshot)
+            snapshot[camera_key] = zones
+            self.snapshot = snapshot
+        self._mark_pending()
+        self._notify({camera_key})
+        return spec
+
+    def _mark_pending(self):
+        self._pending = True
+        self._wake.set()
+
+    # Persistence
+
+    def save(self):
+        """Writes the current snapshot atomically (temp file in the same directory + rename)."""
+        snapshot = self.snapshot
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._io_lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=".perimeters-", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(snapshot, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            # Our own write must not look like an external edit to the watcher
+            self._file_state = self._stat()
+
+    def _write_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait()
+            # Let a burst of edits settle before writing
+            if self._stopped.wait(self.debounce):
+                break # close() flushes
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error saving perimeters: {e}")
+
+    def _watch_loop(self):
+        while not self._stopped.wait(self.poll_interval):
+            if self._pending:
+                continue # Unsaved local edits win over the file
+            state = self._stat()
+            if state is not None and state != self._file_state:
+                # Wait until the writer (editor, deploy script) has finished
+                time.sleep(0.1)
+                if self._stat() == state and self.load():
+                    print(f"Reloaded {self.path}")
+
+    def flush(self):
+        if self._pending:
+            self._pending = False
+            self.save()
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        self._writer.join(timeout=5)
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+        self.flush()
@@ -0,0 +1,367 @@
+"""
+Event clip recording with audio.
+
+Frames and audio blocks carry their capture time (time.time(), the same
+clock as VideoSource). The clip writer places each frame at
+round((t - clip_start) * fps), repeating or dropping frames so the file
+plays at real speed even when the camera delivers fewer or more frames
+than its nominal rate. Audio is padded or trimmed against the same clip
+start, so both tracks line up without post-processing.
+
+With ffmpeg on the PATH, video is encoded by a subprocess into short
+MPEG-TS segments and audio streamed to a WAV file, both in a
+<clip>.parts/ directory. When the clip ends a background worker muxes
+them into <clip>.mp4 with video stream copy (only the audio is encoded,
+to AAC), so a clip is ready a few seconds after the event ends. Nothing
+holds more than a few frames or audio blocks in memory, whatever the
+clip length.
+
+Without ffmpeg, clips fall back to cv2.VideoWriter (.avi) with the audio
+beside it as .wav.
+"""
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+from datetime import datetime
+import cv2
+from .streaming import ffmpeg_available
+
+class AudioCapture:
+    """
+    Microphone input for one camera (sounddevice, optional). Blocks are
+    timestamped in the PortAudio callback and fanned out to the active
+    clips; a short pre-roll ring covers the gap between an event and the
+    clip subscribing.
+    """
+
+    def __init__(self, device=None, samplerate=48000, channels=1, blocksize=1024, preroll=1.0):
+        self.device = device
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.stream = None
+        self.subscribers = set()
+        self._ring = deque(maxlen=max(1, int(preroll * samplerate / blocksize)))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec):
+        """cameras.json "audio" value: true, a device index/name, or {"device": ..., "samplerate": ...}."""
+        if spec is None or spec is False:
+            return None
+        if spec is True:
+            return cls()
+        if isinstance(spec, dict):
+            return cls(**spec)
+        return cls(device=spec)
+
+    @property
+    def running(self):
+        return self.stream is not None
+
+    def start(self):
+        try:
+            import sounddevice as sd
+        except ImportError:
+            print("sounddevice is not installed; recording without audio")
+            return False
+        try:
+            self.stream = sd.InputStream(device=self.device, samplerate=self.samplerate, channels=self.channels,
+                                         dtype="int16", blocksize=self.blocksize, callback=self._callback)
+            self.stream.start()
+        except Exception as e:
+            print(f"Error opening audio device {self.device}: {e}")
+            self.stream = None
+            return False
+        return True
+
+    def _callback(self, indata, frames, time_info, status):
+        # Time of the block's first sample: now minus its length and the input latency
+        latency = self.stream.latency if self.stream is not None else 0.0
+        block = (time.time() - frames / self.samplerate - latency, indata.tobytes())
+        with self._lock:
+            self._ring.append(block)
+            for sub in self.subscribers:
+                sub.offer_audio(block)
+
+    def subscribe(self, sub):
+        """Adds a clip; it first receives the pre-roll blocks."""
+        with self._lock:
+            for block in self._ring:
+                sub.offer_audio(block)
+            self.subscribers.add(sub)
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subscribers.discard(sub)
+
+    def close(self):
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+
+class MuxWorker:
+    """Single background thread that turns finished clip parts into .mp4 files."""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, parts_dir, output, has_audio):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="clip-muxer", daemon=True)
+                self._thread.start()
+        self.jobs.put((parts_dir, output, has_audio))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self.mux(*job)
+            except Exception as e:
+                print(f"Error muxing {job[1]}: {e}")
+            finally:
+                self.jobs.task_done()
+
+    @staticmethod
+    def mux(parts_dir, output, has_audio):
+        playlist = os.path.join(parts_dir, "video.ffconcat")
+        if not os.path.exists(playlist):
+            print(f"No video segments in {parts_dir}")
+            return
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", playlist]
+        if has_audio:
+            command += ["-i", os.path.join(parts_dir, "audio.wav"), "-map", "0:v", "-map", "1:a",
+                        "-c:a", "aac", "-b:a", "128k"]
+        # Temp name keeps half-written files out of sight of anything watching the directory
+        tmp = output + ".tmp.mp4"
+        command += ["-c:v", "copy", "-movflags", "+faststart", tmp]
+        start = time.monotonic()
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            print(f"Mux failed for {output}, parts kept in {parts_dir}: {result.stderr.decode(errors='replace').strip()}")
+            return
+        os.replace(tmp, output)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        print(f"Saved {output} ({time.monotonic() - start:.1f}s to mux)")
+
+    def wait(self, timeout=None):
+        """Blocks until queued clips are muxed or timeout (seconds) passes; True if all finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.jobs.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+MUXER = MuxWorker()
+
+class ClipRecorder:
+    """
+    One event clip. write() is called from the capture thread and never
+    blocks: frames go through a small queue to a writer thread, and frames
+    dropped when it is full are filled in by repeating the previous one.
+    close() returns immediately; the writer drains, finishes the files and
+    hands them to MUXER.
+    """
+
+    def __init__(self, camera_id, fps, size, audio=None, directory=".", segment_seconds=10,
+                 queue_size=8, use_ffmpeg=None,
+                 video_codec=("-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-pix_fmt", "yuv420p")):
+        self.camera_id = camera_id
+        self.fps = float(fps)
+        self.size = size # (width, height)
+        self.segment_seconds = segment_seconds
+        self.video_codec = list(video_codec)
+        self.use_ffmpeg = ffmpeg_available() if use_ffmpeg is None else use_ffmpeg
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.base = os.path.join(directory, f"recording_cam{camera_id}_{timestamp}")
+        self.filename = self.base + (".mp4" if self.use_ffmpeg else ".avi")
+        self.parts_dir = self.base + ".parts"
+
+        self.start_time = None # Capture time of the first frame
+        self.frames_written = 0
+        self.frames_repeated = 0
+        self.frames_dropped = 0
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._started = threading.Event()
+
+        self.audio = audio if audio is not None and audio.running else None
+        self._audio_blocks = queue.Queue(maxsize=256)
+        self._wav = None
+        self._audio_ended = False # Sentinel consumed
+        self.samples_written = 0
+
+        if self.use_ffmpeg:
+            os.makedirs(self.parts_dir, exist_ok=True)
+        self._writer = threading.Thread(target=self._video_loop, name=f"clip-video-{camera_id}", daemon=True)
+        self._writer.start()
+        self._audio_writer = None
+        if self.audio is not None:
+            self._audio_writer = threading.Thread(target=self._audio_loop, name=f"clip-audio-{camera_id}", daemon=True)
+            self._audio_writer.start()
+            self.audio.subscribe(self)
+
+    # Capture side
+
+    def write(self, frame, timestamp=None):
+        if self._closed:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        try:
+            self._frames.put_nowait((frame, timestamp))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def offer_audio(self, block):
+        try:
+            self._audio_blocks.put_nowait(block)
+        except queue.Full:
+            pass # The gap is padded with silence
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.audio is not None:
+            self.audio.unsubscribe(self)
+        self._frames.put((None, None))
+
+    # Video
+
+    def _open_video(self, frame):
+        height, width = frame.shape[:2]
+        if not self.use_ffmpeg:
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            return cv2.VideoWriter(self.filename, fourcc, self.fps, (width, height))
+        gop = max(1, int(round(self.fps)))
+        command = [
+            "ffmpeg", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{self.fps:g}", "-i", "-",
+            *self.video_codec, "-g", str(gop),
+            # Segments cut on keyframes; the playlist is what the muxer concatenates
+            "-f", "segment", "-segment_time", str(self.segment_seconds), "-segment_format", "mpegts",
+            "-segment_list", os.path.join(self.parts_dir, "video.ffconcat"), "-segment_list_type", "ffconcat",
+            os.path.join(self.parts_dir, "video_%04d.ts"),
+        ]
+        return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def _video_loop(self):
+        out = None
+        last = None
+        try:
+            while True:
+                frame, timestamp = self._frames.get()
+                if frame is None:
+                    break
+                if out is None:
+                    self.start_time = timestamp
+                    self._started.set()
+                    out = self._open_video(frame)
+                # Slot for this frame on the clip's constant-rate timeline
+                slot = int(round((timestamp - self.start_time) * self.fps))
+                if slot < self.frames_written:
+                    continue # Camera ahead of its nominal rate
+                while self.frames_written < slot and last is not None:
+                    self._write_frame(out, last)
+                    self.frames_repeated += 1
+                self._write_frame(out, frame)
+                last = frame
+        except (BrokenPipeError, OSError) as e:
+            print(f"Cam {self.camera_id}: error writing {self.filename}: {e}")
+        finally:
+            self._started.set()
+            self._finish_video(out)
+
+    def _write_frame(self, out, frame):
+        if self.use_ffmpeg:
+            out.stdin.write(frame.tobytes())
+        else:
+            out.write(frame)
+        self.frames_written += 1
+
+    def _finish_video(self, out):
+        if out is not None:
+            if self.use_ffmpeg:
+                try:
+                    out.stdin.close()
+                except OSError:
+                    pass
+                out.wait()
+            else:
+                out.release()
+        if self._audio_writer is not None:
+            # _audio_loop drains until this sentinel, so neither call should
+            # wait long; the timeouts only guard against a wedged audio thread
+            try:
+                self._audio_blocks.put(None, timeout=5)
+            except queue.Full:
+                pass
+            self._audio_writer.join(timeout=5)
+            if self._audio_writer.is_alive():
+                print(f"Cam {self.camera_id}: audio writer did not finish, saving {self.filename} without audio")
+                self._wav = None
+        duration = self.frames_written / self.fps
+        print(f"Cam {self.camera_id}: Finished {self.filename} ({duration:.1f}s, "
+              f"{self.frames_repeated} repeated, {self.frames_dropped} dropped frames)")
+        if self.use_ffmpeg:
+            if out is None:
+                shutil.rmtree(self.parts_dir, ignore_errors=True)
+            else:
+                MUXER.submit(self.parts_dir, self.filename, self._wav is not None)
+
+    # Audio
+
+    def _audio_loop(self):
+        try:
+            self._write_audio()
+        except Exception as e:
+            print(f"Cam {self.camera_id}: error writing audio for {self.filename}: {e}")
+            self._wav = None
+        finally:
+            if not self._audio_ended:
+                # _finish_video puts the sentinel on this bounded queue
+                while self._audio_blocks.get() is not None:
+                    pass
+
+    def _write_audio(self):
+        audio = self.audio
+        rate = audio.samplerate
+        frame_bytes = 2 * audio.channels
+        tolerance = int(0.02 * rate) # Jitter below 20 ms is left alone
+        path = os.path.join(self.parts_dir, "audio.wav") if self.use_ffmpeg else self.base + ".wav"
+        self._started.wait()
+        if self.start_time is None:
+            return # No video was written
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(audio.channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            self._wav = path
+            while True:
+                block = self._audio_blocks.get()
+                if block is None:
+                    self._audio_ended = True
+                    break
+                timestamp, data = block
+                expected = int(round((timestamp - self.start_time) * rate))
+                drift = expected - self.samples_written
+                if drift > tolerance:
+                    # Missing audio (dropped blocks, device hiccup): silence
+                    wav.writeframes(bytes(drift * frame_bytes))
+                    self.samples_written += drift
+                elif drift < -tolerance:
+                    # Overlap (pre-roll before the clip start): drop the early part
+                    data = data[-drift * frame_bytes:]
+                wav.writeframes(data)
+                self.samples_written += len(data) // frame_bytes
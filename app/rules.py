@@ -0,0 +1,300 @@
+"""
+Zone rules compiled per camera.
+
+perimeters.json maps camera ids to named zones. A zone is either a bare
+point list (the original format) or a rule dict:
+
+    "0": {
+        "recording_zone": [[152, 153], [164, 959], ...],
+        "loading_bay": {
+            "points": [[100, 100], [900, 100], [900, 700], [100, 700]],
+            "type": "dwell",            # presence | dwell | line
+            "threshold": 30,            # dwell seconds (default: the camera's threshold)
+            "classes": ["car", "truck"],
+            "schedule": [{"days": ["mon", "tue", "wed", "thu", "fri"], "start": "22:00", "end": "06:00"}],
+            "action": "violation"       # record | violation | alert
+        },
+        "gate_line": {"points": [[1800, 0], [1800, 2160]], "type": "line", "direction": "forward", "action": "alert"}
+    }
+
+recording_zone and violation_zone keep their meaning (presence -> record,
+dwell -> violation). Points are in 4K (3840x2160) coordinates. A line
+rule fires when a track's center crosses it between two frames; "forward"
+is from the left of the first->last point direction to its right as seen
+on screen, "backward" the reverse.
+
+Each camera's rules are compiled into a CameraPlan with a coarse grid over
+the frame: a detection is only tested against the rules whose bounding
+box overlaps its grid cell, so per-frame cost follows the number of
+objects near zones rather than the number of zones.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+import numpy as np
+from .detections import points_in_polygon, polygon_edges
+
+ZONE_TYPES = ("presence", "dwell", "line")
+ACTIONS = ("record", "violation", "alert")
+DIRECTIONS = ("any", "forward", "backward")
+
+# Original zone names and the rules they stand for
+LEGACY_ZONES = {
+    "recording_zone": {"type": "presence", "action": "record"},
+    "violation_zone": {"type": "dwell", "action": "violation"},
+}
+
+# COCO classes kept by the tracker: person, bicycle, car, motorcycle, bus, truck
+DEFAULT_CLASSES = (0, 1, 2, 3, 5, 7)
+
+CLASS_NAMES = {
+    "person": 0, "bicycle": 1, "car": 2, "motorcycle": 3, "bus": 5, "truck": 7,
+    "cat": 15, "dog": 16, "backpack": 24, "handbag": 26, "suitcase": 28,
+}
+
+DAY_NAMES = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+def _minutes(value):
+    hours, minutes = str(value).split(":")
+    return int(hours) * 60 + int(minutes)
+
+@dataclass(frozen=True)
+class Schedule:
+    days: frozenset # 0 = Monday
+    start: int # Minutes since midnight; end < start spans midnight
+    end: int
+
+    @classmethod
+    def parse(cls, spec):
+        days = spec.get("days")
+        if days is None:
+            days = range(7)
+        days = frozenset(DAY_NAMES[d.lower()[:3]] if isinstance(d, str) else int(d) for d in days)
+        return cls(days, _minutes(spec.get("start", "00:00")), _minutes(spec.get("end", "24:00")))
+
+    def active(self, moment):
+        minutes = moment.hour * 60 + moment.minute
+        weekday = moment.weekday()
+        if self.start <= self.end:
+            return weekday in self.days and self.start <= minutes < self.end
+        # Overnight window: the part after midnight belongs to the previous day
+        return ((weekday in self.days and minutes >= self.start)
+                or ((weekday - 1) % 7 in self.days and minutes < self.end))
+
+@dataclass
+class Rule:
+    name: str
+    type: str
+    action: str
+    points: np.ndarray # (M, 2) float64, 4K coordinates
+    classes: np.ndarray
+    threshold: float | None = None # dwell rules; None = camera default
+    direction: str = "any" # line rules
+    schedules: list = field(default_factory=list)
+    edges: tuple | None = None # Precomputed polygon edges (presence/dwell)
+
+    @property
+    def bbox(self):
+        x1, y1 = self.points.min(axis=0)
+        x2, y2 = self.points.max(axis=0)
+        return x1, y1, x2, y2
+
+    def active(self, moment):
+        return not self.schedules or any(s.active(moment) for s in self.schedules)
+
+def parse_rule(name, spec):
+    """Builds a Rule from a zone entry (point list or rule dict); raises ValueError if invalid."""
+    if not isinstance(spec, dict):
+        spec = {"points": spec}
+    defaults = LEGACY_ZONES.get(name, {"type": "presence", "action": "alert"})
+    zone_type = spec.get("type", defaults["type"])
+    action = spec.get("action", defaults["action"])
+    direction = spec.get("direction", "any")
+    if zone_type not in ZONE_TYPES:
+        raise ValueError(f"Zone {name}: unknown type {zone_type!r}")
+    if action not in ACTIONS:
+        raise ValueError(f"Zone {name}: unknown action {action!r}")
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Zone {name}: unknown direction {direction!r}")
+
+    points = np.asarray(spec.get("points", []), dtype=np.float64).reshape(-1, 2)
+    if len(points) < (2 if zone_type == "line" else 3):
+        raise ValueError(f"Zone {name}: not enough points for a {zone_type} zone")
+
+    classes = spec.get("classes") or DEFAULT_CLASSES
+    classes = np.array([CLASS_NAMES[c] if isinstance(c, str) else int(c) for c in classes], dtype=np.int16)
+    schedules = [Schedule.parse(s) for s in spec.get("schedule", [])]
+    threshold = spec.get("threshold")
+    edges = None if zone_type == "line" else polygon_edges(points)
+    return Rule(name, zone_type, action, points, classes,
+                None if threshold is None else float(threshold), direction, schedules, edges)
+
+@dataclass
+class RuleHit:
+    rule: str
+    action: str
+    track_ids: list
+
+@dataclass
+class Evaluation:
+    recording_trigger: bool = False
+    violation_alert: bool = False
+    hits: list = field(default_factory=list)
+
+class CameraPlan:
+    def __init__(self, rules, width=3840, height=2160, grid=(64, 36), track_ttl=2.0, max_tracks=10000):
+        self.rules = rules
+        self.width, self.height = width, height
+        self.grid = grid
+        self.cell_w = width / grid[0]
+        self.cell_h = height / grid[1]
+        self.classes = sorted(set(DEFAULT_CLASSES).union(*(r.classes.tolist() for r in rules)))
+        self.has_lines = any(r.type == "line" for r in rules)
+        self.has_dwell = any(r.type == "dwell" for r in rules)
+
+        # Line rules are matched by motion segment, not grid cell: a fast
+        # track can jump over the line's cells between two frames
+        self.line_index = np.array([j for j, r in enumerate(rules) if r.type == "line"], dtype=np.int64)
+        self.line_bboxes = np.array([rules[j].bbox for j in self.line_index], dtype=np.float64).reshape(-1, 4)
+
+        # classes x rules filter, so class checks fold into the candidate mask
+        self.class_table = np.zeros((max(self.classes) + 1, len(rules)), dtype=bool)
+        for j, rule in enumerate(rules):
+            self.class_table[rule.classes, j] = True
+
+        # cells x rules membership by rule bounding box
+        self.cells = np.zeros((grid[0] * grid[1], len(rules)), dtype=bool)
+        for j, rule in enumerate(rules):
+            x1, y1, x2, y2 = rule.bbox
+            cx1, cx2 = self._cell(x1, grid[0], self.cell_w), self._cell(x2, grid[0], self.cell_w)
+            cy1, cy2 = self._cell(y1, grid[1], self.cell_h), self._cell(y2, grid[1], self.cell_h)
+            for cy in range(cy1, cy2 + 1):
+                self.cells[cy * grid[0] + cx1:cy * grid[0] + cx2 + 1, j] = True
+
+        # Line rules need each track's previous center
+        self.track_ttl = track_ttl
+        self.max_tracks = max_tracks
+        self._positions = OrderedDict() # track_id -> (x, y, last_seen)
+
+    @staticmethod
+    def _cell(value, count, size):
+        return min(max(int(value // size), 0), count - 1)
+
+    @classmethod
+    def compile(cls, zones, **kwargs):
+        """Compiles a camera's zone config ({name: points or rule dict}); invalid zones are skipped."""
+        rules = []
+        for name, spec in zones.items():
+            try:
+                rules.append(parse_rule(name, spec))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping zone {name}: {e}")
+        return cls(rules, **kwargs)
+
+    def cell_index(self, points):
+        ix = np.clip((points[:, 0] // self.cell_w).astype(np.int64), 0, self.grid[0] - 1)
+        iy = np.clip((points[:, 1] // self.cell_h).astype(np.int64), 0, self.grid[1] - 1)
+        return iy * self.grid[0] + ix
+
+    def _segment_candidates(self, previous, current):
+        """(N, lines) mask of tracks whose previous->current segment bbox overlaps each line's bbox."""
+        lo = np.minimum(previous, current)[:, None, :]
+        hi = np.maximum(previous, current)[:, None, :]
+        boxes = self.line_bboxes[None, :, :]
+        return ((lo[..., 0] <= boxes[..., 2]) & (hi[..., 0] >= boxes[..., 0])
+                & (lo[..., 1] <= boxes[..., 3]) & (hi[..., 1] >= boxes[..., 1]))
+
+    def _previous_points(self, track_ids, points):
+        """Previous centers for the given tracks (current center when unseen)."""
+        positions = self._positions
+        previous = points.copy()
+        for i, track_id in enumerate(track_ids.tolist()):
+            last = positions.get(track_id)
+            if last is not None:
+                previous[i, 0], previous[i, 1] = last[0], last[1]
+        return previous
+
+    def _remember(self, track_ids, points, now):
+        positions = self._positions
+        for track_id, (x, y) in zip(track_ids.tolist(), points.tolist()):
+            positions[track_id] = (x, y, now)
+            positions.move_to_end(track_id)
+        cutoff = now - self.track_ttl
+        while positions and (len(positions) > self.max_tracks or next(iter(positions.values()))[2] < cutoff):
+            positions.popitem(last=False)
+
+    def _crossings(self, rule, previous, current):
+        """Mask of tracks whose motion segment crosses the line, honoring direction."""
+        a = rule.points[:-1][None, :, :] # (1, S, 2) segment starts
+        b = rule.points[1:][None, :, :]
+        p = previous[:, None, :] # (N, 1, 2)
+        q = current[:, None, :]
+
+        def cross(o, u, v):
+            return (u[..., 0] - o[..., 0]) * (v[..., 1] - o[..., 1]) - (u[..., 1] - o[..., 1]) * (v[..., 0] - o[..., 0])
+
+        side_p = cross(a, b, p)
+        side_q = cross(a, b, q)
+        crossed = (side_p * side_q < 0) & (cross(p, q, a) * cross(p, q, b) < 0)
+        if rule.direction == "forward":
+            crossed &= side_p < 0
+        elif rule.direction == "backward":
+            crossed &= side_p > 0
+        return crossed.any(axis=1)
+
+    def evaluate(self, detections, points, dwell, now=None, moment=None,
+                 enabled_actions=ACTIONS, default_threshold=0.0):
+        """
+        Applies every active rule to one frame. points are the detections'
+        centers in 4K coordinates. Fills detections["violation"] and
+        ["duration"] in place.
+        """
+        if now is None:
+            now = time.monotonic()
+        if moment is None:
+            moment = datetime.now()
+        result = Evaluation()
+        if not len(detections) or not self.rules:
+            return result
+
+        track_ids = detections["id"]
+        candidates = self.cells[self.cell_index(points)]
+        previous = None
+        if self.has_lines:
+            previous = self._previous_points(track_ids, points)
+            candidates[:, self.line_index] = self._segment_candidates(previous, points)
+            self._remember(track_ids, points, now)
+        # Detections are already filtered to self.classes
+        candidates &= self.class_table[detections["cls"]]
+
+        for j in np.flatnonzero(candidates.any(axis=0)).tolist():
+            rule = self.rules[j]
+            if rule.action not in enabled_actions or not rule.active(moment):
+                continue
+            index = np.flatnonzero(candidates[:, j])
+
+            if rule.type == "line":
+                hit = self._crossings(rule, previous[index], points[index])
+            else:
+                hit = points_in_polygon(points[index], rule.points, rule.edges)
+                if rule.type == "dwell":
+                    dwell.thresholds[rule.name] = default_threshold if rule.threshold is None else rule.threshold
+                    durations, hit = dwell.update(rule.name, track_ids[index], hit, now)
+                    detections["duration"][index] = np.maximum(detections["duration"][index], durations)
+            if not hit.any():
+                continue
+
+            hit_index = index[hit]
+            result.hits.append(RuleHit(rule.name, rule.action, track_ids[hit_index].tolist()))
+            if rule.action == "record":
+                result.recording_trigger = True
+            elif rule.action == "violation":
+                detections["violation"][hit_index] = True
+                result.violation_alert = True
+
+        if self.has_dwell:
+            # Tracks seen this frame outside a dwell zone's candidates (or in
+            # an inactive rule) were not updated above; they left the zone
+            dwell.reset_stale(track_ids, now)
+        return result
@@ -0,0 +1,63 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupTracker:
+    """
+    Records the state and duration of each startup component (models,
+    cameras, ...) so readiness can be reported while things load in the
+    background.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, status="pending"):
+        with self.lock:
+            self.stages.setdefault(name, {"status": status, "started_at": None, "duration": None, "error": None})
+
+    def start(self, name):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"status": "pending", "started_at": None, "duration": None, "error": None})
+            stage["status"] = "running"
+            stage["started_at"] = time.perf_counter() - self.t0
+
+    def finish(self, name, error=None):
+        with self.lock:
+            stage = self.stages[name]
+            stage["duration"] = time.perf_counter() - self.t0 - stage["started_at"]
+            stage["status"] = "failed" if error else "ready"
+            stage["error"] = str(error) if error else None
+            duration = stage["duration"]
+        status = "failed" if error else "ready"
+        print(f"Startup: {name} {status} in {duration:.2f}s")
+
+    @contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        except Exception as e:
+            self.finish(name, error=e)
+            raise
+        self.finish(name)
+
+    def status(self, name):
+        with self.lock:
+            stage = self.stages.get(name)
+            return stage["status"] if stage else None
+
+    def report(self):
+        with self.lock:
+            stages = {
+                name: {
+                    "status": s["status"],
+                    "started_at": round(s["started_at"], 3) if s["started_at"] is not None else None,
+                    "duration": round(s["duration"], 3) if s["duration"] is not None else None,
+                    "error": s["error"],
+                }
+                for name, s in self.stages.items()
+            }
+        return {"uptime": round(time.perf_counter() - self.t0, 3), "stages": stages}
@@ -0,0 +1,225 @@
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+# Display renditions: (width, height); None keeps the captured resolution
+RENDITIONS = {"thumb": (320, 180), "720p": (1280, 720), "native": None}
+
+# Target bitrates for the encoded (fMP4) streams
+FMP4_BITRATES = {"thumb": "150k", "720p": "1200k", "native": "4000k"}
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+class FMP4Subscription:
+    def __init__(self, init_segment, queue_size=8):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.init_segment = init_segment
+        self.dropped = 0
+
+    def offer(self, fragment):
+        # Every fragment starts on a keyframe, so a slow viewer can skip
+        # whole fragments and keep decoding
+        while True:
+            try:
+                self.queue.put_nowait(fragment)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+class _InitSegment:
+    """ftyp+moov of one ffmpeg process; ready is set once known, with data None if the process ended first."""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.data = None
+
+class FMP4Stream:
+    """
+    One H.264 encoder per camera and rendition, shared by all its viewers.
+
+    Frames are piped into ffmpeg as raw BGR and come back as fragmented MP4
+    (empty moov + one moof/mdat per keyframe interval). New viewers get the
+    init segment and join at the next fragment. The encoder stops when the
+    last viewer has been gone for idle_timeout seconds.
+    """
+
+    def __init__(self, camera, rendition="720p", fps=15, bitrate=None, gop_seconds=1.0, idle_timeout=10.0):
+        self.camera = camera
+        self.rendition = rendition
+        self.fps = fps
+        self.bitrate = bitrate or FMP4_BITRATES.get(rendition, "1200k")
+        self.gop_seconds = gop_seconds
+        self.idle_timeout = idle_timeout
+        self.subscribers = set()
+        self.proc = None
+        self.running = False
+        self._lock = threading.Lock()
+        self._init = None # _InitSegment of the running process
+        self._last_viewer = time.monotonic()
+
+    # Encoder lifecycle
+
+    def _command(self, width, height):
+        gop = max(1, int(self.fps * self.gop_seconds))
+        return [
+            "ffmpeg", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency", "-pix_fmt", "yuv420p",
+            "-profile:v", "main", "-b:v", self.bitrate, "-maxrate", self.bitrate, "-bufsize", self.bitrate,
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0", "-bf", "0",
+            "-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+            "-",
+        ]
+
+    def _start(self):
+        # Size of the rendition decides the encoder input size
+        seq = self.camera.wait_frame(0, timeout=5.0)
+        _, image = self.camera.get_rendition(self.rendition)
+        if not seq or image is None:
+            raise RuntimeError(f"Camera {self.camera.camera_id} has no frames")
+        height, width = image.shape[:2]
+        self.proc = subprocess.Popen(self._command(width, height), stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, bufsize=0)
+        self.running = True
+        # Per process, so a previous reader finishing late cannot touch it
+        self._init = _InitSegment()
+        threading.Thread(target=self._feed, args=(self.proc, (width, height)), daemon=True).start()
+        threading.Thread(target=self._read, args=(self.proc, self._init), daemon=True).start()
+        print(f"Cam {self.camera.camera_id}: fMP4 {self.rendition} encoder started ({width}x{height} @ {self.bitrate})")
+
+    def _stop(self):
+        self.running = False
+        proc, self.proc = self.proc, None
+        self._init = None
+        if proc is not None:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            print(f"Cam {self.camera.camera_id}: fMP4 {self.rendition} encoder stopped")
+
+    def _feed(self, proc, size):
+        interval = 1.0 / self.fps
+        next_time = time.monotonic()
+        image = None
+        while self.running and proc is self.proc:
+            if not self.subscribers and time.monotonic() - self._last_viewer > self.idle_timeout:
+                with self._lock:
+                    if not self.subscribers:
+                        self._stop()
+                        return
+            # Constant output rate: repeat the last frame if the camera stalls
+            _, latest = self.camera.get_rendition(self.rendition)
+            if latest is not None and (latest.shape[1], latest.shape[0]) == size:
+                image = latest
+            if image is not None:
+                try:
+                    proc.stdin.write(image.tobytes())
+                except (BrokenPipeError, ValueError, OSError):
+                    break
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+        with self._lock:
+            if proc is self.proc:
+                self._stop()
+
+    def _read(self, proc, init):
+        """Splits ffmpeg's output into MP4 boxes: ftyp+moov is the init segment, moof+mdat a fragment."""
+        header = b""
+        pending = b""
+        stdout = proc.stdout
+        while True:
+            head = _read_exact(stdout, 8)
+            if head is None:
+                break
+            size = int.from_bytes(head[:4], "big")
+            box_type = head[4:8]
+            if size == 1:
+                extended = _read_exact(stdout, 8)
+                if extended is None:
+                    break
+                head += extended
+                size = int.from_bytes(extended, "big")
+            body = _read_exact(stdout, size - len(head))
+            if body is None:
+                break
+            box = head + body
+
+            if box_type in (b"ftyp", b"moov"):
+                header += box
+                if box_type == b"moov":
+                    init.data = header
+                    init.ready.set()
+            elif box_type == b"moof":
+                pending = box
+            elif box_type == b"mdat" and pending:
+                fragment, pending = pending + box, b""
+                for sub in list(self.subscribers):
+                    sub.offer(fragment)
+        init.ready.set()
+
+    # Viewers
+
+    def subscribe(self, timeout=10.0):
+        with self._lock:
+            if not self.running:
+                self._start()
+            init = self._init
+        if not init.ready.wait(timeout) or init.data is None:
+            raise RuntimeError("Encoder did not produce an init segment")
+        sub = FMP4Subscription(init.data)
+        with self._lock:
+            if self._init is not init:
+                # Fragments of a new process do not match this init segment
+                raise RuntimeError("Encoder stopped while starting")
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subscribers.discard(sub)
+            self._last_viewer = time.monotonic()
+
+    def stream(self, sub):
+        """Byte generator for an HTTP response from subscribe(): init segment, then live fragments."""
+        try:
+            yield sub.init_segment
+            while self.running and not self.camera.stopped:
+                try:
+                    yield sub.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+        finally:
+            self.unsubscribe(sub)
+
+    def close(self):
+        with self._lock:
+            self.subscribers.clear()
+            self._stop()
+
+def _read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+# End-to-end pipeline benchmark driven by recorded video.
+#
+#   python benchmark_pipeline.py --video traffic.mp4 --cameras 1,4,16,64 \
+#       --duration 60 --output bench.json
+#   python benchmark_pipeline.py --video traffic.mp4 --baseline bench_v1.json
+#
+# Pipelines:
+#   app  CameraStream -> AIProcessor (zones, tracking) -> get_jpeg viewers
+#   lpr  VideoIngestionService -> Redis pub/sub -> LPRWorker, using the
+#        in-process LocalRedis stand-in (ingestion and worker then share one
+#        event loop, so LPR numbers are a lower bound for split deployments).
+#        The watchlist starts empty and events are discarded instead of
+#        stored, so no database is needed and none is measured.
+#
+# Each (pipeline, camera count) runs in a fresh process so CPU and memory
+# are measured in isolation. The detector backend is picked the usual way
+# (DETECTOR_* / LPR_DETECTOR_* env vars).
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def summarize(samples, duration, cameras):
+    """samples are seconds; returns latency in ms and throughput per camera."""
+    return {
+        "count": len(samples),
+        "throughput": len(samples) / duration,
+        "throughput_per_camera": len(samples) / duration / cameras,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": (sum(samples) / len(samples) * 1000) if samples else 0.0,
+    }
+
+def rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def timed(fn, samples):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+def usage_delta(start_cpu, start_wall, base_rss, cameras):
+    wall = time.perf_counter() - start_wall
+    rss = rss_mb()
+    return {
+        "cpu_percent": (time.process_time() - start_cpu) / wall * 100,
+        "rss_mb": rss,
+        "rss_per_camera_mb": (rss - base_rss) / cameras,
+    }
+
+def run_app(videos, cameras, duration, warmup, perimeters, viewer_fps):
+    from app.ai_processor import AIProcessor
+    from app.camera_manager import CameraStream
+
+    ai = AIProcessor(perimeters_file=perimeters, watch_perimeters=False)
+    ai.load_detector() # Not part of the measurement
+    template_zones = next(iter(ai.zone_config.values()), {})
+    base_rss = rss_mb()
+
+    stages = {"inference": [], "encode": []}
+    ai.process_frame = timed(ai.process_frame, stages["inference"])
+
+    streams = []
+    for i in range(cameras):
+        if str(i) not in ai.zone_config:
+            ai.set_zones(i, template_zones, persist=False)
+        cam = CameraStream(i, ai, source={"source": videos[i % len(videos)], "loop": True})
+        # Measure the detection path only: no files written
+        cam.recording_enabled = False
+        cam.snapshots_enabled = False
+        streams.append(cam)
+
+    stop = threading.Event()
+
+    def viewer(cam):
+        encode = timed(cam.get_jpeg, stages["encode"])
+        while not stop.is_set():
+            encode()
+            time.sleep(1.0 / viewer_fps)
+
+    viewers = []
+    if viewer_fps > 0:
+        viewers = [threading.Thread(target=viewer, args=(cam,), daemon=True) for cam in streams]
+        for t in viewers:
+            t.start()
+
+    time.sleep(warmup)
+    for samples in stages.values():
+        samples.clear()
+    captured0 = [cam.frames_captured for cam in streams]
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+
+    time.sleep(duration)
+
+    elapsed = time.perf_counter() - start_wall
+    result = usage_delta(start_cpu, start_wall, base_rss, cameras)
+    captured = sum(cam.frames_captured for cam in streams) - sum(captured0)
+    result["stages"] = {name: summarize(list(samples), elapsed, cameras) for name, samples in stages.items()}
+    result["stages"]["capture"] = {
+        "count": captured,
+        "throughput": captured / elapsed,
+        "throughput_per_camera": captured / elapsed / cameras,
+    }
+    result["failed_cameras"] = sum(cam.status == "failed" for cam in streams)
+
+    stop.set()
+    for cam in streams:
+        cam.stop()
+    ai.close()
+    return result
+
+_TIMESTAMP = re.compile(rb'"timestamp":\s*([0-9.]+)')
+
+class _NullSession:
+    """Stands in for SessionLocal in the LPR run: events are dropped instead of stored."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def add(self, obj):
+        pass
+
+    async def commit(self):
+        pass
+
+def run_lpr(videos, cameras, duration, warmup, fps_limit):
+    from src.infrastructure.local_redis import LocalRedis
+    from src.infrastructure.redis_client import RedisClient
+    from src.services.video_ingestion import VideoIngestionService
+    from src.workers import lpr_worker
+    from src.workers.lpr_worker import LPRWorker
+
+    async def no_watchlist():
+        pass
+
+    async def main():
+        redis = LocalRedis()
+        RedisClient.use(redis)
+        lpr_worker.SessionLocal = _NullSession
+        worker = LPRWorker()
+        worker.refresh_watchlist = no_watchlist
+        base_rss = rss_mb()
+
+        stages = {"publish": [], "lpr_frame": [], "end_to_end": []}
+
+        publish = redis.publish
+        async def timed_publish(channel, message):
+            start = time.perf_counter()
+            try:
+                return await publish(channel, message)
+            finally:
+                stages["publish"].append(time.perf_counter() - start)
+        redis.publish = timed_publish
+
+        process = worker.process_frame
+        async def timed_process(message_data):
+            start = time.perf_counter()
+            await process(message_data)
+            stages["lpr_frame"].append(time.perf_counter() - start)
+            match = _TIMESTAMP.search(message_data)
+            if match:
+                stages["end_to_end"].append(time.time() - float(match.group(1)))
+        worker.process_frame = timed_process
+
+        services = [
+            VideoIngestionService(f"bench_{i}", videos[i % len(videos)], fps_limit=fps_limit)
+            for i in range(cameras)
+        ]
+        tasks = [asyncio.create_task(worker.start())]
+        tasks += [asyncio.create_task(s.start()) for s in services]
+
+        await asyncio.sleep(warmup)
+        for samples in stages.values():
+            samples.clear()
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+
+        await asyncio.sleep(duration)
+
+        elapsed = time.perf_counter() - start_wall
+        result = usage_delta(start_cpu, start_wall, base_rss, cameras)
+        result["stages"] = {name: summarize(list(samples), elapsed, cameras) for name, samples in stages.items()}
+        subscribers = redis._subscribers.get(b"video_frames", ())
+        result["worker_backlog"] = sum(sub.queue.qsize() for sub in subscribers)
+
+        worker.stop()
+        for s in services:
+            s.stop()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return result
+
+    return asyncio.run(main())
+
+def _run_one(queue, pipeline, args, cameras):
+    try:
+        if pipeline == "app":
+            result = run_app(args.video, cameras, args.duration, args.warmup, args.perimeters, args.viewer_fps)
+        else:
+            result = run_lpr(args.video, cameras, args.duration, args.warmup, args.fps_limit)
+        queue.put(result)
+    except Exception as e:
+        queue.put({"error": repr(e)})
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, tolerance):
+    """Prints per-stage deltas against a previous run; returns the regressions found."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["pipeline"], r["cameras"]): r for r in baseline.get("runs", [])}
+
+    regressions = []
+    for run in results["runs"]:
+        old = previous.get((run["pipeline"], run["cameras"]))
+        if old is None or "stages" not in run or "stages" not in old:
+            continue
+        for stage, stats in run["stages"].items():
+            old_stats = old["stages"].get(stage)
+            if not old_stats:
+                continue
+            checks = [("throughput", -1)]
+            if "p99_ms" in stats:
+                checks.append(("p99_ms", 1))
+            for metric, direction in checks:
+                before, after = old_stats.get(metric, 0), stats.get(metric, 0)
+                if not before:
+                    continue
+                change = (after - before) / before
+                flag = ""
+                if change * direction > tolerance:
+                    flag = "  REGRESSION"
+                    regressions.append((run["pipeline"], run["cameras"], stage, metric, change))
+                print(f"{run['pipeline']:>4} x{run['cameras']:<3} {stage:<11} {metric:<11} "
+                      f"{before:10.2f} -> {after:10.2f} ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the capture/AI and LPR pipelines on recorded video.')
+    parser.add_argument('--video', action='append', required=True,
+                        help='Recorded video file(s); cameras cycle through them')
+    parser.add_argument('--cameras', default='1,4,16,64', help='Comma-separated camera counts')
+    parser.add_argument('--pipelines', default='app,lpr', help='Comma-separated: app, lpr')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before each run')
+    parser.add_argument('--perimeters', default='perimeters.json', help='Zone config for the app pipeline')
+    parser.add_argument('--viewer-fps', type=float, default=15, help='get_jpeg rate per camera (0 = no viewers)')
+    parser.add_argument('--fps-limit', type=int, default=5, help='Ingestion rate per camera for the lpr pipeline')
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--baseline', help='Previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression')
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.cameras.split(",")]
+    pipelines = [p.strip() for p in args.pipelines.split(",")]
+
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "videos": args.video,
+            "duration": args.duration,
+            "detector": {k: v for k, v in os.environ.items() if k.startswith(("DETECTOR_", "LPR_DETECTOR_"))},
+        },
+        "runs": [],
+    }
+
+    ctx = multiprocessing.get_context("spawn")
+    for pipeline in pipelines:
+        for cameras in counts:
+            print(f"Running {pipeline} pipeline with {cameras} camera(s)...")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_one, args=(queue, pipeline, args, cameras))
+            proc.start()
+            try:
+                run = queue.get(timeout=args.warmup + args.duration + 600)
+            except Exception:
+                run = {"error": f"run did not report (exit code {proc.exitcode})"}
+                proc.terminate()
+            proc.join()
+            run.update({"pipeline": pipeline, "cameras": cameras})
+            results["runs"].append(run)
+
+            if "error" in run:
+                print(f"  failed: {run['error']}")
+                continue
+            for stage, stats in run["stages"].items():
+                line = f"  {stage:<11} {stats['throughput_per_camera']:8.2f}/s per camera"
+                if "p50_ms" in stats:
+                    line += f"  p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms"
+                print(line)
+            print(f"  cpu {run['cpu_percent']:.0f}%  rss {run['rss_mb']:.0f} MB ({run['rss_per_camera_mb']:.1f} MB/camera)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
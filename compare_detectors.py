@@ -0,0 +1,156 @@
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from src.infrastructure.detectors import DetectorConfig, box_iou_matrix, create_detector, export_model
+
+# Compares detector backends on the same frames. The first backend is the
+# reference: accuracy of the others is measured as agreement with it.
+#
+#   python compare_detectors.py --video sample.mp4 \
+#       --backend ultralytics:yolov8n.pt \
+#       --backend onnxruntime:yolov8n.onnx:4 \
+#       --backend onnxruntime:yolov8n_int8.onnx:4 \
+#       --backend openvino:yolov8n_openvino_model:4 \
+#       --output backends.json
+#
+# Export/quantize first with:
+#   python compare_detectors.py --export onnxruntime --int8 --calibration-dir calib/
+
+def parse_backend(spec, imgsz):
+    parts = spec.split(":")
+    config = DetectorConfig(backend=parts[0], weights=parts[1], imgsz=imgsz)
+    if len(parts) > 2:
+        config.num_threads = int(parts[2])
+    return config
+
+def load_frames(video, max_frames, stride):
+    cap = cv2.VideoCapture(video)
+    frames = []
+    index = 0
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % stride == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """Greedily matches candidate boxes to reference boxes of the same class."""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, len(reference), len(candidate), []
+    iou = box_iou_matrix(reference[:, :4], candidate[:, :4])
+    iou[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0
+    used_ref, used_cand, ious = set(), set(), []
+    for flat in np.argsort(-iou, axis=None):
+        i, j = divmod(int(flat), iou.shape[1])
+        if iou[i, j] < iou_threshold:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        ious.append(float(iou[i, j]))
+    return len(ious), len(reference), len(candidate), ious
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def benchmark(config, frames, warmup):
+    detector = create_detector(config)
+    for frame in frames[:warmup]:
+        detector.detect(frame)
+
+    outputs, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        outputs.append(detector.detect(frame))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return outputs, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare detector backends for accuracy and latency.')
+    parser.add_argument('--video', help='Video file to sample frames from')
+    parser.add_argument('--backend', action='append', default=[],
+                        help='backend:weights[:threads]; the first one is the accuracy reference')
+    parser.add_argument('--frames', type=int, default=200, help='Number of frames to evaluate')
+    parser.add_argument('--stride', type=int, default=5, help='Use every Nth frame of the video')
+    parser.add_argument('--warmup', type=int, default=10, help='Warmup iterations per backend')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--export', choices=['onnxruntime', 'openvino'], help='Export yolov8n.pt and exit')
+    parser.add_argument('--weights', default='yolov8n.pt', help='Weights to export')
+    parser.add_argument('--int8', action='store_true', help='Quantize the export to INT8')
+    parser.add_argument('--calibration-dir', help='Representative frames for INT8 calibration')
+    args = parser.parse_args()
+
+    if args.export:
+        path = export_model(args.weights, args.export, imgsz=args.imgsz, int8=args.int8,
+                            calibration_dir=args.calibration_dir)
+        print(f"Exported {args.export} model: {path}")
+        return
+
+    if not args.video or not args.backend:
+        parser.error("--video and at least one --backend are required")
+
+    frames = load_frames(args.video, args.frames, args.stride)
+    if not frames:
+        print(f"Error: no frames read from {args.video}")
+        return
+    print(f"Loaded {len(frames)} frames from {args.video}")
+
+    results = []
+    reference = None
+    for spec in args.backend:
+        config = parse_backend(spec, args.imgsz)
+        print(f"Benchmarking {spec}...")
+        outputs, latencies = benchmark(config, frames, args.warmup)
+
+        entry = {
+            "backend": spec,
+            "latency_ms": {
+                "mean": float(np.mean(latencies)),
+                "p50": percentile(latencies, 50),
+                "p99": percentile(latencies, 99),
+            },
+            "fps": 1000.0 / float(np.mean(latencies)),
+            "detections": int(sum(len(o) for o in outputs)),
+        }
+
+        if reference is None:
+            reference = outputs
+        else:
+            matched = ref_total = cand_total = 0
+            ious = []
+            for ref, cand in zip(reference, outputs):
+                m, r, c, frame_ious = agreement(ref, cand)
+                matched += m
+                ref_total += r
+                cand_total += c
+                ious.extend(frame_ious)
+            entry["vs_reference"] = {
+                "recall": matched / ref_total if ref_total else 1.0,
+                "precision": matched / cand_total if cand_total else 1.0,
+                "mean_iou": float(np.mean(ious)) if ious else 0.0,
+            }
+        results.append(entry)
+
+    print(f"\n{'backend':<45} {'p50 ms':>8} {'p99 ms':>8} {'fps':>7} {'recall':>7} {'prec':>7}")
+    for entry in results:
+        ref = entry.get("vs_reference", {"recall": 1.0, "precision": 1.0})
+        print(f"{entry['backend']:<45} {entry['latency_ms']['p50']:>8.1f} {entry['latency_ms']['p99']:>8.1f} "
+              f"{entry['fps']:>7.1f} {ref['recall']:>7.3f} {ref['precision']:>7.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"video": args.video, "frames": len(frames), "results": results}, f, indent=4)
+        print(f"Saved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
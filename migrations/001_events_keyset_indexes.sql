@@ -0,0 +1,51 @@
+-- Keyset pagination indexes for events (src/domain/models.py Event).
+--
+-- New databases get these from the models; existing ones need this run
+-- once, outside a transaction (CREATE INDEX CONCURRENTLY refuses to run
+-- inside one), e.g.:
+--
+--     psql "$DATABASE_URL" -f migrations/001_events_keyset_indexes.sql
+--
+-- Every statement is idempotent, so an interrupted run can be repeated.
+-- If a concurrent build fails it leaves an INVALID index behind: drop it
+-- and run the file again.
+
+-- 1. Rows written before camera_id/event_type/timestamp were required.
+--    They are kept, not deleted: unknown camera/type become 'unknown' and a
+--    missing timestamp becomes the epoch, so those rows sort as the oldest
+--    page instead of disappearing from the listing.
+UPDATE events SET camera_id = 'unknown' WHERE camera_id IS NULL;
+UPDATE events SET event_type = 'unknown' WHERE event_type IS NULL;
+UPDATE events SET timestamp = to_timestamp(0) WHERE timestamp IS NULL;
+
+-- 2. NOT NULL without holding an exclusive lock for a full scan: a NOT VALID
+--    check is validated under a lighter lock, and PostgreSQL 12+ then uses
+--    it to skip the scan in SET NOT NULL.
+ALTER TABLE events DROP CONSTRAINT IF EXISTS events_camera_id_not_null;
+ALTER TABLE events ADD CONSTRAINT events_camera_id_not_null CHECK (camera_id IS NOT NULL) NOT VALID;
+ALTER TABLE events VALIDATE CONSTRAINT events_camera_id_not_null;
+ALTER TABLE events ALTER COLUMN camera_id SET NOT NULL;
+ALTER TABLE events DROP CONSTRAINT events_camera_id_not_null;
+
+ALTER TABLE events DROP CONSTRAINT IF EXISTS events_event_type_not_null;
+ALTER TABLE events ADD CONSTRAINT events_event_type_not_null CHECK (event_type IS NOT NULL) NOT VALID;
+ALTER TABLE events VALIDATE CONSTRAINT events_event_type_not_null;
+ALTER TABLE events ALTER COLUMN event_type SET NOT NULL;
+ALTER TABLE events DROP CONSTRAINT events_event_type_not_null;
+
+ALTER TABLE events DROP CONSTRAINT IF EXISTS events_timestamp_not_null;
+ALTER TABLE events ADD CONSTRAINT events_timestamp_not_null CHECK (timestamp IS NOT NULL) NOT VALID;
+ALTER TABLE events VALIDATE CONSTRAINT events_timestamp_not_null;
+ALTER TABLE events ALTER COLUMN timestamp SET NOT NULL;
+ALTER TABLE events DROP CONSTRAINT events_timestamp_not_null;
+
+-- 3. Composite indexes, built without blocking writes.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events_timestamp_id ON events (timestamp, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events_camera_timestamp_id ON events (camera_id, timestamp, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events_type_timestamp_id ON events (event_type, timestamp, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events_plate_timestamp_id ON events (plate_number, timestamp, id);
+
+-- 4. Single-column indexes they replace (each is a prefix of a composite one).
+DROP INDEX CONCURRENTLY IF EXISTS ix_events_camera_id;
+DROP INDEX CONCURRENTLY IF EXISTS ix_events_event_type;
+DROP INDEX CONCURRENTLY IF EXISTS ix_events_plate_number;
@@ -0,0 +1,9 @@
+-- Perimeter event columns (src/domain/models.py Event.rule, Event.track_id),
+-- filled in by analyze_recordings.py --db.
+--
+--     psql "$DATABASE_URL" -f migrations/002_events_rule_track.sql
+--
+-- Both are nullable, so existing rows need no backfill and adding them
+-- does not rewrite the table.
+ALTER TABLE events ADD COLUMN IF NOT EXISTS rule VARCHAR;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS track_id INTEGER;
@@ -1,5 +1,7 @@
 from fastapi import APIRouter
-from src.api.v1.endpoints import events
+from src.api.v1.endpoints import events, system, watchlist
 
 api_router = APIRouter()
 api_router.include_router(events.router, prefix="/events", tags=["events"])
+api_router.include_router(watchlist.router, prefix="/watchlist", tags=["watchlist"])
+api_router.include_router(system.router, prefix="/system", tags=["system"])
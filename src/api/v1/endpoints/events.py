@@ -1,22 +1,84 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import select, tuple_
 
 from src.core.database import get_db
 from src.domain import models, schemas
 
 router = APIRouter()
 
-@router.get("/", response_model=List[schemas.Event])
+def encode_cursor(timestamp: datetime, event_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{event_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        ts, event_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(event_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/", response_model=schemas.EventPage)
 async def read_events(
-    skip: int = 0,
-    limit: int = 100,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    camera_id: str | None = None,
+    event_type: str | None = None,
+    plate_number: str | None = None,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(models.Event).offset(skip).limit(limit))
+    """
+    Lists events newest first using keyset pagination on (timestamp, id).
+    Pass the returned next_cursor to fetch the following page; page cost is
+    independent of how deep into the table the cursor points.
+    """
+    query = select(models.Event)
+
+    if camera_id is not None:
+        query = query.where(models.Event.camera_id == camera_id)
+    if event_type is not None:
+        query = query.where(models.Event.event_type == event_type)
+    if plate_number is not None:
+        query = query.where(models.Event.plate_number == plate_number.upper())
+    if start_time is not None:
+        query = query.where(models.Event.timestamp >= start_time)
+    if end_time is not None:
+        query = query.where(models.Event.timestamp < end_time)
+
+    if cursor is not None:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.Event.timestamp, models.Event.id) < tuple_(cursor_ts, cursor_id)
+        )
+
+    # Fetch one extra row to know whether another page exists
+    query = query.order_by(models.Event.timestamp.desc(), models.Event.id.desc()).limit(limit + 1)
+
+    result = await db.execute(query)
     events = result.scalars().all()
-    return events
+
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        last = events[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
+
+    return schemas.EventPage(items=events, next_cursor=next_cursor)
+
+@router.get("/{event_id}", response_model=schemas.Event)
+async def read_event(
+    event_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    event = await db.get(models.Event, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return event
 
 @router.post("/", response_model=schemas.Event)
 async def create_event(
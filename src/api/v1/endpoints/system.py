@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from src.core.database import pool_metrics
+
+router = APIRouter()
+
+@router.get("/db-pool")
+async def read_db_pool():
+    """Connection pool occupancy and checkout latency, for sizing the pool."""
+    return pool_metrics.snapshot()
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List
+
+from src.core.database import get_db
+from src.domain import models, schemas
+from src.services.watchlist import normalize_plate
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.WatchlistEntry])
+async def read_watchlist(
+    after_id: int = 0,
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(
+        select(models.WatchlistEntry)
+        .where(models.WatchlistEntry.active.is_(True), models.WatchlistEntry.id > after_id)
+        .order_by(models.WatchlistEntry.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+@router.post("/", response_model=schemas.WatchlistEntry)
+async def add_watchlist_entry(
+    entry: schemas.WatchlistEntryCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    plate = normalize_plate(entry.plate_number)
+    if not plate:
+        raise HTTPException(status_code=400, detail="Invalid plate number")
+
+    result = await db.execute(
+        select(models.WatchlistEntry).where(models.WatchlistEntry.plate_number == plate)
+    )
+    db_entry = result.scalar_one_or_none()
+    if db_entry is None:
+        db_entry = models.WatchlistEntry(plate_number=plate, label=entry.label)
+        db.add(db_entry)
+    else:
+        # Re-activating keeps the row so workers see it as an update
+        db_entry.label = entry.label
+        db_entry.active = True
+
+    await db.commit()
+    await db.refresh(db_entry)
+    return db_entry
+
+@router.delete("/{plate_number}", response_model=schemas.WatchlistEntry)
+async def remove_watchlist_entry(
+    plate_number: str,
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(
+        select(models.WatchlistEntry).where(models.WatchlistEntry.plate_number == normalize_plate(plate_number))
+    )
+    db_entry = result.scalar_one_or_none()
+    if db_entry is None:
+        raise HTTPException(status_code=404, detail="Plate not in watchlist")
+
+    # Soft delete: incremental refreshes only see rows, never their absence
+    db_entry.active = False
+    await db.commit()
+    await db.refresh(db_entry)
+    return db_entry
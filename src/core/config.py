@@ -13,10 +13,29 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "visionsentinel")
     SQLALCHEMY_DATABASE_URI: str | None = None
 
+    # Database engine / pool
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() == "true"
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 10))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+
     # Redis
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
 
+    # Watchlist
+    WATCHLIST_REFRESH_SECONDS: float = float(os.getenv("WATCHLIST_REFRESH_SECONDS", 30))
+    WATCHLIST_FUZZY_MATCH: bool = os.getenv("WATCHLIST_FUZZY_MATCH", "true").lower() == "true"
+    # Look-back for rows committed by transactions that started before the last refresh
+    WATCHLIST_SYNC_MARGIN_SECONDS: float = float(os.getenv("WATCHLIST_SYNC_MARGIN_SECONDS", 300))
+    WATCHLIST_FULL_RELOAD_SECONDS: float = float(os.getenv("WATCHLIST_FULL_RELOAD_SECONDS", 3600))
+
+    # Metrics: port for the standalone /metrics server of worker processes (0 = off)
+    WORKER_METRICS_PORT: int = int(os.getenv("WORKER_METRICS_PORT", 0))
+
     # MinIO
     MINIO_ENDPOINT: str = os.getenv("MINIO_ENDPOINT", "localhost:9000")
     MINIO_ACCESS_KEY: str = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
@@ -1,12 +1,33 @@
+import time
+from collections import deque
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from src.core.config import get_settings
 
 settings = get_settings()
 
+def _connect_args(url: str) -> dict:
+    # Statement caches are asyncpg options; other drivers (aiosqlite in tests) reject them
+    if make_url(url).get_driver_name() != "asyncpg":
+        return {}
+    return {
+        # SQLAlchemy-side cache of asyncpg prepared statements per connection
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        # asyncpg's own statement cache
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
 engine = create_async_engine(
     settings.SQLALCHEMY_DATABASE_URI,
-    echo=True,
+    echo=settings.DB_ECHO,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args=_connect_args(settings.SQLALCHEMY_DATABASE_URI),
 )
 
 SessionLocal = sessionmaker(
@@ -19,6 +40,54 @@ SessionLocal = sessionmaker(
 
 Base = declarative_base()
 
+class PoolMetrics:
+    """Checkout latency samples for the API's sessions, kept in a bounded window."""
+
+    def __init__(self, window: int = 2048):
+        self.samples = deque(maxlen=window)
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def observe(self, seconds: float):
+        self.checkouts += 1
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        pool = engine.pool
+        capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+        checked_out = pool.checkedout()
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "checked_out": checked_out,
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "saturation": checked_out / capacity if capacity else 0.0,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "checkout_latency_ms": {
+                "p50": self.percentile(0.50) * 1000,
+                "p99": self.percentile(0.99) * 1000,
+                "max": max(self.samples, default=0.0) * 1000,
+            },
+        }
+
+pool_metrics = PoolMetrics()
+
 async def get_db():
     async with SessionLocal() as session:
+        # Check the connection out up front so pool wait time is measured
+        start = time.perf_counter()
+        try:
+            await session.connection()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.observe(time.perf_counter() - start)
         yield session
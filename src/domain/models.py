@@ -1,18 +1,47 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Index
+from sqlalchemy.sql import func, true
 from src.core.database import Base
 
 class Event(Base):
     __tablename__ = "events"
 
     id = Column(Integer, primary_key=True, index=True)
-    camera_id = Column(String, index=True)
-    event_type = Column(String, index=True) # lpr, face, perimeter
+    camera_id = Column(String, nullable=False)
+    event_type = Column(String, nullable=False) # lpr, face, perimeter
     
     # LPR specific
-    plate_number = Column(String, index=True, nullable=True)
+    plate_number = Column(String, nullable=True)
     confidence = Column(Float, nullable=True)
+
+    # Perimeter specific: zone rule that fired and the tracked object
+    rule = Column(String, nullable=True)
+    track_id = Column(Integer, nullable=True)
     
     # Metadata
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     snapshot_path = Column(String, nullable=True) # Path in MinIO/S3
+
+    # Composite indexes backing keyset pagination on (timestamp, id).
+    # Each filter column leads its own index so a filtered page is a single
+    # index range scan instead of a filter over the whole timeline.
+    __table_args__ = (
+        Index("ix_events_timestamp_id", "timestamp", "id"),
+        Index("ix_events_camera_timestamp_id", "camera_id", "timestamp", "id"),
+        Index("ix_events_type_timestamp_id", "event_type", "timestamp", "id"),
+        Index("ix_events_plate_timestamp_id", "plate_number", "timestamp", "id"),
+    )
+
+class WatchlistEntry(Base):
+    __tablename__ = "watchlist"
+
+    id = Column(Integer, primary_key=True, index=True)
+    plate_number = Column(String, nullable=False, unique=True)
+    label = Column(String, nullable=True) # e.g. stolen, vip, blocked
+    active = Column(Boolean, nullable=False, default=True, server_default=true())
+
+    # Bumped on every change so workers can refresh incrementally
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_watchlist_updated_at", "updated_at"),
+    )
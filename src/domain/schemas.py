@@ -1,11 +1,14 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List
 
 class EventBase(BaseModel):
     camera_id: str
     event_type: str
     plate_number: str | None = None
     confidence: float | None = None
+    rule: str | None = None
+    track_id: int | None = None
     snapshot_path: str | None = None
 
 class EventCreate(EventBase):
@@ -17,3 +20,29 @@ class Event(EventBase):
 
     class Config:
         from_attributes = True
+
+class EventPage(BaseModel):
+    items: List[Event]
+    # Opaque cursor for the next (older) page, None when exhausted
+    next_cursor: str | None = None
+
+class WatchlistEntryBase(BaseModel):
+    plate_number: str
+    label: str | None = None
+
+class WatchlistEntryCreate(WatchlistEntryBase):
+    pass
+
+class WatchlistEntry(WatchlistEntryBase):
+    id: int
+    active: bool
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class WatchlistMatch(BaseModel):
+    plate_read: str
+    plate_number: str
+    label: str | None = None
+    distance: int
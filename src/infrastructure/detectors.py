@@ -0,0 +1,395 @@
+"""
+Pluggable object detector backends.
+
+Every backend returns plain NumPy arrays in the pixel coordinates of the
+frame it was given, using the same column layout as ultralytics'
+boxes.data:
+
+    detect() -> (N, 6) float32: x1, y1, x2, y2, conf, cls
+    track()  -> (N, 7) float32: x1, y1, x2, y2, track_id, conf, cls
+
+Backends:
+    ultralytics  PyTorch weights (or any format ultralytics can load)
+    onnxruntime  YOLOv8 exported to ONNX (FP32 or INT8 QDQ)
+    openvino     YOLOv8 exported to OpenVINO IR (FP32 or INT8)
+
+The backend, weights and thread count are read from the environment
+(DETECTOR_BACKEND, DETECTOR_WEIGHTS, DETECTOR_THREADS, ... with a per-
+consumer prefix) so each site can pick the fastest one without code
+changes. Use export_model() to produce the ONNX/OpenVINO files and
+compare_detectors.py to measure accuracy and latency per backend.
+"""
+import glob
+import logging
+import os
+from dataclasses import dataclass, fields
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("ultralytics", "onnxruntime", "openvino")
+
+@dataclass
+class DetectorConfig:
+    backend: str = "ultralytics"
+    weights: str = "yolov8n.pt"
+    num_threads: int = 0 # 0 = library default
+    imgsz: int = 640
+    conf: float = 0.25
+    iou: float = 0.45
+
+    @classmethod
+    def from_env(cls, prefix="DETECTOR_", **defaults):
+        """
+        Builds a config from <prefix>BACKEND, <prefix>WEIGHTS,
+        <prefix>THREADS, <prefix>IMGSZ, <prefix>CONF and <prefix>IOU.
+        """
+        env_names = {"num_threads": "THREADS"}
+        values = dict(defaults)
+        for f in fields(cls):
+            raw = os.getenv(prefix + env_names.get(f.name, f.name.upper()))
+            if raw is not None:
+                values[f.name] = type(f.default)(raw)
+        return cls(**values)
+
+def box_iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy arrays."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+class IoUTracker:
+    """
+    Minimal greedy IoU tracker, one per stream, used by every backend.
+    Tracks survive max_age missed frames before their id is retired.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=15):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.classes = np.zeros(0, dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.ages = np.zeros(0, dtype=np.int64)
+        self.next_id = 1
+
+    def update(self, detections):
+        """(N, 6) detections -> (N, 7) tracked rows."""
+        n = len(detections)
+        assigned = np.full(n, -1, dtype=np.int64)
+
+        if n and len(self.boxes):
+            iou = box_iou_matrix(detections[:, :4], self.boxes)
+            # Only associate boxes of the same class
+            iou[detections[:, 5][:, None] != self.classes[None, :]] = 0
+            used = set()
+            for flat in np.argsort(-iou, axis=None):
+                i, j = divmod(int(flat), iou.shape[1])
+                if iou[i, j] < self.iou_threshold:
+                    break
+                if assigned[i] == -1 and j not in used:
+                    assigned[i] = j
+                    used.add(j)
+
+        ages = self.ages + 1
+        ids = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            if assigned[i] >= 0:
+                ids[i] = self.ids[assigned[i]]
+                ages[assigned[i]] = 0
+            else:
+                ids[i] = self.next_id
+                self.next_id += 1
+
+        # Keep unmatched tracks until they age out; new boxes replace matched ones
+        keep = (ages <= self.max_age) & ~np.isin(np.arange(len(self.ids)), assigned[assigned >= 0])
+        self.boxes = np.concatenate([self.boxes[keep], detections[:, :4]]).astype(np.float32)
+        self.classes = np.concatenate([self.classes[keep], detections[:, 5]]).astype(np.float32)
+        self.ids = np.concatenate([self.ids[keep], ids])
+        self.ages = np.concatenate([ages[keep], np.zeros(n, dtype=np.int64)])
+
+        out = np.empty((n, 7), dtype=np.float32)
+        out[:, :4] = detections[:, :4]
+        out[:, 4] = ids
+        out[:, 5:] = detections[:, 4:6]
+        return out
+
+    def state(self):
+        """JSON-serializable tracks, so another process can continue the same ids."""
+        return {
+            "boxes": self.boxes.tolist(),
+            "classes": self.classes.tolist(),
+            "ids": self.ids.tolist(),
+            "ages": self.ages.tolist(),
+            "next_id": self.next_id,
+        }
+
+    def restore(self, state):
+        self.boxes = np.asarray(state["boxes"], dtype=np.float32).reshape(-1, 4)
+        self.classes = np.asarray(state["classes"], dtype=np.float32)
+        self.ids = np.asarray(state["ids"], dtype=np.int64)
+        self.ages = np.asarray(state["ages"], dtype=np.int64)
+        self.next_id = int(state["next_id"])
+
+class Detector:
+    """Base class. Subclasses implement detect_batch()."""
+
+    def __init__(self, config: DetectorConfig):
+        self.config = config
+        self.trackers = {} # stream id -> IoUTracker
+
+    def detect_batch(self, frames):
+        raise NotImplementedError
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def track(self, frame, stream_id=None):
+        tracker = self.trackers.get(stream_id)
+        if tracker is None:
+            tracker = self.trackers[stream_id] = IoUTracker()
+        return tracker.update(self.detect(frame))
+
+    def reset_tracker(self, stream_id=None):
+        self.trackers.pop(stream_id, None)
+
+    def tracker_state(self, stream_id=None):
+        """Serializable tracker state for a stream (None if it has none or it cannot be exported)."""
+        tracker = self.trackers.get(stream_id)
+        return tracker.state() if tracker is not None else None
+
+    def restore_tracker(self, stream_id, state):
+        tracker = self.trackers[stream_id] = IoUTracker()
+        tracker.restore(state)
+
+class UltralyticsDetector(Detector):
+    def __init__(self, config: DetectorConfig):
+        super().__init__(config)
+        from ultralytics import YOLO
+        if config.num_threads:
+            # Process-wide in PyTorch, unlike the exported backends
+            import torch
+            torch.set_num_threads(config.num_threads)
+        self.model = YOLO(config.weights)
+
+    def _predict_kwargs(self):
+        return dict(imgsz=self.config.imgsz, conf=self.config.conf, iou=self.config.iou, verbose=False)
+
+    def detect_batch(self, frames):
+        results = self.model.predict(list(frames), **self._predict_kwargs())
+        return [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
+
+    # Tracking uses the per-stream IoUTracker of the base class: model.track()
+    # keeps a single ByteTrack state on the model, which would mix the ids
+    # of every camera sharing this detector
+
+def letterbox(frame, size):
+    """Resizes keeping aspect ratio and pads to size x size. Returns (img, ratio, (pad_x, pad_y))."""
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    img = cv2.copyMakeBorder(frame, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+                             cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, ratio, (pad_x, pad_y)
+
+def preprocess(frames, size):
+    """BGR frames -> (B, 3, size, size) float32 RGB blob, plus per-frame scaling."""
+    blob = np.empty((len(frames), 3, size, size), dtype=np.float32)
+    meta = []
+    for i, frame in enumerate(frames):
+        img, ratio, pad = letterbox(frame, size)
+        blob[i] = img[:, :, ::-1].transpose(2, 0, 1)
+        meta.append((ratio, pad, frame.shape[:2]))
+    blob *= 1.0 / 255.0
+    return blob, meta
+
+def postprocess(output, meta, conf_threshold, iou_threshold):
+    """YOLOv8 head output (B, 4 + nc, anchors) -> list of (N, 6) arrays."""
+    results = []
+    for pred, (ratio, (pad_x, pad_y), (h, w)) in zip(output, meta):
+        pred = pred.T # anchors x (4 + nc)
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(cls)), cls]
+        mask = conf >= conf_threshold
+        if not mask.any():
+            results.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+
+        cx, cy, bw, bh = pred[mask, :4].T
+        cls, conf = cls[mask], conf[mask]
+        boxes_xywh = np.stack([cx - bw / 2, cy - bh / 2, bw, bh], axis=1)
+        keep = cv2.dnn.NMSBoxesBatched(boxes_xywh.tolist(), conf.tolist(), cls.tolist(),
+                                       conf_threshold, iou_threshold)
+        keep = np.asarray(keep, dtype=np.int64).reshape(-1)
+
+        det = np.empty((len(keep), 6), dtype=np.float32)
+        x1, y1 = boxes_xywh[keep, 0], boxes_xywh[keep, 1]
+        det[:, 0] = np.clip((x1 - pad_x) / ratio, 0, w)
+        det[:, 1] = np.clip((y1 - pad_y) / ratio, 0, h)
+        det[:, 2] = np.clip((x1 + boxes_xywh[keep, 2] - pad_x) / ratio, 0, w)
+        det[:, 3] = np.clip((y1 + boxes_xywh[keep, 3] - pad_y) / ratio, 0, h)
+        det[:, 4] = conf[keep]
+        det[:, 5] = cls[keep]
+        results.append(det)
+    return results
+
+class _ExportedYoloDetector(Detector):
+    """Shared pre/post-processing for exported YOLOv8 graphs."""
+
+    # Set by subclasses: None when the graph accepts any batch size
+    fixed_batch = None
+
+    def _infer(self, blob):
+        raise NotImplementedError
+
+    def detect_batch(self, frames):
+        blob, meta = preprocess(frames, self.config.imgsz)
+        if self.fixed_batch:
+            # The graph only takes full batches: pad the last one and drop the extra outputs
+            size = self.fixed_batch
+            padded = -len(blob) % size
+            if padded:
+                blob = np.concatenate([blob, np.zeros((padded,) + blob.shape[1:], dtype=blob.dtype)])
+            outputs = [self._infer(blob[i:i + size]) for i in range(0, len(blob), size)]
+            output = np.concatenate(outputs)[:len(meta)]
+        else:
+            output = self._infer(blob)
+        return postprocess(output, meta, self.config.conf, self.config.iou)
+
+class OnnxRuntimeDetector(_ExportedYoloDetector):
+    def __init__(self, config: DetectorConfig):
+        super().__init__(config)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if config.num_threads:
+            options.intra_op_num_threads = config.num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(config.weights, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch = model_input.shape[0]
+        self.fixed_batch = batch if isinstance(batch, int) else None
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVINODetector(_ExportedYoloDetector):
+    def __init__(self, config: DetectorConfig):
+        super().__init__(config)
+        import openvino as ov
+        weights = config.weights
+        if os.path.isdir(weights):
+            # ultralytics exports a directory holding <name>.xml/.bin
+            weights = glob.glob(os.path.join(weights, "*.xml"))[0]
+        core = ov.Core()
+        model = core.read_model(weights)
+        ov_config = {"PERFORMANCE_HINT": "LATENCY"}
+        if config.num_threads:
+            ov_config["INFERENCE_NUM_THREADS"] = config.num_threads
+        self.compiled = core.compile_model(model, "CPU", ov_config)
+        self.output = self.compiled.output(0)
+        batch = model.input(0).get_partial_shape()[0]
+        self.fixed_batch = batch.get_length() if batch.is_static else None
+
+    def _infer(self, blob):
+        return self.compiled([blob])[self.output]
+
+def create_detector(config: DetectorConfig | None = None) -> Detector:
+    config = config or DetectorConfig.from_env()
+    logger.info(f"Loading detector backend={config.backend} weights={config.weights} threads={config.num_threads or 'default'}")
+    if config.backend == "ultralytics":
+        return UltralyticsDetector(config)
+    if config.backend == "onnxruntime":
+        return OnnxRuntimeDetector(config)
+    if config.backend == "openvino":
+        return OpenVINODetector(config)
+    raise ValueError(f"Unknown detector backend '{config.backend}', expected one of {BACKENDS}")
+
+def _calibration_frames(calibration_dir, limit):
+    paths = sorted(
+        p for p in glob.glob(os.path.join(calibration_dir, "*"))
+        if p.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))
+    )[:limit]
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            yield frame
+
+def export_model(weights="yolov8n.pt", backend="onnxruntime", imgsz=640, int8=False,
+                 calibration_dir=None, calibration_size=300):
+    """
+    Exports PyTorch weights for an optimized backend and returns the path to
+    pass as DETECTOR_WEIGHTS. With int8=True the FP32 export is quantized
+    using representative frames from calibration_dir (ideally stills from
+    the site's own cameras).
+    """
+    from ultralytics import YOLO
+
+    if int8 and not calibration_dir:
+        raise ValueError("INT8 export needs calibration_dir with representative frames")
+
+    if backend == "onnxruntime":
+        fp32_path = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return fp32_path
+
+        from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                              quantize_static)
+
+        class FrameReader(CalibrationDataReader):
+            def __init__(self, input_name):
+                self.input_name = input_name
+                self.frames = _calibration_frames(calibration_dir, calibration_size)
+
+            def get_next(self):
+                frame = next(self.frames, None)
+                if frame is None:
+                    return None
+                blob, _ = preprocess([frame], imgsz)
+                return {self.input_name: blob}
+
+        import onnxruntime as ort
+        input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        int8_path = fp32_path.replace(".onnx", "_int8.onnx")
+        quantize_static(fp32_path, int8_path, FrameReader(input_name),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        return int8_path
+
+    if backend == "openvino":
+        fp32_dir = YOLO(weights).export(format="openvino", imgsz=imgsz)
+        if not int8:
+            return fp32_dir
+
+        import nncf
+        import openvino as ov
+        xml_path = glob.glob(os.path.join(fp32_dir, "*.xml"))[0]
+        model = ov.Core().read_model(xml_path)
+        frames = list(_calibration_frames(calibration_dir, calibration_size))
+        dataset = nncf.Dataset(frames, lambda frame: preprocess([frame], imgsz)[0])
+        quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED,
+                                  subset_size=len(frames))
+        int8_dir = fp32_dir.rstrip("/\\") + "_int8"
+        os.makedirs(int8_dir, exist_ok=True)
+        int8_xml = os.path.join(int8_dir, os.path.basename(xml_path))
+        ov.save_model(quantized, int8_xml)
+        return int8_dir
+
+    raise ValueError(f"Cannot export for backend '{backend}'")
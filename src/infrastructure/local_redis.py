@@ -0,0 +1,163 @@
+import asyncio
+import fnmatch
+import time
+
+class LocalPubSub:
+    def __init__(self, server):
+        self.server = server
+        self.channels = set()
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        for channel in channels:
+            channel = _key(channel)
+            self.channels.add(channel)
+            self.server._subscribers.setdefault(channel, set()).add(self)
+            await self.queue.put({"type": "subscribe", "channel": channel, "data": len(self.channels)})
+
+    async def unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            channel = _key(channel)
+            self.channels.discard(channel)
+            self.server._subscribers.get(channel, set()).discard(self)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            try:
+                message = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    message = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+            if ignore_subscribe_messages and message["type"] != "message":
+                continue
+            return message
+
+    async def listen(self):
+        while self.channels:
+            yield await self.queue.get()
+
+    async def aclose(self):
+        await self.unsubscribe()
+
+    close = aclose
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of redis.asyncio.Redis the services
+    use (pub/sub and plain keys with expiry). Meant for benchmarks and tests
+    on machines without a Redis server; install it with
+    RedisClient.use(LocalRedis()).
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expiry = {}
+        self._subscribers = {}
+
+    # Pub/Sub
+
+    def pubsub(self):
+        return LocalPubSub(self)
+
+    async def publish(self, channel, message):
+        channel = _key(channel)
+        data = message.encode("utf-8") if isinstance(message, str) else message
+        subscribers = self._subscribers.get(channel, ())
+        for sub in subscribers:
+            sub.queue.put_nowait({"type": "message", "channel": channel, "data": data})
+        return len(subscribers)
+
+    # Keys
+
+    def _alive(self, key):
+        expires = self._expiry.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+        return key in self._data
+
+    async def get(self, key):
+        key = _key(key)
+        return self._data[key] if self._alive(key) else None
+
+    async def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        key = _key(key)
+        exists = self._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return None
+        self._data[key] = value.encode("utf-8") if isinstance(value, str) else value
+        self._expiry.pop(key, None)
+        if ex is not None:
+            self._expiry[key] = time.monotonic() + ex
+        elif px is not None:
+            self._expiry[key] = time.monotonic() + px / 1000
+        return True
+
+    async def delete(self, *keys):
+        removed = 0
+        for key in map(_key, keys):
+            if self._alive(key):
+                del self._data[key]
+                self._expiry.pop(key, None)
+                removed += 1
+        return removed
+
+    async def pexpire(self, key, milliseconds):
+        key = _key(key)
+        if not self._alive(key):
+            return False
+        self._expiry[key] = time.monotonic() + milliseconds / 1000
+        return True
+
+    async def pttl(self, key):
+        key = _key(key)
+        if not self._alive(key):
+            return -2
+        expires = self._expiry.get(key)
+        return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+
+    # Compare-and-set helpers. Real Redis needs a Lua script (EVAL) to check
+    # a value and act on it atomically; here every call already runs
+    # without interleaving on the event loop, so they are plain methods.
+
+    async def cas_pexpire(self, key, expected, milliseconds):
+        """Sets the expiry only if the key holds expected; returns True if it did."""
+        key = _key(key)
+        if not self._alive(key) or self._data[key] != _key(expected):
+            return False
+        self._expiry[key] = time.monotonic() + milliseconds / 1000
+        return True
+
+    async def cas_delete(self, key, expected):
+        """Deletes the key only if it holds expected; returns 1 if it did."""
+        key = _key(key)
+        if not self._alive(key) or self._data[key] != _key(expected):
+            return 0
+        del self._data[key]
+        self._expiry.pop(key, None)
+        return 1
+
+    async def keys(self, pattern="*"):
+        pattern = _key(pattern).decode("utf-8")
+        return [k for k in list(self._data) if self._alive(k) and fnmatch.fnmatchcase(k.decode("utf-8"), pattern)]
+
+    async def scan_iter(self, match="*", count=None):
+        for key in await self.keys(match):
+            yield key
+
+    async def ping(self):
+        return True
+
+    async def aclose(self):
+        self._subscribers.clear()
+
+    close = aclose
+
+def _key(key):
+    return key.encode("utf-8") if isinstance(key, str) else key
@@ -16,5 +16,10 @@ class RedisClient:
             )
         return cls._instance
 
+    @classmethod
+    def use(cls, client):
+        """Overrides the shared client (e.g. with a LocalRedis stand-in)."""
+        cls._instance = client
+
 async def get_redis_client():
     return RedisClient.get_instance()
@@ -0,0 +1,283 @@
+"""
+Video sources: local devices, network streams (RTSP/HTTP/RTMP/UDP) and files
+behind one threaded reader.
+
+A background thread decodes continuously and keeps only the newest frame
+(latest-frame semantics). Consumers that fall behind skip frames instead of
+letting the decoder buffer back up, so a slow consumer never adds latency.
+
+    source = VideoSource(SourceConfig.parse("rtsp://10.0.0.5/stream1"), name="gate")
+    source.start()
+    seq = 0
+    while True:
+        got = source.read(seq)
+        if got is None:
+            continue # timeout, source reconnecting
+        seq, frame, timestamp = got
+"""
+import logging
+import os
+import platform
+import threading
+import time
+from dataclasses import dataclass
+
+import cv2
+
+from src.core import metrics
+
+logger = logging.getLogger(__name__)
+
+STREAM_SCHEMES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://", "srt://")
+
+FRAMES_DECODED = metrics.counter(
+    "video_source_frames_decoded_total", "Frames decoded by the source reader", ["source"])
+FRAMES_SKIPPED = metrics.counter(
+    "video_source_frames_skipped_total", "Decoded frames replaced before a consumer read them", ["source"])
+RECONNECTS = metrics.counter(
+    "video_source_reconnects_total", "Times the source was reopened after a failure", ["source"])
+DECODE_SECONDS = metrics.histogram(
+    "pipeline_stage_seconds", "Latency of each pipeline stage", ["camera", "stage"])
+
+@dataclass
+class SourceConfig:
+    uri: str | int
+    width: int | None = None # Requested resolution; None keeps the source default
+    height: int | None = None
+    fps: float | None = None
+    fourcc: str | None = None # e.g. MJPG for USB cameras
+    loop: bool = False # Files: restart at the end
+    realtime: bool = True # Files: pace playback at the file's frame rate
+
+    @classmethod
+    def parse(cls, spec):
+        """Accepts a SourceConfig, a dict ({"source": ..., "width": ...}), a device index or a URI/path."""
+        if isinstance(spec, cls):
+            return spec
+        if isinstance(spec, dict):
+            spec = dict(spec)
+            uri = spec.pop("source", spec.pop("uri", None))
+            return cls(uri=_coerce_uri(uri), **spec)
+        return cls(uri=_coerce_uri(spec))
+
+    @property
+    def kind(self):
+        if isinstance(self.uri, int) or str(self.uri).startswith("/dev/video"):
+            return "device"
+        if str(self.uri).lower().startswith(STREAM_SCHEMES):
+            return "stream"
+        return "file"
+
+def _coerce_uri(uri):
+    if isinstance(uri, str) and uri.isdigit():
+        return int(uri)
+    return uri
+
+def _device_backend():
+    system = platform.system()
+    if system == "Windows":
+        return cv2.CAP_DSHOW
+    if system == "Linux":
+        return cv2.CAP_V4L2
+    if system == "Darwin":
+        return cv2.CAP_AVFOUNDATION
+    return cv2.CAP_ANY
+
+class VideoSource:
+    def __init__(self, config, name=None, reconnect_delay=1.0, max_reconnect_delay=30.0):
+        self.config = SourceConfig.parse(config)
+        self.name = str(name if name is not None else self.config.uri)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.cap = None
+        self.width = None # Negotiated values, known after open()
+        self.height = None
+        self.fps = None
+        self.status = "closed" # closed, opening, running, reconnecting, ended, failed
+
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self._consumed_seq = 0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._decoded = FRAMES_DECODED.labels(self.name)
+        self._skipped = FRAMES_SKIPPED.labels(self.name)
+        self._reconnects = RECONNECTS.labels(self.name)
+        self._decode_time = DECODE_SECONDS.labels(self.name, "decode")
+
+    # Opening / negotiation
+
+    def _open_capture(self):
+        config = self.config
+        kind = config.kind
+
+        if kind == "stream":
+            # Low-latency FFmpeg demuxing; TCP avoids RTSP packet loss artifacts
+            os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp|fflags;nobuffer|flags;low_delay")
+            cap = cv2.VideoCapture(config.uri, cv2.CAP_FFMPEG, [
+                cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 10000,
+                cv2.CAP_PROP_READ_TIMEOUT_MSEC, 10000,
+            ])
+        elif kind == "device":
+            cap = cv2.VideoCapture(config.uri, _device_backend())
+        else:
+            cap = cv2.VideoCapture(config.uri)
+
+        if not cap.isOpened():
+            cap.release()
+            raise RuntimeError(f"Could not open {kind} source {config.uri}")
+
+        if kind == "device":
+            # Order matters for V4L2/DirectShow: format before size before rate
+            if config.fourcc:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*config.fourcc))
+            if config.width and config.height:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.height)
+            if config.fps:
+                cap.set(cv2.CAP_PROP_FPS, config.fps)
+        if kind != "file":
+            # Keep the driver/demuxer queue minimal; the reader thread drains it anyway
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or None
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or config.fps or 30.0
+        logger.info(f"Source {self.name}: opened {kind} {config.uri} at {self.width}x{self.height} @ {self.fps:.1f} fps")
+        return cap
+
+    def open(self):
+        """Opens the source synchronously (raises on failure) and starts the reader thread."""
+        self.status = "opening"
+        try:
+            self.cap = self._open_capture()
+        except Exception:
+            self.status = "failed"
+            raise
+        self.status = "running"
+        self._thread = threading.Thread(target=self._reader, name=f"source-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    start = open
+
+    # Reader thread
+
+    def _publish(self, frame):
+        with self._cond:
+            if self._seq > self._consumed_seq:
+                self._skipped.inc()
+            self._frame = frame
+            self._seq += 1
+            self._timestamp = time.time()
+            self._cond.notify_all()
+        self._decoded.inc()
+
+    def _reopen(self):
+        delay = self.reconnect_delay
+        while not self._stopped.is_set():
+            self.status = "reconnecting"
+            self._reconnects.inc()
+            if self.cap is not None:
+                self.cap.release()
+            try:
+                self.cap = self._open_capture()
+                self.status = "running"
+                return True
+            except Exception as e:
+                logger.warning(f"Source {self.name}: reconnect failed ({e}), retrying in {delay:.0f}s")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+        return False
+
+    def _reader(self):
+        try:
+            self._read_loop()
+        finally:
+            # Only this thread may release the capture: close() can give up
+            # waiting while a read is still blocked inside it
+            cap, self.cap = self.cap, None
+            if cap is not None:
+                cap.release()
+            with self._cond:
+                self._cond.notify_all()
+
+    def _read_loop(self):
+        kind = self.config.kind
+        pace = kind == "file" and self.config.realtime
+        next_frame_time = time.monotonic()
+
+        while not self._stopped.is_set():
+            if pace:
+                next_frame_time += 1.0 / self.fps
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    self._stopped.wait(delay)
+                else:
+                    next_frame_time = time.monotonic()
+
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if ret:
+                self._decode_time.observe(time.perf_counter() - start)
+                self._publish(frame)
+                continue
+
+            if kind == "file":
+                if self.config.loop:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                self.status = "ended"
+                break
+
+            logger.warning(f"Source {self.name}: read failed, reconnecting")
+            if not self._reopen():
+                break
+
+    # Consumer API
+
+    @property
+    def alive(self):
+        return self.status in ("opening", "running", "reconnecting")
+
+    def read(self, last_seq=0, timeout=1.0):
+        """
+        Returns (seq, frame, timestamp) for the newest frame with seq > last_seq,
+        waiting up to timeout seconds; None on timeout or when the source ended.
+        """
+        with self._cond:
+            if self._seq <= last_seq:
+                self._cond.wait_for(lambda: self._seq > last_seq or not self.alive, timeout)
+            if self._seq <= last_seq:
+                return None
+            self._consumed_seq = self._seq
+            return self._seq, self._frame, self._timestamp
+
+    def latest(self):
+        """Newest frame without waiting (seq 0 and no frame before the first decode)."""
+        with self._cond:
+            self._consumed_seq = self._seq
+            return self._seq, self._frame, self._timestamp
+
+    def close(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is None:
+            cap, self.cap = self.cap, None
+            if cap is not None:
+                cap.release()
+        elif thread is not threading.current_thread():
+            # The reader releases the capture on its way out
+            thread.join(timeout=5)
+            if thread.is_alive():
+                logger.warning(f"Source {self.name}: reader still blocked in a read, capture released when it returns")
+        if self.status != "failed":
+            self.status = "closed"
+
+    stop = close
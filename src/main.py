@@ -1,5 +1,8 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request, Response
+from src.core import metrics
 from src.core.config import get_settings
+from src.core.database import pool_metrics
 from src.api.v1.api import api_router
 
 settings = get_settings()
@@ -11,6 +14,30 @@ app = FastAPI(
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+HTTP_SECONDS = metrics.histogram(
+    "http_request_seconds", "API request latency", ["method", "route", "status"])
+
+DB_POOL = metrics.gauge("db_pool_connections", "Connection pool occupancy", ["state"])
+DB_POOL.labels("checked_out").set_function(lambda: pool_metrics.snapshot()["checked_out"])
+DB_POOL.labels("checked_in").set_function(lambda: pool_metrics.snapshot()["checked_in"])
+DB_POOL.labels("overflow").set_function(lambda: pool_metrics.snapshot()["overflow"])
+DB_POOL_CHECKOUT_P99 = metrics.gauge("db_pool_checkout_p99_seconds", "p99 connection checkout wait")
+DB_POOL_CHECKOUT_P99.set_function(lambda: pool_metrics.percentile(0.99))
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route template, not the raw path, to keep label cardinality bounded
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_SECONDS.labels(request.method, path, response.status_code).observe(time.perf_counter() - start)
+    return response
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {
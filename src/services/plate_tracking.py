@@ -0,0 +1,172 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import count
+
+def box_iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    if inter <= 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / (area_a + area_b - inter)
+
+@dataclass
+class FusedPlate:
+    text: str
+    confidence: float
+    votes: int
+
+def fuse_reads(reads: list[tuple[str, float]]) -> FusedPlate | None:
+    """
+    Fuses OCR reads of the same plate with per-character confidence voting.
+
+    Reads are first grouped by length (the length with the highest summed
+    confidence wins), then each position takes the character with the most
+    confidence mass. A position's confidence is its winning share, and the
+    plate's confidence is its weakest position scaled by the mean read
+    confidence, so a single disputed character drags the whole plate down.
+    """
+    if not reads:
+        return None
+
+    by_length = defaultdict(list)
+    for text, conf in reads:
+        if text:
+            by_length[len(text)].append((text, conf))
+    if not by_length:
+        return None
+
+    length, group = max(by_length.items(), key=lambda item: sum(c for _, c in item[1]))
+    total = sum(c for _, c in group)
+    if total <= 0:
+        return None
+
+    chars = []
+    weakest = 1.0
+    for i in range(length):
+        weights = defaultdict(float)
+        for text, conf in group:
+            weights[text[i]] += conf
+        char, weight = max(weights.items(), key=lambda item: item[1])
+        chars.append(char)
+        weakest = min(weakest, weight / total)
+
+    mean_conf = total / len(group)
+    return FusedPlate("".join(chars), weakest * mean_conf, len(group))
+
+@dataclass
+class PlateTrack:
+    track_id: int
+    camera_id: str
+    box: tuple
+    first_seen: float
+    last_seen: float
+    reads: list = field(default_factory=list)
+    fused: FusedPlate | None = None
+    resolved: bool = False
+    emitted: bool = False
+
+class PlateTracker:
+    """
+    Associates plate/vehicle boxes across frames per camera and accumulates
+    their OCR reads until the fused plate is confident enough.
+
+    Resolved tracks keep being associated (so the same passage is not picked
+    up again as a new vehicle) but callers should skip OCR on them.
+    """
+
+    def __init__(self, iou_threshold: float = 0.2, track_ttl: float = 2.0,
+                 min_reads: int = 3, resolve_confidence: float = 0.85,
+                 emit_confidence: float = 0.6, max_reads: int = 15):
+        self.iou_threshold = iou_threshold
+        self.track_ttl = track_ttl
+        self.min_reads = min_reads
+        self.resolve_confidence = resolve_confidence
+        self.emit_confidence = emit_confidence
+        self.max_reads = max_reads
+        self.tracks: dict[str, dict[int, PlateTrack]] = defaultdict(dict)
+        self.last_frame: dict[str, float] = {} # camera_id -> timestamp of its latest update
+        self._ids = count(1)
+
+    def update(self, camera_id: str, boxes, timestamp: float, track_ids=None) -> list[PlateTrack]:
+        """
+        Returns one track per input box, in order. When the detector already
+        provides tracker ids they are used directly, otherwise boxes are
+        matched greedily to live tracks by IoU.
+        """
+        camera_tracks = self.tracks[camera_id]
+        self.last_frame[camera_id] = timestamp
+        assigned = [None] * len(boxes)
+
+        if track_ids is not None:
+            for i, (box, tid) in enumerate(zip(boxes, track_ids)):
+                track = camera_tracks.get(tid)
+                if track is None:
+                    track = PlateTrack(tid, camera_id, tuple(box), timestamp, timestamp)
+                    camera_tracks[tid] = track
+                assigned[i] = track
+        else:
+            pairs = []
+            for i, box in enumerate(boxes):
+                for track in camera_tracks.values():
+                    iou = box_iou(box, track.box)
+                    if iou >= self.iou_threshold:
+                        pairs.append((iou, i, track.track_id))
+            pairs.sort(reverse=True)
+
+            used = set()
+            for _, i, tid in pairs:
+                if assigned[i] is None and tid not in used:
+                    assigned[i] = camera_tracks[tid]
+                    used.add(tid)
+
+            for i, box in enumerate(boxes):
+                if assigned[i] is None:
+                    tid = next(self._ids)
+                    track = PlateTrack(tid, camera_id, tuple(box), timestamp, timestamp)
+                    camera_tracks[tid] = track
+                    assigned[i] = track
+
+        for box, track in zip(boxes, assigned):
+            track.box = tuple(box)
+            track.last_seen = timestamp
+        return assigned
+
+    def add_read(self, track: PlateTrack, text: str, confidence: float) -> bool:
+        """Adds an OCR read; returns True when this read resolved the track."""
+        if track.resolved or not text:
+            return False
+        track.reads.append((text, confidence))
+        if len(track.reads) > self.max_reads:
+            # Keep the most confident reads only
+            track.reads.sort(key=lambda r: r[1], reverse=True)
+            del track.reads[self.max_reads:]
+
+        track.fused = fuse_reads(track.reads)
+        if (track.fused is not None and track.fused.votes >= self.min_reads
+                and track.fused.confidence >= self.resolve_confidence):
+            track.resolved = True
+            return True
+        return False
+
+    def expire(self, timestamp: float, camera_id: str | None = None) -> list[PlateTrack]:
+        """
+        Drops tracks not seen for track_ttl seconds and returns those that
+        ended without being emitted but still fused above emit_confidence.
+
+        Cameras run on their own clocks and lags, so timestamp should come
+        from camera_id; only all cameras are checked when it is None.
+        """
+        finished = []
+        cameras = self.tracks.keys() if camera_id is None else [camera_id]
+        for camera_id in cameras:
+            camera_tracks = self.tracks.get(camera_id, {})
+            stale = [tid for tid, t in camera_tracks.items() if timestamp - t.last_seen > self.track_ttl]
+            for tid in stale:
+                track = camera_tracks.pop(tid)
+                if (not track.emitted and track.fused is not None
+                        and track.fused.confidence >= self.emit_confidence):
+                    finished.append(track)
+        return finished
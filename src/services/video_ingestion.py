@@ -4,14 +4,26 @@ import base64
 import json
 import time
 import logging
+from src.core import metrics
+from src.core.config import get_settings
 from src.infrastructure.redis_client import get_redis_client
+from src.infrastructure.video_sources import VideoSource
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FRAMES_PUBLISHED = metrics.counter(
+    "ingestion_frames_published_total", "Frames published to Redis", ["camera"])
+FRAMES_SKIPPED = metrics.counter(
+    "ingestion_frames_skipped_total", "Decoded frames not published because of the fps limit", ["camera"])
+READ_FAILURES = metrics.counter(
+    "ingestion_read_failures_total", "Sources that ended or failed permanently", ["camera"])
+STAGE_SECONDS = metrics.histogram(
+    "pipeline_stage_seconds", "Latency of each pipeline stage", ["camera", "stage"])
+
 class VideoIngestionService:
-    def __init__(self, camera_id: str, source: str | int, fps_limit: int = 5):
+    def __init__(self, camera_id: str, source: str | int | dict, fps_limit: int = 5):
         self.camera_id = camera_id
         self.source = source
         self.fps_limit = fps_limit
@@ -24,56 +36,67 @@ class VideoIngestionService:
         
         logger.info(f"Starting ingestion for camera {self.camera_id} from source {self.source}")
         
-        # Open video source
-        cap = cv2.VideoCapture(self.source)
-        
-        if not cap.isOpened():
-            logger.error(f"Failed to open video source: {self.source}")
+        # Decoding and reconnects happen on the source's reader thread; this
+        # loop only samples the newest frame at fps_limit
+        video = VideoSource(self.source, name=self.camera_id)
+        try:
+            await asyncio.to_thread(video.open)
+        except Exception as e:
+            logger.error(f"Failed to open video source {self.source}: {e}")
             return
 
         frame_interval = 1.0 / self.fps_limit
-        last_frame_time = 0
+        seq = 0
+
+        published = FRAMES_PUBLISHED.labels(self.camera_id)
+        skipped = FRAMES_SKIPPED.labels(self.camera_id)
+        failures = READ_FAILURES.labels(self.camera_id)
+        t_encode = STAGE_SECONDS.labels(self.camera_id, "ingest_encode")
+        t_publish = STAGE_SECONDS.labels(self.camera_id, "ingest_publish")
 
         try:
+            next_frame_time = time.monotonic()
             while self.running:
-                current_time = time.time()
-                ret, frame = cap.read()
-
-                if not ret:
-                    logger.warning(f"Failed to read frame from {self.source}. Retrying...")
-                    await asyncio.sleep(1)
-                    # Reconnect logic could go here
-                    cap.release()
-                    cap = cv2.VideoCapture(self.source)
-                    continue
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_frame_time = max(next_frame_time + frame_interval, time.monotonic())
 
-                # Rate limiting
-                if current_time - last_frame_time < frame_interval:
-                    await asyncio.sleep(0.01)
+                latest_seq, frame, timestamp = video.latest()
+                if latest_seq == seq:
+                    if not video.alive:
+                        failures.inc()
+                        logger.warning(f"Video source {self.source} ended ({video.status})")
+                        break
                     continue
-
-                last_frame_time = current_time
+                if seq:
+                    skipped.inc(latest_seq - seq - 1)
+                seq = latest_seq
 
                 # Encode frame to JPEG
-                _, buffer = cv2.imencode('.jpg', frame)
-                jpg_as_text = base64.b64encode(buffer).decode('utf-8')
+                with t_encode.time():
+                    _, buffer = cv2.imencode('.jpg', frame)
+                    jpg_as_text = base64.b64encode(buffer).decode('utf-8')
 
                 # Create message payload
                 payload = {
                     "camera_id": self.camera_id,
-                    "timestamp": current_time,
+                    "timestamp": timestamp,
                     "frame": jpg_as_text
                 }
 
                 # Publish to Redis channel 'video_frames'
+                publish_start = time.perf_counter()
                 await self.redis.publish("video_frames", json.dumps(payload))
+                t_publish.observe(time.perf_counter() - publish_start)
+                published.inc()
                 
                 # logger.debug(f"Published frame from {self.camera_id}")
 
         except Exception as e:
             logger.error(f"Error in video ingestion: {e}")
         finally:
-            cap.release()
+            await asyncio.to_thread(video.close)
             logger.info(f"Stopped ingestion for camera {self.camera_id}")
 
     def stop(self):
@@ -82,6 +105,9 @@ class VideoIngestionService:
 # Example usage (can be run directly for testing)
 if __name__ == "__main__":
     async def main():
+        settings = get_settings()
+        if settings.WORKER_METRICS_PORT:
+            metrics.start_metrics_server(settings.WORKER_METRICS_PORT)
         # Use 0 for webcam or RTSP URL
         service = VideoIngestionService(camera_id="cam_01", source=0)
         try:
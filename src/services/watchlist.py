@@ -0,0 +1,223 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.domain import models
+
+logger = logging.getLogger(__name__)
+
+# Characters OCR routinely swaps on plates. Every member of a group is
+# folded onto the group's first character, so "ABC1D23", "A8CID23" and
+# "ABCIO23"-style misreads all land on the same canonical key.
+CONFUSION_GROUPS = ("0ODQ", "1IL", "8B", "5S", "2Z", "6G")
+
+_CANONICAL_TABLE = str.maketrans({
+    char: group[0] for group in CONFUSION_GROUPS for char in group[1:]
+})
+
+def normalize_plate(text: str) -> str:
+    return "".join(c for c in text.upper() if c.isalnum())
+
+def canonical_plate(text: str) -> str:
+    return normalize_plate(text).translate(_CANONICAL_TABLE)
+
+def _deletions(text: str) -> list[str]:
+    return [text[:i] + text[i + 1:] for i in range(len(text))]
+
+def _within_one_edit(a: str, b: str) -> bool:
+    # Levenshtein distance <= 1 without building the full matrix
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        return sum(x != y for x, y in zip(a, b)) <= 1
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+@dataclass(frozen=True)
+class WatchlistHit:
+    plate_read: str
+    plate_number: str
+    label: str | None
+    distance: int
+
+class PlateIndex:
+    """
+    In-memory watchlist index.
+
+    Plates are stored under their confusion-folded canonical form (exact hash
+    lookup) and under every single-character deletion of it (symmetric
+    deletion index), so a read that is one insertion, deletion or substitution
+    away from a listed plate is found with a handful of dict probes instead of
+    a scan. Lookups cost a few microseconds regardless of watchlist size.
+    """
+
+    def __init__(self, fuzzy: bool = True):
+        self.fuzzy = fuzzy
+        self._labels: dict[str, str | None] = {}          # plate -> label
+        self._by_canonical: dict[str, set[str]] = {}      # canonical -> plates
+        self._neighbours: dict[str, set[str]] = {}        # deletion key -> canonicals
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, plate: str):
+        return normalize_plate(plate) in self._labels
+
+    def add(self, plate: str, label: str | None = None) -> bool:
+        """Adds or relabels a plate; returns True if the index changed."""
+        plate = normalize_plate(plate)
+        if not plate:
+            return False
+        if plate in self._labels and self._labels[plate] == label:
+            return False
+        self._labels[plate] = label
+
+        canonical = plate.translate(_CANONICAL_TABLE)
+        plates = self._by_canonical.setdefault(canonical, set())
+        if not plates and self.fuzzy:
+            for key in _deletions(canonical):
+                self._neighbours.setdefault(key, set()).add(canonical)
+        plates.add(plate)
+        return True
+
+    def remove(self, plate: str) -> bool:
+        """Removes a plate; returns True if it was listed."""
+        plate = normalize_plate(plate)
+        if plate not in self._labels:
+            return False
+        del self._labels[plate]
+
+        canonical = plate.translate(_CANONICAL_TABLE)
+        plates = self._by_canonical.get(canonical)
+        if plates is None:
+            return True
+        plates.discard(plate)
+        if plates:
+            return True
+
+        del self._by_canonical[canonical]
+        if self.fuzzy:
+            for key in _deletions(canonical):
+                keyed = self._neighbours.get(key)
+                if keyed is not None:
+                    keyed.discard(canonical)
+                    if not keyed:
+                        del self._neighbours[key]
+        return True
+
+    def clear(self):
+        self._labels.clear()
+        self._by_canonical.clear()
+        self._neighbours.clear()
+
+    def _hit(self, read: str, canonical: str, distance: int):
+        # Prefer the listed plate that literally equals the read, then any
+        # plate sharing the canonical form (sorted for determinism)
+        plates = self._by_canonical[canonical]
+        plate = read if read in plates else min(plates)
+        return WatchlistHit(read, plate, self._labels.get(plate), distance)
+
+    def match(self, text: str) -> WatchlistHit | None:
+        read = normalize_plate(text)
+        if not read:
+            return None
+        canonical = read.translate(_CANONICAL_TABLE)
+
+        if canonical in self._by_canonical:
+            return self._hit(read, canonical, 0)
+        if not self.fuzzy:
+            return None
+
+        # Read has one extra character: one of its deletions is a listed plate
+        # Read has one missing character: it is a deletion of a listed plate
+        # Read has one wrong character: both share a deletion key
+        best = None
+        for key in [canonical] + _deletions(canonical):
+            if key in self._by_canonical:
+                best = key if best is None else min(best, key)
+            for candidate in self._neighbours.get(key, ()):
+                if _within_one_edit(canonical, candidate):
+                    best = candidate if best is None else min(best, candidate)
+        if best is None:
+            return None
+        return self._hit(read, best, 1)
+
+class WatchlistMatcher:
+    """
+    Keeps a PlateIndex in sync with the watchlist table. The first refresh
+    loads every active entry; later refreshes only pull rows whose
+    updated_at moved since the previous sync.
+
+    updated_at is set by func.now(), the start of the writing transaction,
+    so a long transaction can commit a row stamped before the last sync.
+    Incremental refreshes look back sync_margin past the last sync to pick
+    those up, and every full_reload_seconds the index is rebuilt from
+    scratch as a backstop.
+    """
+
+    def __init__(self, fuzzy: bool = True, sync_margin: float = 300.0, full_reload_seconds: float = 3600.0):
+        self.fuzzy = fuzzy
+        self.sync_margin = timedelta(seconds=sync_margin)
+        self.full_reload_seconds = full_reload_seconds
+        self.index = PlateIndex(fuzzy=fuzzy)
+        self.last_sync: datetime | None = None
+        self._loaded_at = 0.0 # monotonic time of the last full load
+
+    def match(self, text: str) -> WatchlistHit | None:
+        return self.index.match(text)
+
+    async def refresh(self, db: AsyncSession) -> int:
+        if self.last_sync is None or time.monotonic() - self._loaded_at >= self.full_reload_seconds:
+            return await self.reload(db)
+
+        # Re-applying an entry is idempotent, so the overlap is harmless
+        query = (
+            select(models.WatchlistEntry)
+            .where(models.WatchlistEntry.updated_at >= self.last_sync - self.sync_margin)
+            .order_by(models.WatchlistEntry.updated_at)
+        )
+        result = await db.execute(query)
+        entries = result.scalars().all()
+
+        changed = 0
+        for entry in entries:
+            if entry.active:
+                changed += self.index.add(entry.plate_number, entry.label)
+            else:
+                changed += self.index.remove(entry.plate_number)
+            if entry.updated_at > self.last_sync:
+                self.last_sync = entry.updated_at
+
+        if changed:
+            logger.info(f"Watchlist refreshed: {changed} changes, {len(self.index)} plates indexed")
+        return changed
+
+    async def reload(self, db: AsyncSession) -> int:
+        """Rebuilds the index from every active entry; returns the number of plates."""
+        query = (
+            select(models.WatchlistEntry)
+            .where(models.WatchlistEntry.active.is_(True))
+            .order_by(models.WatchlistEntry.updated_at)
+        )
+        result = await db.execute(query)
+        entries = result.scalars().all()
+
+        # Built aside and swapped in, so matches never see a half-loaded index
+        index = PlateIndex(fuzzy=self.fuzzy)
+        last_sync = self.last_sync
+        for entry in entries:
+            index.add(entry.plate_number, entry.label)
+            if last_sync is None or entry.updated_at > last_sync:
+                last_sync = entry.updated_at
+        self.index = index
+        self.last_sync = last_sync
+        self._loaded_at = time.monotonic()
+
+        logger.info(f"Watchlist loaded: {len(self.index)} plates indexed")
+        return len(self.index)
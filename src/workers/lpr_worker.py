@@ -5,14 +5,48 @@ import cv2
 import numpy as np
 import re
 import logging
-from ultralytics import YOLO
+import time
 from paddleocr import PaddleOCR
+from src.core import metrics
+from src.core.config import get_settings
+from src.core.database import SessionLocal
+from src.infrastructure.detectors import DetectorConfig, create_detector
 from src.infrastructure.redis_client import get_redis_client
+from src.domain import models
+from src.services.plate_tracking import PlateTracker
+from src.services.watchlist import WatchlistMatcher
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+settings = get_settings()
+
+FRAMES = metrics.counter("lpr_frames_total", "Frames consumed by the LPR worker", ["camera"])
+OCR_CALLS = metrics.counter("lpr_ocr_calls_total", "OCR runs on candidate crops", ["camera"])
+OCR_SKIPPED = metrics.counter("lpr_ocr_skipped_total", "OCR skipped because the track was resolved", ["camera"])
+EVENTS = metrics.counter("lpr_events_total", "Fused plate events emitted", ["camera"])
+WATCHLIST_HITS = metrics.counter("lpr_watchlist_hits_total", "Watchlist matches", ["camera"])
+FRAME_LAG = metrics.gauge("lpr_frame_lag_seconds", "Age of the last frame when the worker picked it up", ["camera"])
+STAGE_SECONDS = metrics.histogram(
+    "pipeline_stage_seconds", "Latency of each pipeline stage", ["camera", "stage"])
+
+class _CameraMetrics:
+    __slots__ = ("frames", "ocr_calls", "ocr_skipped", "events", "watchlist_hits", "lag",
+                 "decode", "detect", "ocr", "store")
+
+    def __init__(self, camera_id):
+        self.frames = FRAMES.labels(camera_id)
+        self.ocr_calls = OCR_CALLS.labels(camera_id)
+        self.ocr_skipped = OCR_SKIPPED.labels(camera_id)
+        self.events = EVENTS.labels(camera_id)
+        self.watchlist_hits = WATCHLIST_HITS.labels(camera_id)
+        self.lag = FRAME_LAG.labels(camera_id)
+        self.decode = STAGE_SECONDS.labels(camera_id, "lpr_decode")
+        self.detect = STAGE_SECONDS.labels(camera_id, "lpr_detect")
+        self.ocr = STAGE_SECONDS.labels(camera_id, "lpr_ocr")
+        self.store = STAGE_SECONDS.labels(camera_id, "lpr_store")
+
 class LPRWorker:
     def __init__(self):
         self.redis = None
@@ -20,8 +54,8 @@ class LPRWorker:
         
         # Initialize Models
         # Note: In production, use a model fine-tuned for license plates
-        logger.info("Loading YOLOv8 model...")
-        self.detector = YOLO("yolov8n.pt") 
+        # Backend/weights/threads come from LPR_DETECTOR_* env vars
+        self.detector = create_detector(DetectorConfig.from_env("LPR_DETECTOR_"))
         
         logger.info("Loading PaddleOCR...")
         self.ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
@@ -31,11 +65,34 @@ class LPRWorker:
         # Old: ABC1234
         self.plate_pattern = re.compile(r'^[A-Z]{3}[0-9][A-Z0-9][0-9]{2}$')
 
+        self.watchlist = WatchlistMatcher(
+            fuzzy=settings.WATCHLIST_FUZZY_MATCH,
+            sync_margin=settings.WATCHLIST_SYNC_MARGIN_SECONDS,
+            full_reload_seconds=settings.WATCHLIST_FULL_RELOAD_SECONDS,
+        )
+        self.watchlist_task = None
+        self.expiry_task = None
+
+        # Fuses reads of the same vehicle across frames
+        self.plate_tracker = PlateTracker()
+
+        self.camera_metrics = {}
+
+    def metrics_for(self, camera_id):
+        m = self.camera_metrics.get(camera_id)
+        if m is None:
+            m = self.camera_metrics[camera_id] = _CameraMetrics(camera_id)
+        return m
+
     async def start(self):
         self.redis = await get_redis_client()
         pubsub = self.redis.pubsub()
         await pubsub.subscribe("video_frames")
         self.running = True
+
+        await self.refresh_watchlist()
+        self.watchlist_task = asyncio.create_task(self.watchlist_refresh_loop())
+        self.expiry_task = asyncio.create_task(self.plate_expiry_loop())
         
         logger.info("LPR Worker started. Waiting for frames...")
 
@@ -48,6 +105,58 @@ class LPRWorker:
                     await self.process_frame(message['data'])
         except Exception as e:
             logger.error(f"Error in LPR Worker: {e}")
+        finally:
+            if self.watchlist_task:
+                self.watchlist_task.cancel()
+            if self.expiry_task:
+                self.expiry_task.cancel()
+
+    async def refresh_watchlist(self):
+        try:
+            async with SessionLocal() as db:
+                await self.watchlist.refresh(db)
+        except Exception as e:
+            # Keep matching against the last good index
+            logger.error(f"Watchlist refresh failed: {e}")
+
+    async def watchlist_refresh_loop(self):
+        while self.running:
+            await asyncio.sleep(settings.WATCHLIST_REFRESH_SECONDS)
+            await self.refresh_watchlist()
+
+    async def plate_expiry_loop(self):
+        # Frames drive expiry per camera; this only finishes passages on
+        # cameras that stopped sending frames altogether
+        ttl = self.plate_tracker.track_ttl
+        while self.running:
+            await asyncio.sleep(ttl)
+            now = time.time()
+            for camera_id, last_frame in list(self.plate_tracker.last_frame.items()):
+                if now - last_frame > ttl:
+                    for track in self.plate_tracker.expire(now, camera_id):
+                        await self.emit_plate(track, now)
+
+    async def check_watchlist(self, text, camera_id, timestamp, confidence):
+        hit = self.watchlist.match(text)
+        if hit is None:
+            return None
+
+        logger.warning(
+            f"WATCHLIST HIT: read {hit.plate_read} matches {hit.plate_number} "
+            f"({hit.label or 'no label'}, distance {hit.distance}) on {camera_id}"
+        )
+        alert = {
+            "camera_id": camera_id,
+            "timestamp": timestamp,
+            "plate_read": hit.plate_read,
+            "plate_number": hit.plate_number,
+            "label": hit.label,
+            "distance": hit.distance,
+            "confidence": confidence,
+        }
+        await self.redis.publish("watchlist_alerts", json.dumps(alert))
+        self.metrics_for(camera_id).watchlist_hits.inc()
+        return hit
 
     async def process_frame(self, message_data):
         try:
@@ -56,52 +165,97 @@ class LPRWorker:
             timestamp = data['timestamp']
             jpg_as_text = data['frame']
 
+            m = self.metrics_for(camera_id)
+            m.frames.inc()
+            m.lag.set(time.time() - timestamp)
+
             # Decode image
-            jpg_original = base64.b64decode(jpg_as_text)
-            jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
-            frame = cv2.imdecode(jpg_as_np, flags=1)
+            with m.decode.time():
+                jpg_original = base64.b64decode(jpg_as_text)
+                jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
+                frame = cv2.imdecode(jpg_as_np, flags=1)
 
             # 1. Detect Objects (Looking for cars/plates)
             # For this demo using yolov8n, we might detect 'car' (class 2)
             # In a real scenario, we'd detect 'license_plate' directly
-            results = self.detector(frame, verbose=False)
-            
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    # Check if it's a car (class 2 in COCO) or plate if custom model
-                    # For now, let's assume we crop anything that looks like a vehicle 
-                    # and try to find text, or ideally we have a plate detector.
-                    # Simplified: Just run OCR on the whole frame or large crops? 
-                    # No, that's slow. 
-                    # Let's assume we are detecting 'car' and then running OCR on the car crop 
-                    # (not ideal) or we assume the model detects plates.
-                    
-                    # Placeholder logic: If confidence > 0.5
-                    if box.conf[0] > 0.5:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        
-                        # Crop
-                        roi = frame[y1:y2, x1:x2]
-                        if roi.size == 0:
-                            continue
-
-                        # 2. OCR
-                        ocr_result = self.ocr.ocr(roi, cls=True)
-                        
-                        if ocr_result and ocr_result[0]:
-                            for line in ocr_result[0]:
-                                text = line[1][0].upper().replace("-", "").replace(" ", "")
-                                confidence = line[1][1]
-                                
-                                # 3. Validate
-                                if self.validate_plate(text):
-                                    logger.info(f"MATCH FOUND: {text} on {camera_id} (Conf: {confidence:.2f})")
-                                    # TODO: Publish event to DB/API
-                                    
+            # Rows of [x1, y1, x2, y2, conf, cls]
+            with m.detect.time():
+                detections = self.detector.detect(frame)
+
+            # Placeholder logic: any box with confidence > 0.5 is a candidate
+            boxes = detections[detections[:, 4] > 0.5, :4].astype(int).tolist()
+
+            # 2. Associate boxes with plate tracks across frames
+            tracks = self.plate_tracker.update(camera_id, boxes, timestamp)
+            resolved = []
+
+            for (x1, y1, x2, y2), track in zip(boxes, tracks):
+                # Fused read is already confident: no more OCR for this passage
+                if track.resolved:
+                    m.ocr_skipped.inc()
+                    continue
+
+                roi = frame[y1:y2, x1:x2]
+                if roi.size == 0:
+                    continue
+
+                # 3. OCR and vote into the track
+                m.ocr_calls.inc()
+                with m.ocr.time():
+                    read = self.best_plate_read(self.ocr.ocr(roi, cls=True))
+                if read and self.plate_tracker.add_read(track, *read):
+                    resolved.append(track)
+
+            # 4. One event per passage: when resolved, or when the vehicle
+            # leaves the scene with a fused read that is still usable
+            for track in resolved + self.plate_tracker.expire(timestamp, camera_id):
+                await self.emit_plate(track, timestamp)
+
         except Exception as e:
             logger.error(f"Frame processing error: {e}")
 
+    def best_plate_read(self, ocr_result):
+        """Picks the OCR line most likely to be the plate: valid plates first, then confidence."""
+        if not ocr_result or not ocr_result[0]:
+            return None
+        best = None
+        for line in ocr_result[0]:
+            text = ''.join(e for e in line[1][0].upper() if e.isalnum())
+            confidence = line[1][1]
+            if not 6 <= len(text) <= 8:
+                continue
+            key = (self.validate_plate(text), confidence)
+            if best is None or key > best[0]:
+                best = (key, text, confidence)
+        return (best[1], best[2]) if best else None
+
+    async def emit_plate(self, track, timestamp):
+        track.emitted = True
+        fused = track.fused
+        hit = await self.check_watchlist(fused.text, track.camera_id, timestamp, fused.confidence)
+        if not self.validate_plate(fused.text) and hit is None:
+            return
+
+        logger.info(
+            f"MATCH FOUND: {fused.text} on {track.camera_id} "
+            f"(Conf: {fused.confidence:.2f}, {fused.votes} reads)"
+        )
+        m = self.metrics_for(track.camera_id)
+        m.events.inc()
+        try:
+            store_start = time.perf_counter()
+            async with SessionLocal() as db:
+                db.add(models.Event(
+                    camera_id=track.camera_id,
+                    event_type="lpr",
+                    plate_number=fused.text,
+                    confidence=fused.confidence,
+                ))
+                await db.commit()
+            m.store.observe(time.perf_counter() - store_start)
+        except Exception as e:
+            logger.error(f"Failed to store LPR event: {e}")
+
     def validate_plate(self, text):
         # Basic cleanup
         clean_text = ''.join(e for e in text if e.isalnum())
@@ -111,6 +265,8 @@ class LPRWorker:
         self.running = False
 
 if __name__ == "__main__":
+    if settings.WORKER_METRICS_PORT:
+        metrics.start_metrics_server(settings.WORKER_METRICS_PORT)
     worker = LPRWorker()
     try:
         asyncio.run(worker.start())
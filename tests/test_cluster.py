@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+
+pytest.importorskip("fastapi")
+
+from app.cluster import ClusterConfig, ClusterCoordinator, rendezvous_owner
+from src.infrastructure.local_redis import LocalRedis
+
+CAMERAS = [str(i) for i in range(8)]
+LEASE_TTL = 0.5
+HEARTBEAT = 0.1
+
+class FlakyRedis(LocalRedis):
+    """LocalRedis whose writes fail ("down") or never answer ("hang"), like a partitioned server."""
+
+    def __init__(self):
+        super().__init__()
+        self.mode = None
+
+    async def _fail(self):
+        if self.mode == "down":
+            raise ConnectionError("Redis unreachable")
+        if self.mode == "hang":
+            await asyncio.sleep(3600)
+
+    async def set(self, *args, **kwargs):
+        await self._fail()
+        return await super().set(*args, **kwargs)
+
+    async def cas_pexpire(self, *args):
+        await self._fail()
+        return await super().cas_pexpire(*args)
+
+class Cluster:
+    """Nodes sharing one LocalRedis; running maps camera_id -> node_id and catches double ownership."""
+
+    def __init__(self, redis=None):
+        self.redis = redis if redis is not None else LocalRedis()
+        self.running = {}
+        self.resumed = {} # camera_id -> state passed to on_acquire
+        self.fenced = {} # camera_id -> lease ms left in Redis when the camera was stopped
+
+    def node(self, node_id):
+        async def acquire(camera_id, state):
+            assert camera_id not in self.running, f"{camera_id} already runs on {self.running[camera_id]}"
+            self.running[camera_id] = node_id
+            self.resumed[camera_id] = state
+
+        async def release(camera_id):
+            assert self.running.pop(camera_id) == node_id
+            self.fenced[camera_id] = await LocalRedis.pttl(self.redis, f"epai:lease:{camera_id}")
+            return {"by": node_id, "final": True}
+
+        async def snapshot(camera_id):
+            return {"by": node_id}
+
+        config = ClusterConfig(redis_url="local", node_id=node_id, node_url=f"http://{node_id}",
+                               lease_ttl=LEASE_TTL, heartbeat=HEARTBEAT)
+        return ClusterCoordinator(self.redis, config, CAMERAS, acquire, release, snapshot)
+
+async def tick(*nodes):
+    for node in nodes:
+        await node.tick()
+        await asyncio.gather(*node._starting.values())
+
+def test_single_node_acquires_every_camera():
+    async def run():
+        cluster = Cluster()
+        a = cluster.node("A")
+        await tick(a)
+        assert sorted(a.owned) == sorted(CAMERAS)
+        assert cluster.running == {c: "A" for c in CAMERAS}
+        assert await cluster.redis.get("epai:lease:0") == a.token.encode()
+    asyncio.run(run())
+
+def test_cameras_handed_over_when_node_joins():
+    async def run():
+        cluster = Cluster()
+        a, b = cluster.node("A"), cluster.node("B")
+        await tick(a)
+        await tick(b) # Registers B; A still holds every lease
+        assert not b.owned
+
+        await tick(a, b)
+        moved = [c for c in CAMERAS if rendezvous_owner(c, ["A", "B"]) == "B"]
+        assert moved and len(moved) < len(CAMERAS)
+        assert sorted(b.owned) == sorted(moved)
+        assert sorted(a.owned) == sorted(set(CAMERAS) - set(moved))
+        # B resumes from the state A saved when letting go
+        assert all(cluster.resumed[c] == {"by": "A", "final": True} for c in moved)
+    asyncio.run(run())
+
+def test_takeover_after_lease_expires():
+    async def run():
+        cluster = Cluster()
+        a, b = cluster.node("A"), cluster.node("B")
+        await tick(a, b, a, b)
+        crashed = sorted(a.owned)
+        for camera_id in crashed: # A dies without releasing anything
+            del cluster.running[camera_id]
+
+        await tick(b)
+        assert sorted(b.owned) != sorted(CAMERAS) # Leases still held
+
+        await asyncio.sleep(LEASE_TTL + 0.1)
+        await tick(b)
+        assert sorted(b.owned) == sorted(CAMERAS)
+        assert all(cluster.resumed[c] == {"by": "A"} for c in crashed)
+    asyncio.run(run())
+
+@pytest.mark.parametrize("mode", ["down", "hang"])
+def test_node_fences_itself_before_lease_expires(mode):
+    async def run():
+        cluster = Cluster(FlakyRedis())
+        a = cluster.node("A")
+        await tick(a)
+        assert len(cluster.running) == len(CAMERAS)
+
+        cluster.redis.mode = mode
+        for _ in range(int(LEASE_TTL / HEARTBEAT) + 2):
+            await a._tick_or_fence()
+            await asyncio.sleep(HEARTBEAT)
+        assert not a.owned
+        assert not cluster.running
+        # Stopped while Redis still held the lease: no other node could have run them yet
+        assert all(left > 0 for left in cluster.fenced.values())
+    asyncio.run(run())
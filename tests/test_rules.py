@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from app.detections import DETECTION_DTYPE, centers
+from app.dwell import DwellTracker
+from app.rules import CameraPlan
+
+SCALE = (3840 / 640, 2160 / 640)
+
+def frame(*tracks):
+    """Detections for (track_id, x, y) centers given in 4K coordinates."""
+    detections = np.zeros(len(tracks), dtype=DETECTION_DTYPE)
+    for row, (track_id, x, y) in zip(detections, tracks):
+        cx, cy = x / SCALE[0], y / SCALE[1]
+        row["box"] = (cx - 5, cy - 5, cx + 5, cy + 5)
+        row["id"] = track_id
+        row["cls"] = 2
+        row["conf"] = 0.9
+    return detections
+
+def evaluate(plan, dwell, detections, now):
+    return plan.evaluate(detections, centers(detections, SCALE), dwell, now=now)
+
+@pytest.mark.parametrize("start, end", [(1790, 1810), (1750, 1850), (1700, 1900), (1600, 2000), (100, 3700)])
+def test_line_crossing_detected_for_any_jump(start, end):
+    plan = CameraPlan.compile({"gate": {"points": [[1800, 0], [1800, 2160]], "type": "line"}})
+    dwell = DwellTracker("test-line")
+    assert evaluate(plan, dwell, frame((1, start, 1000)), now=0.0).hits == []
+    hits = evaluate(plan, dwell, frame((1, end, 1000)), now=0.1).hits
+    assert [(hit.rule, hit.track_ids) for hit in hits] == [("gate", [1])]
+
+def test_line_not_crossed_by_parallel_motion():
+    plan = CameraPlan.compile({"gate": {"points": [[1800, 0], [1800, 1000]], "type": "line"}})
+    dwell = DwellTracker("test-line-miss")
+    evaluate(plan, dwell, frame((1, 1600, 1500)), now=0.0)
+    assert evaluate(plan, dwell, frame((1, 2000, 1500)), now=0.1).hits == []
+
+def test_dwell_resets_when_track_leaves_zone_bbox():
+    zone = {"points": [[0, 0], [400, 0], [400, 400], [0, 400]], "type": "dwell", "threshold": 5}
+    plan = CameraPlan.compile({"bay": zone})
+    dwell = DwellTracker("test-dwell", track_ttl=2.0)
+
+    evaluate(plan, dwell, frame((1, 200, 200)), now=0.0)
+    evaluate(plan, dwell, frame((1, 200, 200)), now=4.0)
+    # Far outside the zone's grid cells, but back well within track_ttl
+    evaluate(plan, dwell, frame((1, 3000, 2000)), now=4.5)
+    assert len(dwell) == 0
+
+    detections = frame((1, 200, 200))
+    assert evaluate(plan, dwell, detections, now=5.0).hits == []
+    assert detections["duration"][0] == 0.0
+
+def test_dwell_keeps_time_while_inside():
+    zone = {"points": [[0, 0], [400, 0], [400, 400], [0, 400]], "type": "dwell", "threshold": 5}
+    plan = CameraPlan.compile({"bay": zone})
+    dwell = DwellTracker("test-dwell-inside")
+    for now in (0.0, 1.0, 3.0, 5.0):
+        evaluate(plan, dwell, frame((1, 200, 200), (2, 3000, 2000)), now=now)
+    detections = frame((1, 200, 200))
+    hits = evaluate(plan, dwell, detections, now=6.0).hits
+    assert [(hit.rule, hit.track_ids) for hit in hits] == [("bay", [1])]
+    assert detections["duration"][0] == pytest.approx(6.0)